@@ -1,11 +1,107 @@
+import atexit
+import base64
+import functools
+import hashlib
+import json
 import os
 import sqlite3
-from flask import Flask, render_template, jsonify, request, redirect, url_for, g
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, render_template, jsonify, request, redirect, url_for, g, stream_with_context
+
+from batch_resolver import BatchResolver
+from batch_scanner import find_batch_number
+from bulk_import import (bulk_insert_batches, is_valid_batch_number, iter_lines,
+                         parse_csv, parse_ndjson, validate_rows)
+from changefeed import (ENTITIES, MAX_PAGE_SIZE as CHANGES_MAX_PAGE_SIZE, PAGE_SIZE as CHANGES_PAGE_SIZE,
+                        ChangesExpired, changes_page, check_since, record_batch_numbers, record_changes)
+from catalog_search import infix_condition, like_escape, prefix_upper_bound, search_catalog
+from caches import LookupCache, NearDuplicateCache, VersionedResponseCache
+from db_pool import create_pool
+from events import EventBroker
+from http_client import HostUnavailable, OutboundClient
+from migrations import migrate
+from product_codes import allocate_code
+from stock_ledger import SOURCE_MAX_LENGTH, movement_history, record_movement, record_movements
+from write_behind import WRITE_BEHIND, IncrementBuffer
+import recognition
+import responses
+from url_extraction import MAX_BYTES as URL_FETCH_MAX_BYTES
+from url_extraction import UpstreamHTTPError, fetch_batch_from_url
 
 app = Flask(__name__)
+responses.init_app(app)  # orjson for jsonify(), Accept-Encoding negotiated compression
 
 # Database configuration
 DATABASE_URL = os.environ.get('DATABASE_URL')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'products.db')
+
+# /api/products paging limits
+PRODUCTS_PAGE_SIZE = int(os.environ.get('PRODUCTS_PAGE_SIZE', 200))
+PRODUCTS_MAX_PAGE_SIZE = int(os.environ.get('PRODUCTS_MAX_PAGE_SIZE', 1000))
+
+# Serialized /api/products bodies, valid for one catalog version
+products_response_cache = VersionedResponseCache(int(os.environ.get('PRODUCTS_CACHE_SIZE', 64)))
+
+# get_product_by_batch results, including "not registered" answers. Other worker
+# processes cannot invalidate this one, so the TTLs bound cross-worker staleness.
+batch_lookup_cache = LookupCache(
+    max_entries=int(os.environ.get('BATCH_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('BATCH_CACHE_TTL', 10)),
+    negative_ttl=float(os.environ.get('BATCH_CACHE_NEGATIVE_TTL', 5)),
+)
+
+# POST /api/extract_batch_from_urls limits
+URL_BATCH_WORKERS = int(os.environ.get('URL_BATCH_WORKERS', 8))
+URL_BATCH_MAX_URLS = int(os.environ.get('URL_BATCH_MAX_URLS', 500))
+
+# Batch numbers per IN (...) list in multi-batch lookups
+LOOKUP_CHUNK_SIZE = int(os.environ.get('LOOKUP_CHUNK_SIZE', 500))
+SEARCH_MAX_BATCHES = int(os.environ.get('SEARCH_MAX_BATCHES', 100000))
+
+# GET /api/search result limits
+CATALOG_SEARCH_LIMIT = int(os.environ.get('CATALOG_SEARCH_LIMIT', 20))
+CATALOG_SEARCH_MAX_LIMIT = int(os.environ.get('CATALOG_SEARCH_MAX_LIMIT', 200))
+
+# Recognized text of recent camera frames, matched by perceptual hash
+frame_cache = NearDuplicateCache(recognition.FRAME_CACHE_SIZE, recognition.FRAME_CACHE_MAX_DISTANCE,
+                                 ttl=recognition.FRAME_CACHE_TTL)
+
+# OCR-tolerant batch resolver: built from the database on first use, kept in
+# step by this process's writes and rebuilt in the background when other
+# processes have changed the catalog
+BATCH_RESOLVER_RESYNC_INTERVAL = float(os.environ.get('BATCH_RESOLVER_RESYNC_INTERVAL', 60))
+BATCH_RESOLVE_MAX_CANDIDATES = int(os.environ.get('BATCH_RESOLVE_MAX_CANDIDATES', 1000))
+_resolver = None
+_resolver_lock = threading.Lock()
+_resolver_state = {'version': None, 'built_at': 0.0, 'pending': None}
+
+# Optional write-behind coalescing of stock-in scans (STOCK_WRITE_BEHIND=1)
+STOCK_WRITE_BEHIND = WRITE_BEHIND
+_stock_buffer = None
+_stock_flush_pool = None
+_stock_buffer_lock = threading.Lock()
+
+# Change events for /api/events subscribers; created by the first subscriber,
+# so writes publish nothing until someone is listening
+_event_broker = None
+_event_broker_lock = threading.Lock()
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+# Ordinary requests handled at once per process. gunicorn gives each worker a
+# thread per allowed /api/events stream on top of GUNICORN_THREADS; streams hold
+# no database connection, so only the other requests are limited, and keeping
+# this at or below DB_POOL_SIZE means they never queue on the pool
+REQUEST_CONCURRENCY = int(os.environ.get('REQUEST_CONCURRENCY', os.environ.get('GUNICORN_THREADS', 4)))
+REQUEST_QUEUE_TIMEOUT = float(os.environ.get('REQUEST_QUEUE_TIMEOUT', 30))
+_request_slots = threading.BoundedSemaphore(max(REQUEST_CONCURRENCY, 1))
+
+# Shared outbound HTTP client for URL lookups (created on first use)
+_http_client = None
+_http_client_lock = threading.Lock()
 
 def get_db_engine():
     """Determine which database engine to use"""
@@ -19,20 +115,60 @@ def get_db_connection_string():
     if DATABASE_URL:
         return DATABASE_URL
     else:
-        return 'products.db'
+        return SQLITE_PATH
+
+def get_db_pool():
+    """Get the process-wide connection pool, creating it on first use"""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = create_pool(get_db_engine(), get_db_connection_string())
+    return _db_pool
+
+def reset_db_pool():
+    """Close pooled connections so the next get_db() builds a fresh pool"""
+    global _db_pool
+    close_stock_buffer()  # its last flush still needs the old pool
+    reset_event_broker()
+    with _db_pool_lock:
+        pool, _db_pool = _db_pool, None
+    if pool is not None:
+        pool.dispose()
+    # Cached results belong to the database the old pool pointed at
+    products_response_cache.clear()
+    batch_lookup_cache.clear()
+    reset_batch_resolver()
+
+def get_http_client():
+    """Get the process-wide outbound HTTP client, creating it on first use"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = OutboundClient()
+    return _http_client
+
+def reset_http_client():
+    """Drop pooled outbound connections and breaker state"""
+    global _http_client
+    with _http_client_lock:
+        client, _http_client = _http_client, None
+    if client is not None:
+        client.close()
+
+def host_unavailable_response(e):
+    """503 for a lookup refused by the outbound client's breaker or host limit"""
+    response = jsonify({'error': f'Upstream unavailable: {str(e)}'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+    return response
 
 def get_db():
-    """Get database connection"""
+    """Get database connection (checked out from the pool for this request)"""
     db = getattr(g, '_database', None)
     if db is None:
-        if get_db_engine() == 'postgresql':
-            import psycopg2
-            import psycopg2.extras
-            db = g._database = psycopg2.connect(DATABASE_URL)
-            # PostgreSQL doesn't need row_factory, it returns dict-like objects by default
-        else:
-            db = g._database = sqlite3.connect(get_db_connection_string())
-            db.row_factory = sqlite3.Row
+        db = g._database = get_db_pool().acquire()
     return db
 
 def format_query(query, engine=None):
@@ -43,60 +179,134 @@ def format_query(query, engine=None):
         return query.replace('?', '%s')
     return query
 
+@app.before_request
+def acquire_request_slot():
+    """Wait for one of the REQUEST_CONCURRENCY slots (event streams do not take one)"""
+    if REQUEST_CONCURRENCY <= 0 or request.endpoint == 'events_stream':
+        return None
+    if not _request_slots.acquire(timeout=REQUEST_QUEUE_TIMEOUT):
+        response = jsonify({'error': 'Server busy'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    g._request_slot = True
+    return None
+
+@app.teardown_request
+def release_request_slot(exception):
+    if g.pop('_request_slot', False):
+        _request_slots.release()
+
 @app.teardown_appcontext
 def close_connection(exception):
-    """Close database connection"""
-    db = getattr(g, '_database', None)
+    """Return database connection to the pool"""
+    db = g.pop('_database', None)
     if db is not None:
-        if get_db_engine() == 'postgresql':
-            db.close()
-        else:
-            db.close()
+        get_db_pool().release(db)
 
 def init_db():
-    """Initialize database"""
+    """Initialize database (apply pending schema migrations)"""
     with app.app_context():
-        db = get_db()
-        if get_db_engine() == 'postgresql':
-            # PostgreSQL syntax
-            db.execute('''CREATE TABLE IF NOT EXISTS products
-                         (id SERIAL PRIMARY KEY,
-                          name TEXT UNIQUE NOT NULL,
-                          code TEXT UNIQUE NOT NULL)''')
-
-            db.execute('''CREATE TABLE IF NOT EXISTS batches
-                         (id SERIAL PRIMARY KEY,
-                          product_id INTEGER NOT NULL,
-                          batch_number TEXT UNIQUE NOT NULL,
-                          quantity INTEGER DEFAULT 1,
-                          FOREIGN KEY (product_id) REFERENCES products (id))''')
-            db.commit()
-        else:
-            # SQLite syntax
-            db.execute('''CREATE TABLE IF NOT EXISTS products
-                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                          name TEXT UNIQUE NOT NULL,
-                          code TEXT UNIQUE NOT NULL)''')
-
-            db.execute('''CREATE TABLE IF NOT EXISTS batches
-                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                          product_id INTEGER NOT NULL,
-                          batch_number TEXT UNIQUE NOT NULL,
-                          quantity INTEGER DEFAULT 1,
-                          FOREIGN KEY (product_id) REFERENCES products (id))''')
-            db.commit()
+        applied = migrate(get_db(), get_db_engine())
+        if applied:
+            print(f"已套用資料庫遷移: {applied}")
+
+# Catalog version: bumped in the same transaction as every catalog write
+def bump_catalog_version(db):
+    """Advance the catalog version inside the caller's open transaction.
+
+    Call it right before commit so the row lock is held as briefly as possible.
+    Returns the new version.
+    """
+    row = db.execute('UPDATE catalog_version SET version = version + 1 WHERE id = 1 RETURNING version').fetchone()
+    return row[0] if row else None
+
+def get_catalog_version():
+    """Get the current catalog version"""
+    row = get_db().execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()
+    return row[0] if row else 0
 
 # Database functions
-def get_all_products():
-    """Get all products with their batches"""
+def iter_all_products():
+    """Get a cursor over all products with their batches, ordered by product"""
     db = get_db()
-    cursor = db.execute('''
+    return db.execute('''
         SELECT p.id, p.name, p.code, b.id as batch_id, b.batch_number, b.quantity
         FROM products p
         LEFT JOIN batches b ON p.id = b.product_id
         ORDER BY p.name, b.batch_number
     ''')
-    return cursor.fetchall()
+
+def get_all_products():
+    """Get all products with their batches"""
+    return iter_all_products().fetchall()
+
+def get_products_page(name=None, code=None, batch_prefix=None, show_empty='all',
+                      after=None, limit=PRODUCTS_PAGE_SIZE):
+    """Get one keyset page of product/batch rows with the filters applied in SQL.
+
+    Rows are ordered by (name, product id, batch number); `after` is the sort
+    key of the last row already seen. Returns (rows, next_key) where next_key
+    is None on the last page.
+    """
+    conditions, params = [], []
+    # Substring filters of three or more characters use the trigram index
+    for field, text in (('name', name), ('code', code)):
+        if not text:
+            continue
+        condition = infix_condition(field, text, get_db_engine())
+        if condition:
+            conditions.append(condition[0])
+            params.extend(condition[1])
+        else:
+            conditions.append(f"LOWER(p.{field}) LIKE ? ESCAPE '\\'")
+            params.append(f'%{like_escape(text.lower())}%')
+    if batch_prefix:
+        # A range on batch_number can use its unique index, unlike LIKE 'x%'
+        batch_prefix = batch_prefix.upper()
+        conditions.append('b.batch_number >= ? AND b.batch_number < ?')
+        params.extend([batch_prefix, prefix_upper_bound(batch_prefix)])
+    if show_empty == 'with_batches':
+        conditions.append('b.id IS NOT NULL')
+    elif show_empty == 'without_batches':
+        conditions.append('b.id IS NULL')
+    if after:
+        conditions.append("(p.name, p.id, COALESCE(b.batch_number, '')) > (?, ?, ?)")
+        params.extend(after)
+
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    query = format_query(f'''
+        SELECT p.id, p.name, p.code, b.id as batch_id, b.batch_number, b.quantity
+        FROM products p
+        LEFT JOIN batches b ON p.id = b.product_id
+        {where}
+        ORDER BY p.name, p.id, COALESCE(b.batch_number, '')
+        LIMIT ?
+    ''')
+    # Fetch one extra row to learn whether another page exists
+    params.append(limit + 1)
+    rows = get_db().execute(query, params).fetchall()
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, [last['name'], last['id'], last['batch_number'] or '']
+
+def encode_cursor(key):
+    """Encode a keyset sort key as an opaque URL-safe cursor"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, types=(str, int, str)):
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if (not isinstance(key, list) or len(key) != len(types)
+            or not all(isinstance(value, t) for value, t in zip(key, types))):
+        raise ValueError('Invalid cursor')
+    return key
 
 def get_products_list():
     """Get list of products only"""
@@ -105,7 +315,19 @@ def get_products_list():
     return cursor.fetchall()
 
 def get_product_by_batch(batch_number):
-    """Get product by batch number"""
+    """Get product by batch number (served from batch_lookup_cache when possible)"""
+    cached = batch_lookup_cache.get(batch_number)
+    if not batch_lookup_cache.is_miss(cached):
+        return dict(cached) if cached else None
+
+    generation = batch_lookup_cache.generation
+    product = query_product_by_batch(batch_number)
+    tags = [('batch', product['batch_id']), ('product', product['product_id'])] if product else []
+    batch_lookup_cache.put(batch_number, product, tags, generation=generation)
+    return dict(product) if product else None
+
+def query_product_by_batch(batch_number):
+    """Look up product by batch number in the database"""
     db = get_db()
     query = format_query('''
         SELECT p.id as product_id, p.name, p.code, b.id as batch_id, b.batch_number, b.quantity
@@ -126,33 +348,51 @@ def get_product_by_batch(batch_number):
         }
     return None
 
+def query_products_by_batches(batch_numbers):
+    """Look up many batch numbers with chunked IN queries; returns {batch_number: product}"""
+    db = get_db()
+    numbers = list(dict.fromkeys(batch_numbers))
+    found = {}
+    for start in range(0, len(numbers), LOOKUP_CHUNK_SIZE):
+        chunk = numbers[start:start + LOOKUP_CHUNK_SIZE]
+        query = format_query(f'''
+            SELECT p.id as product_id, p.name, p.code, b.id as batch_id, b.batch_number, b.quantity
+            FROM products p
+            JOIN batches b ON p.id = b.product_id
+            WHERE b.batch_number IN ({",".join("?" * len(chunk))})
+        ''')
+        for row in db.execute(query, chunk):
+            found[row[4]] = {
+                'product_id': row[0],
+                'name': row[1],
+                'code': row[2],
+                'batch_id': row[3],
+                'batch_number': row[4],
+                'quantity': row[5]
+            }
+    return found
+
 def add_product(name):
     """Add a new product and assign a code"""
     try:
         db = get_db()
 
-        # Generate product code (A, B, C, etc.) - find next available letter
-        cursor = db.execute('SELECT code FROM products ORDER BY code')
-        existing_codes = [row['code'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
-
-        # Find next available code starting from A
-        code = 'A'
-        while code in existing_codes:
-            code = chr(ord(code) + 1)
-            # If we reach Z, start over from AA, AB, etc. (for future expansion)
-            if ord(code) > ord('Z'):
-                # For now, just keep incrementing - this is a simple solution
-                pass
+        # Next code from the counter/sequence: A..Z, then AA, AB, ...
+        code = allocate_code(db, get_db_engine())
 
         query = format_query('INSERT INTO products (name, code) VALUES (?, ?)')
-        db.execute(query, (name, code))
+        product_id = db.execute(query + ' RETURNING id', (name, code)).fetchone()[0]
+        version = bump_catalog_version(db)
+        record_changes(db, get_db_engine(), version, [('product', product_id, False)])
         db.commit()
+        publish_event('product_created', {'id': product_id, 'name': name, 'code': code}, version)
 
         # Get the inserted product
         query = format_query('SELECT * FROM products WHERE code = ?')
         cursor = db.execute(query, (code,))
         return cursor.fetchone()
     except sqlite3.IntegrityError as e:
+        db.rollback()  # also returns the allocated code
         # Check if it's a duplicate name or code error
         error_msg = str(e).lower()
         if 'name' in error_msg:
@@ -174,9 +414,17 @@ def add_batch_to_product(product_id, batch_number, quantity=1):
         if not product:
             return None
 
-        query = format_query('INSERT INTO batches (product_id, batch_number, quantity) VALUES (?, ?, ?)')
-        db.execute(query, (product_id, batch_number, quantity))
+        query = format_query('INSERT INTO batches (product_id, batch_number, quantity) VALUES (?, ?, ?) RETURNING id')
+        batch_id = db.execute(query, (product_id, batch_number, quantity)).fetchone()[0]
+        if quantity:
+            record_movement(db, get_db_engine(), batch_id, quantity, 'create')
+        version = bump_catalog_version(db)
+        record_changes(db, get_db_engine(), version, [('batch', batch_id, False)])
         db.commit()
+        batch_lookup_cache.invalidate(batch_number)  # drop a cached "not registered"
+        resolver_apply('add', batch_number)
+        publish_event('batch_created', {'id': batch_id, 'product_id': product_id,
+                                        'batch_number': batch_number, 'quantity': quantity}, version)
 
         # Get the inserted batch
         query = format_query('SELECT * FROM batches WHERE batch_number = ?')
@@ -189,54 +437,329 @@ def update_product(product_id, name):
     """Update a product name"""
     db = get_db()
     query = format_query('UPDATE products SET name = ? WHERE id = ?')
-    db.execute(query, (name, product_id))
+    updated = db.execute(query, (name, product_id)).rowcount > 0
+    if updated:
+        version = bump_catalog_version(db)
+        record_changes(db, get_db_engine(), version, [('product', product_id, False)])
     db.commit()
-    return db.rowcount > 0
+    if updated:
+        batch_lookup_cache.invalidate_tag(('product', product_id))
+        publish_event('product_updated', {'id': product_id, 'name': name}, version)
+    return updated
 
 def update_batch(batch_id, batch_number=None, quantity=None):
     """Update a batch number and/or quantity"""
+    if batch_number is None and quantity is None:
+        return False  # Nothing to update
+    db = get_db()
+    engine = get_db_engine()
     try:
-        db = get_db()
+        # Lock the row before reading it: the 'edit' movement must be the exact
+        # difference this UPDATE made, even with stock changes running alongside
+        lock = ''
+        if engine == 'postgresql':
+            lock = ' FOR UPDATE'
+        else:
+            if db.in_transaction:
+                db.commit()
+            db.execute('BEGIN IMMEDIATE')
+        old = db.execute(format_query('SELECT batch_number, quantity FROM batches WHERE id = ?' + lock),
+                         (batch_id,)).fetchone()
+        old_number = old['batch_number'] if old else None
         if batch_number is not None and quantity is not None:
             # Update both
-            query = format_query('UPDATE batches SET batch_number = ?, quantity = ? WHERE id = ?')
-            db.execute(query, (batch_number, quantity, batch_id))
+            query = format_query('UPDATE batches SET batch_number = ?, quantity = ? WHERE id = ? RETURNING product_id, batch_number, quantity')
+            cursor = db.execute(query, (batch_number, quantity, batch_id))
         elif batch_number is not None:
             # Update only batch_number
-            query = format_query('UPDATE batches SET batch_number = ? WHERE id = ?')
-            db.execute(query, (batch_number, batch_id))
-        elif quantity is not None:
-            # Update only quantity
-            query = format_query('UPDATE batches SET quantity = ? WHERE id = ?')
-            db.execute(query, (quantity, batch_id))
+            query = format_query('UPDATE batches SET batch_number = ? WHERE id = ? RETURNING product_id, batch_number, quantity')
+            cursor = db.execute(query, (batch_number, batch_id))
         else:
-            # Nothing to update
-            return False
-
+            # Update only quantity
+            query = format_query('UPDATE batches SET quantity = ? WHERE id = ? RETURNING product_id, batch_number, quantity')
+            cursor = db.execute(query, (quantity, batch_id))
+
+        row = cursor.fetchone()
+        updated = row is not None
+        if updated:
+            # An absolute edit enters the ledger as the difference it made
+            if quantity is not None and quantity != (old['quantity'] or 0):
+                record_movement(db, engine, batch_id, quantity - (old['quantity'] or 0), 'edit')
+            version = bump_catalog_version(db)
+            record_changes(db, engine, version, [('batch', batch_id, False)])
         db.commit()
-        return db.rowcount > 0
+        if updated:
+            batch_lookup_cache.invalidate_tag(('batch', batch_id))
+            if batch_number is not None:
+                batch_lookup_cache.invalidate(batch_number)
+                if old_number is not None:
+                    resolver_apply('rename', old_number, batch_number)
+            publish_event('batch_updated', {'id': batch_id, 'product_id': row['product_id'],
+                                            'batch_number': row['batch_number'], 'quantity': row['quantity']},
+                          version)
+        return updated
     except Exception:
+        db.rollback()  # release the write lock
         return False  # Batch number already exists or other error
 
+def adjust_batch_quantity(delta, batch_id=None, batch_number=None, source='api'):
+    """Atomically add a signed delta to a batch quantity and record it in the ledger.
+
+    The guarded UPDATE and the stock_movements row share one transaction.
+    Returns the updated row (id, batch_number, quantity), or None when the
+    batch does not exist or the result would drop below zero.
+    """
+    db = get_db()
+    column, key = ('id', batch_id) if batch_id is not None else ('batch_number', batch_number)
+    query = format_query(f'''
+        UPDATE batches SET quantity = COALESCE(quantity, 0) + ?
+        WHERE {column} = ? AND COALESCE(quantity, 0) + ? >= 0
+        RETURNING id, batch_number, quantity
+    ''')
+    row = db.execute(query, (delta, key, delta)).fetchone()
+    if row:
+        record_movement(db, get_db_engine(), row['id'], delta, source)
+        version = bump_catalog_version(db)
+        record_changes(db, get_db_engine(), version, [('batch', row['id'], False)])
+    db.commit()
+    if row:
+        batch_lookup_cache.invalidate(row['batch_number'])
+        publish_event('quantity_changed', {'id': row['id'], 'batch_number': row['batch_number'],
+                                           'quantity': row['quantity'], 'delta': delta, 'source': source},
+                      version)
+    return row
+
+def invalidate_batch_lookups(batch_numbers):
+    """Drop cached lookups (typically "not registered" answers) for new batches"""
+    for batch_number in batch_numbers:
+        batch_lookup_cache.invalidate(batch_number)
+
+# Write-behind stock increments
+def get_stock_buffer():
+    """The write-behind buffer for stock-in scans, or None when the mode is off"""
+    global _stock_buffer, _stock_flush_pool
+    if not STOCK_WRITE_BEHIND:
+        return None
+    if _stock_buffer is None:
+        with _stock_buffer_lock:
+            if _stock_buffer is None:
+                # The flusher gets its own connection: requests waiting on a flush
+                # may hold every connection of the shared pool
+                _stock_flush_pool = create_pool(get_db_engine(), get_db_connection_string(), max_size=1)
+                _stock_buffer = IncrementBuffer(functools.partial(flush_stock_increments, _stock_flush_pool))
+                _stock_buffer.start()
+    return _stock_buffer
+
+def close_stock_buffer():
+    """Flush and stop the write-behind buffer (at exit and on pool resets)"""
+    global _stock_buffer, _stock_flush_pool
+    with _stock_buffer_lock:
+        buffer, _stock_buffer = _stock_buffer, None
+        pool, _stock_flush_pool = _stock_flush_pool, None
+    if buffer is not None:
+        try:
+            buffer.close()
+        finally:
+            pool.dispose()
+
+atexit.register(close_stock_buffer)
+
+def flush_stock_increments(pool, items):
+    """Apply coalesced (batch_id, source, delta, events) increments in one transaction"""
+    totals = {}
+    for batch_id, _, delta, _ in items:
+        totals[batch_id] = totals.get(batch_id, 0) + delta
+    db = pool.acquire()
+    try:
+        db.executemany(format_query('UPDATE batches SET quantity = COALESCE(quantity, 0) + ? WHERE id = ?'),
+                       [(delta, batch_id) for batch_id, delta in totals.items()])
+        record_movements(db, get_db_engine(),
+                         [(batch_id, delta, source, events) for batch_id, source, delta, events in items])
+        version = bump_catalog_version(db)
+        # Batches deleted meanwhile keep their tombstones
+        placeholders = ','.join('?' * len(totals))
+        query = format_query(f'SELECT id, batch_number, quantity FROM batches WHERE id IN ({placeholders})')
+        changed = db.execute(query, list(totals)).fetchall()
+        record_changes(db, get_db_engine(), version, [('batch', row['id'], False) for row in changed])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        pool.release(db)
+    for batch_id in totals:
+        batch_lookup_cache.invalidate_tag(('batch', batch_id))
+    for row in changed:
+        publish_event('quantity_changed', {'id': row['id'], 'batch_number': row['batch_number'],
+                                           'quantity': row['quantity'], 'delta': totals[row['id']],
+                                           'source': 'write_behind'}, version)
+
+def merged_quantity(batch_id, read):
+    """read() plus any stock-in increments still waiting in the write-behind buffer"""
+    buffer = get_stock_buffer()
+    return buffer.merged(batch_id, read) if buffer else read()
+
+# Change events (/api/events)
+def _poll_catalog_version():
+    """Catalog version read on the broker's poller thread"""
+    pool = get_db_pool()
+    db = pool.acquire()
+    try:
+        row = db.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()
+        return row[0] if row else None
+    finally:
+        pool.release(db)
+
+def _poll_catalog_changes(after, upto, limit):
+    """Changes logged in versions (after, upto] for the poller, or None past `limit`"""
+    pool = get_db_pool()
+    db = pool.acquire()
+    try:
+        changes, next_key = changes_page(db, get_db_engine(), after, limit=limit)
+    finally:
+        pool.release(db)
+    if next_key is not None and changes[-1]['version'] <= upto:
+        return None
+    return [change for change in changes if change['version'] <= upto]
+
+def get_event_broker():
+    """Get the process-wide event broker, creating it on first use"""
+    global _event_broker
+    if _event_broker is None:
+        with _event_broker_lock:
+            if _event_broker is None:
+                _event_broker = EventBroker(poll=_poll_catalog_version,
+                                            changes=_poll_catalog_changes)
+    return _event_broker
+
+def reset_event_broker():
+    """End open streams; the next subscriber starts a fresh broker"""
+    global _event_broker
+    with _event_broker_lock:
+        broker, _event_broker = _event_broker, None
+    if broker is not None:
+        broker.close()
+
+def publish_event(event, data, version=None):
+    """Announce a committed change to /api/events subscribers (no-op without any)"""
+    broker = _event_broker
+    if broker is not None:
+        broker.publish(event, data, version)
+
+# Batch resolver maintenance
+def _load_batch_resolver(db):
+    """Build a resolver from every registered batch number; returns (resolver, catalog version)"""
+    version = db.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()[0]
+    resolver = BatchResolver()
+    for row in db.execute('SELECT batch_number FROM batches'):
+        resolver.add(row[0])
+    return resolver, version
+
+def get_batch_resolver():
+    """Get the process-wide batch resolver, building it on first use"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver, _resolver_state['version'] = _load_batch_resolver(get_db())
+                _resolver_state['built_at'] = time.monotonic()
+        return _resolver
+
+    if (time.monotonic() - _resolver_state['built_at'] > BATCH_RESOLVER_RESYNC_INTERVAL
+            and _resolver_state['pending'] is None
+            and get_catalog_version() != _resolver_state['version']):
+        with _resolver_lock:
+            if _resolver_state['pending'] is None:
+                _resolver_state['pending'] = []
+                threading.Thread(target=_rebuild_batch_resolver, daemon=True).start()
+    return _resolver
+
+def _rebuild_batch_resolver():
+    """Background rebuild; writes made meanwhile are replayed before the swap"""
+    global _resolver
+    pool = get_db_pool()
+    db = pool.acquire()
+    try:
+        resolver, version = _load_batch_resolver(db)
+    except Exception as e:
+        print(f"Batch resolver rebuild failed: {e}")
+        with _resolver_lock:
+            _resolver_state['pending'] = None
+            _resolver_state['built_at'] = time.monotonic()
+        return
+    finally:
+        pool.release(db)
+    with _resolver_lock:
+        for op, args in _resolver_state['pending'] or ():
+            getattr(resolver, op)(*args)
+        _resolver = resolver
+        _resolver_state.update(version=version, built_at=time.monotonic(), pending=None)
+
+def reset_batch_resolver():
+    global _resolver
+    with _resolver_lock:
+        _resolver = None
+        _resolver_state.update(version=None, built_at=0.0, pending=None)
+
+def resolver_apply(op, *args):
+    """Apply a committed batch change ('add', 'remove' or 'rename') to the resolver"""
+    with _resolver_lock:
+        if _resolver is not None:
+            getattr(_resolver, op)(*args)
+        if _resolver_state['pending'] is not None:
+            _resolver_state['pending'].append((op, args))
+
+def on_batches_inserted(batch_numbers, version=None):
+    """Bulk import hook: runs after each chunk commits"""
+    invalidate_batch_lookups(batch_numbers)
+    for batch_number in batch_numbers:
+        resolver_apply('add', batch_number)
+    # One event per chunk; subscribers reload rather than receive every row
+    publish_event('batches_imported', {'count': len(batch_numbers)}, version)
+
+def batch_exists(batch_id=None, batch_number=None):
+    """Check whether a batch exists by id or batch number"""
+    db = get_db()
+    column, key = ('id', batch_id) if batch_id is not None else ('batch_number', batch_number)
+    query = format_query(f'SELECT 1 FROM batches WHERE {column} = ?')
+    return db.execute(query, (key,)).fetchone() is not None
+
 def delete_product(product_id):
     """Delete a product and all its batches"""
     db = get_db()
-    # Delete batches first (due to foreign key constraint)
-    query = format_query('DELETE FROM batches WHERE product_id = ?')
-    db.execute(query, (product_id,))
+    # Delete batches explicitly (indexed on product_id); ON DELETE CASCADE backs this up
+    query = format_query('DELETE FROM batches WHERE product_id = ? RETURNING id, batch_number')
+    removed = db.execute(query, (product_id,)).fetchall()
     # Delete product
     query = format_query('DELETE FROM products WHERE id = ?')
-    db.execute(query, (product_id,))
+    deleted = db.execute(query, (product_id,)).rowcount > 0
+    if deleted:
+        version = bump_catalog_version(db)
+        record_changes(db, get_db_engine(), version,
+                       [('product', product_id, True)] + [('batch', row[0], True) for row in removed])
     db.commit()
-    return db.rowcount > 0
+    if deleted:
+        batch_lookup_cache.invalidate_tag(('product', product_id))
+        for row in removed:
+            resolver_apply('remove', row[1])
+        publish_event('product_deleted', {'id': product_id, 'batch_ids': [row[0] for row in removed]}, version)
+    return deleted
 
 def delete_batch(batch_id):
     """Delete a specific batch"""
     db = get_db()
-    query = format_query('DELETE FROM batches WHERE id = ?')
-    db.execute(query, (batch_id,))
+    query = format_query('DELETE FROM batches WHERE id = ? RETURNING batch_number, product_id')
+    row = db.execute(query, (batch_id,)).fetchone()
+    deleted = row is not None
+    if deleted:
+        version = bump_catalog_version(db)
+        record_changes(db, get_db_engine(), version, [('batch', batch_id, True)])
     db.commit()
-    return db.rowcount > 0
+    if deleted:
+        batch_lookup_cache.invalidate_tag(('batch', batch_id))
+        resolver_apply('remove', row[0])
+        publish_event('batch_deleted', {'id': batch_id, 'product_id': row[1]}, version)
+    return deleted
 
 @app.route('/')
 def index():
@@ -267,19 +790,133 @@ def products():
         traceback.print_exc()
         return f"Internal Server Error: {str(e)}", 500
 
+PRODUCTS_QUERY_PARAMS = ('name', 'code', 'batch', 'show_empty', 'limit', 'cursor')
+PRODUCT_SHAPES = ('flat', 'grouped')
+
+def product_row_json(p):
+    """Serialize one product/batch join row for the API"""
+    return {
+        'id': p['id'],
+        'name': p['name'],
+        'code': p['code'],
+        'batch_id': p['batch_id'],
+        'batch_number': p['batch_number'],
+        'quantity': p['quantity'] if p['quantity'] is not None else 0
+    }
+
+def group_product_rows(rows):
+    """Fold ordered product/batch join rows into one entry per product.
+
+    Rows of a product are contiguous in the join order, so a single pass
+    that only remembers the current product is enough.
+    """
+    grouped = []
+    current = None
+    for p in rows:
+        if current is None or current['id'] != p['id']:
+            current = {'id': p['id'], 'name': p['name'], 'code': p['code'], 'batches': []}
+            grouped.append(current)
+        if p['batch_id'] is not None:
+            current['batches'].append({
+                'id': p['batch_id'],
+                'batch_number': p['batch_number'],
+                'quantity': p['quantity'] if p['quantity'] is not None else 0
+            })
+    return grouped
+
+def serialize_product_rows(rows, shape):
+    """Serialize join rows as flat rows or grouped products"""
+    if shape == 'grouped':
+        return group_product_rows(rows)
+    return [product_row_json(p) for p in rows]
+
+def get_products_paged():
+    """Serve GET /api/products?name=&code=&batch=&show_empty=&limit=&cursor=&shape="""
+    show_empty = request.args.get('show_empty', 'all')
+    if show_empty not in ('all', 'with_batches', 'without_batches'):
+        return jsonify({'error': 'show_empty must be all, with_batches or without_batches'}), 400
+
+    limit = request.args.get('limit', PRODUCTS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, PRODUCTS_MAX_PAGE_SIZE))
+
+    shape = request.args.get('shape', 'flat')
+    if shape not in PRODUCT_SHAPES:
+        return jsonify({'error': 'shape must be flat or grouped'}), 400
+
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args['cursor'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    try:
+        rows, next_key = get_products_page(
+            name=request.args.get('name', '').strip(),
+            code=request.args.get('code', '').strip(),
+            batch_prefix=request.args.get('batch', '').strip(),
+            show_empty=show_empty,
+            after=after,
+            limit=limit,
+        )
+        return jsonify({
+            'items': serialize_product_rows(rows, shape),
+            'next_cursor': encode_cursor(next_key) if next_key else None,
+            'limit': limit
+        })
+    except Exception as e:
+        print(f"Error in get_products_paged: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def catalog_etag(version, args):
+    """Strong ETag for a catalog read: version plus the normalized query parameters"""
+    params = '&'.join(f'{k}={v}' for k, v in sorted(args.items(multi=True)))
+    digest = hashlib.sha1(params.encode('utf-8')).hexdigest()[:16]
+    return f'{version}-{digest}'
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    """Get all products and batches as JSON"""
+    """Get all products and batches as JSON (ETag / 304 aware, cached per catalog version)"""
+    try:
+        # Read the version before the data: a write in between can only make the
+        # cached body newer than its version, never older
+        version = get_catalog_version()
+    except Exception as e:
+        print(f"Error reading catalog version: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+    etag = catalog_etag(version, request.args)
+    # Weak comparison (RFC 9110): compressed responses carry the ETag as W/"..."
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        body = products_response_cache.get(version, etag)
+        if body is None:
+            response = app.make_response(build_products_response())
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            products_response_cache.put(version, etag, body)
+        response = app.response_class(body, mimetype='application/json')
+
+    response.set_etag(etag)
+    # Let browsers keep the body but revalidate it on every use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def build_products_response():
+    """Query and serialize the /api/products payload for the current request"""
+    # Filtered / paged requests are answered from SQL; a bare request keeps the full list
+    if any(key in request.args for key in PRODUCTS_QUERY_PARAMS):
+        return get_products_paged()
+
+    # ?shape=grouped returns each product once with its batches nested
+    shape = request.args.get('shape', 'flat')
+    if shape not in PRODUCT_SHAPES:
+        return jsonify({'error': 'shape must be flat or grouped'}), 400
+
     try:
-        products_data = get_all_products()
-        result = [{
-            'id': p['id'],
-            'name': p['name'],
-            'code': p['code'],
-            'batch_id': p['batch_id'],
-            'batch_number': p['batch_number'],
-            'quantity': p['quantity'] if p['quantity'] is not None else 0
-        } for p in products_data]  # Include all products, even those without batches
+        result = serialize_product_rows(iter_all_products(), shape)  # Include all products, even those without batches
 
         print(f"API /api/products returning {len(result)} items")
         return jsonify(result)
@@ -289,6 +926,45 @@ def get_products():
         traceback.print_exc()
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Catalog changefeed: products and batches changed after ?since=<version>.
+
+    Each entity appears once with its current contents, or as a tombstone
+    ({"deleted": true}). Follow next_cursor until it is null, then keep
+    `version` as the next since. 410 means the changes are gone (pruned
+    tombstones, or a version from another database): resync from since=0.
+    """
+    since = request.args.get('since', '0')
+    if not since.isdigit():
+        return jsonify({'error': 'since must be a non-negative integer version'}), 400
+    since = int(since)
+    limit = request.args.get('limit', CHANGES_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, CHANGES_MAX_PAGE_SIZE))
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args['cursor'], types=(int, str, int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if after[1] not in ENTITIES or after[0] <= since:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    db = get_db()
+    try:
+        check_since(db, get_db_engine(), since)
+    except ChangesExpired as e:
+        return jsonify({'error': str(e), 'horizon': e.horizon, 'version': e.version}), 410
+    changes, next_key = changes_page(db, get_db_engine(), since, after, limit)
+
+    return jsonify({
+        'since': since,
+        # Sync point: every change up to here has been returned once next_cursor is null
+        'version': changes[-1]['version'] if changes else (after[0] if after else since),
+        'changes': changes,
+        'next_cursor': encode_cursor(next_key) if next_key else None
+    })
+
 @app.route('/api/products', methods=['POST'])
 def add_product_api():
     """Add a new product with its first batch"""
@@ -298,7 +974,7 @@ def add_product_api():
 
     # Validate batch number format
     batch_number = data['batch_number']
-    if not batch_number.startswith('5') or len(batch_number) != 10:
+    if not is_valid_batch_number(batch_number):
         return jsonify({'error': 'Batch number must be 10 characters starting with 5'}), 400
 
     try:
@@ -338,7 +1014,7 @@ def add_batch_api():
         return jsonify({'error': 'Product ID and batch number are required'}), 400
 
     # Validate batch number format
-    if not data['batch_number'].startswith('5') or len(data['batch_number']) != 10:
+    if not is_valid_batch_number(data['batch_number']):
         return jsonify({'error': 'Batch number must be 10 characters starting with 5'}), 400
 
     batch = add_batch_to_product(data['product_id'], data['batch_number'])
@@ -352,6 +1028,33 @@ def add_batch_api():
         'quantity': batch['quantity']
     })
 
+@app.route('/api/batches/bulk', methods=['POST'])
+def bulk_add_batches_api():
+    """Bulk-register batches from a streamed CSV or NDJSON body"""
+    mimetype = request.mimetype or ''
+    fmt = request.args.get('format') or ('ndjson' if 'json' in mimetype else 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Format must be csv or ndjson'}), 400
+    default_product_id = request.args.get('product_id', type=int)
+
+    try:
+        # Read the body as it arrives instead of buffering the whole manifest
+        lines = iter_lines(request.stream)
+        parsed = parse_ndjson(lines) if fmt == 'ndjson' else parse_csv(lines, default_product_id)
+        versions = []
+
+        def before_commit(db, batch_numbers):
+            versions.append(bump_catalog_version(db))
+            record_batch_numbers(db, get_db_engine(), versions[-1], batch_numbers)
+
+        report = bulk_insert_batches(get_db(), get_db_engine(),
+                                     validate_rows(parsed, default_product_id),
+                                     before_commit=before_commit,
+                                     on_inserted=lambda numbers: on_batches_inserted(numbers, versions[-1]))
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({'error': f'Bulk import failed: {str(e)}'}), 500
+
 @app.route('/api/products/<int:product_id>', methods=['PUT'])
 def update_product_api(product_id):
     """Update a product name"""
@@ -382,19 +1085,122 @@ def update_batch_api(batch_id):
         return jsonify({'error': 'Either batch_number or quantity must be provided'}), 400
 
     # Validate batch number format if provided
-    if batch_number and (not batch_number.startswith('5') or len(batch_number) != 10):
+    if batch_number and not is_valid_batch_number(batch_number):
         return jsonify({'error': 'Batch number must be 10 characters starting with 5'}), 400
 
     # Validate quantity if provided
     if quantity is not None and (not isinstance(quantity, int) or quantity < 0):
         return jsonify({'error': 'Quantity must be a non-negative integer'}), 400
 
+    buffer = get_stock_buffer()
+    if buffer and quantity is not None:
+        buffer.flush()  # an absolute count replaces queued stock-ins instead of adding to them
+
     success = update_batch(batch_id, batch_number, quantity)
     if not success:
         return jsonify({'error': 'Batch update failed'}), 400
 
     return jsonify({'message': 'Batch updated successfully'})
 
+@app.route('/api/batches/<int:batch_id>/stock', methods=['POST'])
+def stock_batch_api(batch_id):
+    """Atomically adjust a batch quantity by id (stock-in / stock-out)"""
+    return _stock_adjust_response(batch_id=batch_id)
+
+@app.route('/api/batches/by_number/<batch_number>/stock', methods=['POST'])
+def stock_batch_by_number_api(batch_number):
+    """Atomically adjust a batch quantity by batch number"""
+    return _stock_adjust_response(batch_number=batch_number)
+
+def _stock_adjust_response(batch_id=None, batch_number=None):
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}  # no body: a single stock-in
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    delta = data.get('delta', 1)
+
+    # bool is a subclass of int, reject it explicitly; a zero delta would only
+    # write an empty ledger row and bump the catalog version
+    if not isinstance(delta, int) or isinstance(delta, bool) or delta == 0:
+        return jsonify({'error': 'Delta must be a non-zero integer'}), 400
+    source = data.get('source', 'api')
+    if not isinstance(source, str) or not source or len(source) > SOURCE_MAX_LENGTH:
+        return jsonify({'error': f'Source must be a string of at most {SOURCE_MAX_LENGTH} characters'}), 400
+
+    buffer = get_stock_buffer()
+    if buffer and delta > 0:
+        response = _buffered_stock_in(buffer, delta, source, batch_id, batch_number)
+        if response is not None:
+            return response
+    elif buffer and delta < 0:
+        buffer.flush()  # the non-negative guard must see queued stock-ins
+
+    row = adjust_batch_quantity(delta, batch_id=batch_id, batch_number=batch_number, source=source)
+    if not row:
+        if not batch_exists(batch_id=batch_id, batch_number=batch_number):
+            return jsonify({'error': 'Batch not found'}), 404
+        return jsonify({'error': 'Quantity cannot become negative'}), 409
+
+    return jsonify({
+        'batch_id': row['id'],
+        'batch_number': row['batch_number'],
+        'quantity': row['quantity']
+    })
+
+def _buffered_stock_in(buffer, delta, source, batch_id=None, batch_number=None):
+    """Queue a stock-in in the write-behind buffer; None if it refused (write directly)"""
+    db = get_db()
+    column, key = ('id', batch_id) if batch_id is not None else ('batch_number', batch_number)
+    row = db.execute(format_query(f'SELECT id, batch_number FROM batches WHERE {column} = ?'), (key,)).fetchone()
+    if not row:
+        return jsonify({'error': 'Batch not found'}), 404
+    if not buffer.add(row['id'], delta, source):
+        return None
+
+    def read():
+        stored = db.execute(format_query('SELECT quantity FROM batches WHERE id = ?'), (row['id'],)).fetchone()
+        return (stored[0] or 0) if stored else 0
+    return jsonify({
+        'batch_id': row['id'],
+        'batch_number': row['batch_number'],
+        'quantity': buffer.merged(row['id'], read),
+        'buffered': True
+    })
+
+@app.route('/api/batches/<int:batch_id>/movements', methods=['GET'])
+def batch_movements_api(batch_id):
+    """Stock movement history of a batch, newest first.
+
+    ?since=&until= (ISO-8601, UTC if no offset) bound created_at; ?before=
+    takes the next_before value of the previous page.
+    """
+    limit = request.args.get('limit', 100, type=int)
+    limit = max(1, min(limit, 1000))
+    before_id = request.args.get('before', type=int)
+
+    db = get_db()
+    batch = db.execute(format_query('SELECT id, batch_number, quantity FROM batches WHERE id = ?'),
+                       (batch_id,)).fetchone()
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    quantity = batch['quantity'] or 0
+    try:
+        movements, next_before = movement_history(
+            db, get_db_engine(), batch_id, quantity,
+            since=request.args.get('since'), until=request.args.get('until'),
+            before_id=before_id, limit=limit)
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO-8601 timestamps'}), 400
+
+    return jsonify({
+        'batch_id': batch['id'],
+        'batch_number': batch['batch_number'],
+        'quantity': quantity,
+        'movements': movements,
+        'next_before': next_before
+    })
+
 @app.route('/api/products/<int:product_id>', methods=['DELETE'])
 def delete_product_api(product_id):
     """Delete a product and all its batches"""
@@ -417,6 +1223,10 @@ def delete_batch_api(batch_id):
 def search_product(batch_number):
     """Search for product by batch number"""
     product = get_product_by_batch(batch_number)
+    if product and STOCK_WRITE_BEHIND:
+        # Re-read under the buffer's flush check so queued stock-ins count exactly once
+        product['quantity'] = merged_quantity(
+            product['batch_id'], lambda: (get_product_by_batch(batch_number) or {}).get('quantity') or 0)
     if product:
         return jsonify({
             'found': True,
@@ -432,6 +1242,178 @@ def search_product(batch_number):
             'batch_number': batch_number
         })
 
+@app.route('/api/search', methods=['GET'])
+def search_catalog_api():
+    """Search batch numbers, product names and codes by prefix or substring.
+
+    ?q=<text>&fields=batch_number,name,code&limit=20. Results are ranked
+    exact, prefix, then substring matches; each row is a product/batch row
+    plus the field that matched and how.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    fields = [f for f in request.args.get('fields', 'batch_number,name,code').split(',') if f]
+    unknown = [f for f in fields if f not in ('batch_number', 'name', 'code')]
+    if unknown or not fields:
+        return jsonify({'error': 'fields must be a list of batch_number, name and code'}), 400
+    limit = request.args.get('limit', CATALOG_SEARCH_LIMIT, type=int)
+    limit = max(1, min(limit, CATALOG_SEARCH_MAX_LIMIT))
+
+    try:
+        rows = search_catalog(get_db(), get_db_engine(), query, fields, limit)
+    except Exception as e:
+        print(f"Error in search_catalog: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+    return jsonify({
+        'query': query,
+        'results': [dict(product_row_json(row), field=row['field'], match=row['match']) for row in rows]
+    })
+
+@app.route('/api/search_products', methods=['POST'])
+def search_products():
+    """Look up many batch numbers at once, answering in input order.
+
+    Body: {"batch_numbers": [...]} or text/plain with one batch number per
+    line (read as it arrives). The response is streamed as
+    {"results": [...], "total", "found", "not_found", "truncated"} and each
+    chunk of LOOKUP_CHUNK_SIZE numbers costs one IN query.
+    """
+    if request.mimetype == 'text/plain':
+        numbers = (line.strip() for line in iter_lines(request.stream))
+        numbers = (number for number in numbers if number)
+    else:
+        data = request.get_json(silent=True)
+        numbers = data.get('batch_numbers') if isinstance(data, dict) else None
+        if not isinstance(numbers, list):
+            return jsonify({'error': 'batch_numbers must be a list'}), 400
+        if len(numbers) > SEARCH_MAX_BATCHES:
+            return jsonify({'error': f'At most {SEARCH_MAX_BATCHES} batch numbers per request'}), 400
+
+    def lookup_chunk(chunk):
+        products = query_products_by_batches([n for n in chunk if is_valid_batch_number(n)])
+        for number in chunk:
+            product = products.get(number) if isinstance(number, str) else None
+            if product:
+                yield {
+                    'found': True,
+                    'name': product['name'],
+                    'batch_number': number,
+                    'product_code': product['code'],
+                    'quantity': product['quantity'],
+                    'batch_id': product['batch_id']
+                }
+            else:
+                yield {'found': False, 'batch_number': number}
+
+    def generate():
+        counts = {'total': 0, 'found': 0, 'not_found': 0, 'truncated': False}
+        separator = b''
+        chunk = []
+
+        def flush():
+            nonlocal separator
+            results = list(lookup_chunk(chunk))
+            chunk.clear()
+            for result in results:
+                counts['found' if result['found'] else 'not_found'] += 1
+            # One dumps() per chunk: strip the list brackets and splice chunks together
+            part = separator + responses.dumps(results)[1:-1]
+            separator = b','
+            return part
+
+        yield '{"results":['
+        for number in numbers:
+            if counts['total'] >= SEARCH_MAX_BATCHES:
+                counts['truncated'] = True
+                break
+            counts['total'] += 1
+            chunk.append(number.strip() if isinstance(number, str) else number)
+            if len(chunk) >= LOOKUP_CHUNK_SIZE:
+                yield flush()
+        if chunk:
+            yield flush()
+        yield '],' + json.dumps(counts)[1:]
+
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+@app.route('/api/resolve_batch', methods=['POST'])
+def resolve_batch():
+    """Match OCR candidate strings to registered batch numbers, tolerating misreads.
+
+    Body: {"candidates": [...]} or {"candidate": "..."}. Each result has the
+    matched batch_number (or null), a confidence between 0 and 1, the method
+    (exact, confusion, edit, none) and the product of the match.
+    """
+    data = request.get_json(silent=True) or {}
+    candidates = data.get('candidates')
+    if candidates is None and 'candidate' in data:
+        candidates = [data['candidate']]
+    if not isinstance(candidates, list) or not candidates or \
+            not all(isinstance(c, str) for c in candidates):
+        return jsonify({'error': 'candidates must be a non-empty list of strings'}), 400
+    if len(candidates) > BATCH_RESOLVE_MAX_CANDIDATES:
+        return jsonify({'error': f'At most {BATCH_RESOLVE_MAX_CANDIDATES} candidates per request'}), 400
+
+    resolver = get_batch_resolver()
+    started = time.perf_counter()
+    resolutions = [resolver.resolve(candidate) for candidate in candidates]
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    products = query_products_by_batches([r.batch_number for r in resolutions if r.batch_number])
+    return jsonify({
+        'results': [{
+            'candidate': r.candidate,
+            'batch_number': r.batch_number,
+            'confidence': r.confidence,
+            'method': r.method,
+            'distance': r.distance,
+            'alternatives': r.alternatives,
+            'product_info': product_info_json(r.batch_number, products.get(r.batch_number))
+                            if r.batch_number else None
+        } for r in resolutions],
+        'resolve_ms': round(elapsed_ms, 3)
+    })
+
+@app.route('/api/events')
+def events_stream():
+    """Server-Sent Events stream of catalog changes.
+
+    A reconnecting browser sends Last-Event-ID and gets the events it missed,
+    or a resync event when they are no longer available. The stream holds no
+    database connection while it waits.
+    """
+    broker = get_event_broker()
+    subscription = broker.subscribe(request.headers.get('Last-Event-ID'))
+    if subscription is None:
+        response = jsonify({'error': 'Too many event subscribers'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+
+    response = app.response_class(broker.stream(subscription), mimetype='text/event-stream')
+    response.call_on_close(subscription.close)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: pass events through unbuffered
+    return response
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    """Hit/miss/eviction counters for the in-process caches"""
+    return jsonify({
+        'batch_lookup': batch_lookup_cache.status(),
+        'products_response': products_response_cache.status(),
+        'frame_recognition': frame_cache.status(),
+        'batch_resolver': _resolver.status() if _resolver is not None else None,
+        'stock_write_behind': _stock_buffer.status() if _stock_buffer is not None else None,
+        'events': _event_broker.status() if _event_broker is not None else None
+    })
+
+@app.route('/api/http_client_stats')
+def http_client_stats():
+    """Outbound request counters and per-host breaker state"""
+    return jsonify(get_http_client().status())
+
 @app.route('/api/fetch_url')
 def fetch_url():
     """Fetch URL content and return it"""
@@ -448,10 +1430,8 @@ def fetch_url():
         if not parsed.scheme or not parsed.netloc:
             return jsonify({'error': 'Invalid URL format'}), 400
 
-        # Fetch the URL content
-        response = requests.get(url, timeout=10, headers={
-            'User-Agent': 'VAS-Batch-Identifier/1.0'
-        })
+        # Fetch the URL content through the shared keep-alive pool
+        response = get_http_client().get(url)
 
         if response.status_code != 200:
             return jsonify({'error': f'HTTP {response.status_code}: {response.reason}'}), 400
@@ -464,6 +1444,8 @@ def fetch_url():
             'content_length': len(content)
         })
 
+    except HostUnavailable as e:
+        return host_unavailable_response(e)
     except requests.exceptions.RequestException as e:
         return jsonify({'error': f'Request failed: {str(e)}'}), 500
     except Exception as e:
@@ -472,7 +1454,7 @@ def fetch_url():
 
 @app.route('/api/extract_batch_from_url')
 def extract_batch_from_url():
-    """Fetch URL content and extract batch number server-side (optimized)"""
+    """Fetch URL content and extract batch number server-side (streamed, stops at first match)"""
     url = request.args.get('url')
     if not url:
         return jsonify({'error': 'URL parameter is required'}), 400
@@ -490,22 +1472,15 @@ def extract_batch_from_url():
 
         print(f"URL解析成功: scheme={parsed.scheme}, netloc={parsed.netloc}")  # 调试日志
 
-        # Fetch the URL content
-        response = requests.get(url, timeout=10, headers={
-            'User-Agent': 'VAS-Batch-Identifier/1.0'
-        })
-
-        print(f"HTTP响应状态: {response.status_code}")  # 调试日志
+        # Optional lower byte cap for this request (never above URL_FETCH_MAX_BYTES)
+        max_bytes = request.args.get('max_bytes', type=int)
+        if max_bytes is not None:
+            max_bytes = max(1, min(max_bytes, URL_FETCH_MAX_BYTES))
 
-        if response.status_code != 200:
-            return jsonify({'error': f'HTTP {response.status_code}: {response.reason}'}), 400
-
-        content = response.text
-        print(f"页面内容长度: {len(content)} 字符")  # 调试日志
-
-        # Extract batch number server-side
-        batch_number = extract_batch_from_text(content)
-        print(f"提取的批次号: {batch_number}")  # 调试日志
+        # Stream the page and stop as soon as a batch number shows up
+        fetched = fetch_batch_from_url(url, get_http_client().get, max_bytes=max_bytes)
+        batch_number = fetched['batch_number']
+        print(f"读取 {fetched['bytes_read']} 字节, 提取的批次号: {batch_number}")  # 调试日志
 
         # Get product info if batch found
         product_info = None
@@ -518,68 +1493,224 @@ def extract_batch_from_url():
             'batch_found': batch_number is not None,
             'batch_number': batch_number,
             'product_info': product_info,
-            'content_preview': content[:500] + '...' if len(content) > 500 else content,  # Small preview only
-            'content_length': len(content)
+            'content_preview': fetched['content_preview'],  # Small preview only
+            'content_length': fetched['content_length'],
+            'bytes_read': fetched['bytes_read'],
+            'upstream_content_length': fetched['upstream_content_length'],
+            'truncated': fetched['truncated'],
+            'time_to_first_match_ms': fetched['time_to_first_match_ms'],
+            'elapsed_ms': fetched['elapsed_ms']
         })
 
+    except UpstreamHTTPError as e:
+        return jsonify({'error': str(e)}), 400
+    except HostUnavailable as e:
+        return host_unavailable_response(e)
     except requests.exceptions.RequestException as e:
         return jsonify({'error': f'Request failed: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Processing failed: {str(e)}'}), 500
 
 
+def _extract_one_url(url, max_bytes):
+    """Worker for /api/extract_batch_from_urls: fetch one page, never raise"""
+    import requests
+
+    try:
+        fetched = fetch_batch_from_url(url, get_http_client().get, max_bytes=max_bytes)
+    except UpstreamHTTPError as e:
+        return {'error': str(e), 'status': 400}
+    except HostUnavailable as e:
+        return {'error': f'Upstream unavailable: {str(e)}', 'status': 503}
+    except requests.exceptions.RequestException as e:
+        return {'error': f'Request failed: {str(e)}', 'status': 500}
+    except Exception as e:
+        return {'error': f'Processing failed: {str(e)}', 'status': 500}
+    return {
+        'batch_found': fetched['batch_number'] is not None,
+        'batch_number': fetched['batch_number'],
+        'bytes_read': fetched['bytes_read'],
+        'truncated': fetched['truncated'],
+        'elapsed_ms': fetched['elapsed_ms']
+    }
+
+@app.route('/api/extract_batch_from_urls', methods=['POST'])
+def extract_batch_from_urls():
+    """Extract batch numbers from many URLs concurrently, streaming NDJSON as each finishes.
+
+    Body: {"urls": [...], "max_bytes": optional}. Every unique URL yields one
+    {"type": "result", "url", "indexes", ...} line in completion order; the
+    last line is {"type": "summary", "products": {batch_number: product_info}}
+    with all found batch numbers resolved in one lookup.
+    """
+    from urllib.parse import urlparse
+
+    data = request.get_json(silent=True)
+    urls = data.get('urls') if isinstance(data, dict) else None
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'error': 'urls must be a non-empty list'}), 400
+    if len(urls) > URL_BATCH_MAX_URLS:
+        return jsonify({'error': f'At most {URL_BATCH_MAX_URLS} URLs per request'}), 400
+
+    max_bytes = data.get('max_bytes')
+    if max_bytes is not None:
+        if not isinstance(max_bytes, int) or isinstance(max_bytes, bool):
+            return jsonify({'error': 'max_bytes must be an integer'}), 400
+        max_bytes = max(1, min(max_bytes, URL_FETCH_MAX_BYTES))
+
+    # Identical URLs are fetched once; the result lists every input position
+    positions = {}
+    for index, url in enumerate(urls):
+        key = url.strip() if isinstance(url, str) else None
+        positions.setdefault(key, []).append(index)
+
+    def generate():
+        found = {}
+        counts = {'urls': len(urls), 'unique_urls': len(positions), 'batch_found': 0, 'errors': 0}
+
+        def line(obj):
+            return responses.dumps(obj) + b'\n'
+
+        fetchable = []
+        for url, indexes in positions.items():
+            parsed = urlparse(url) if isinstance(url, str) else None
+            if parsed is None or parsed.scheme not in ('http', 'https') or not parsed.netloc:
+                counts['errors'] += 1
+                yield line({'type': 'result', 'url': url, 'indexes': indexes,
+                            'error': 'Invalid URL format', 'status': 400})
+            else:
+                fetchable.append(url)
+
+        if fetchable:
+            executor = ThreadPoolExecutor(max_workers=min(URL_BATCH_WORKERS, len(fetchable)))
+            try:
+                futures = {executor.submit(_extract_one_url, url, max_bytes): url for url in fetchable}
+                for future in as_completed(futures):
+                    url = futures[future]
+                    result = future.result()
+                    if 'error' in result:
+                        counts['errors'] += 1
+                    elif result['batch_found']:
+                        counts['batch_found'] += 1
+                        found.setdefault(result['batch_number'], None)
+                    yield line(dict({'type': 'result', 'url': url, 'indexes': positions[url]}, **result))
+            finally:
+                # Client went away: drop the URLs nobody started yet
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        products = query_products_by_batches(list(found)) if found else {}
+        yield line({
+            'type': 'summary',
+            'products': {number: product_info_json(number, products.get(number)) for number in found},
+            **counts
+        })
+
+    return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/api/recognize', methods=['POST'])
+def recognize_frame():
+    """Recognize a camera frame server-side and extract the batch number.
+
+    Body: raw pixels (application/octet-stream, from canvas getImageData,
+    with ?width=&height=) or a PNG/JPEG image. ?roi=x,y,w,h crops first.
+    """
+    from concurrent.futures import TimeoutError as RecognizeTimeout
+    from concurrent.futures.process import BrokenProcessPool
+
+    if request.content_length and request.content_length > recognition.RECOGNIZE_MAX_BYTES:
+        return jsonify({'error': 'Frame too large'}), 413
+    # A chunked upload has no Content-Length: read at most one byte past the limit
+    body = request.stream.read(recognition.RECOGNIZE_MAX_BYTES + 1)
+    if len(body) > recognition.RECOGNIZE_MAX_BYTES:
+        return jsonify({'error': 'Frame too large'}), 413
+
+    timings = {}
+    try:
+        started = time.perf_counter()
+        frame = recognition.decode_frame(body, request.mimetype,
+                                         request.args.get('width', type=int),
+                                         request.args.get('height', type=int))
+        roi = recognition.parse_roi(request.args.get('roi'))
+        frame = recognition.crop(frame, roi)
+        timings['decode_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+        started = time.perf_counter()
+        image = recognition.preprocess(frame)
+        timings['preprocess_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+        # A camera held still sends near-identical frames: reuse the last recognition.
+        # The dHash only finds candidates from the same scanner; the binarized
+        # image must match exactly, since the next label of the same product
+        # differs from this one in a few digits only
+        started = time.perf_counter()
+        frame_hash = recognition.dhash(frame)
+        digest = recognition.image_digest(image)
+        scanner = request.headers.get('X-Scanner-Session') or request.remote_addr
+        context = (scanner, recognition.RECOGNIZER, roi, frame.shape)
+        cached = frame_cache.get(context, frame_hash, confirm=lambda entry: entry[0] == digest)
+        timings['hash_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+        distance = None
+        if cached is not None:
+            (_, text, size), distance = cached
+        else:
+            started = time.perf_counter()
+            text = recognition.recognize(image)
+            timings['recognize_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            size = list(image.shape)
+            frame_cache.put(context, frame_hash, (digest, text, size))
+    except recognition.UnsupportedFrameType as e:
+        return jsonify({'error': str(e)}), 415
+    except recognition.FrameError as e:
+        return jsonify({'error': str(e)}), 400
+    except recognition.RecognizerUnavailable as e:
+        return jsonify({'error': f'Recognizer unavailable: {str(e)}'}), 503
+    except RecognizeTimeout:
+        return jsonify({'error': 'Recognition timed out'}), 504
+    except BrokenProcessPool:
+        recognition.shutdown_pool()
+        return jsonify({'error': 'Recognizer worker crashed'}), 503
+    except Exception as e:
+        return jsonify({'error': f'Recognition failed: {str(e)}'}), 500
+
+    batch_number = extract_batch_from_text(text)
+    return jsonify({
+        'batch_found': batch_number is not None,
+        'batch_number': batch_number,
+        'product_info': get_product_info_by_batch(batch_number) if batch_number else None,
+        'text': text,
+        'size': size,
+        'cached': cached is not None,
+        'hash_distance': distance,
+        'timings': timings
+    })
+
+
 def extract_batch_from_text(text):
     """Extract batch number from OCR text - 5開頭的10個字符批次號"""
-    lines = text.split('\n')
-
-    for line in lines:
-        line = line.strip().upper()
-
-        # 精確匹配：以5開頭的10個字符批次號
-        import re
-
-        # 優先匹配：5開頭的10個字符批次號
-        batch_match = re.search(r'\b5[A-Z0-9]{9}\b', line)
-        if batch_match:
-            candidate = batch_match.group(0)
-            # 確保是精確的10個字符且以5開頭
-            if len(candidate) == 10 and candidate.startswith('5'):
-                return candidate
-
-        # 備用模式：查找包含5開頭序列的模式（如果精確匹配失敗）
-        if not batch_match:
-            backup_patterns = [
-                r'5\s+\d{3}\s+\d{3}\s+\d{3}',  # 5 123 456 789 格式（數字）
-                r'5[\s\-]+[A-Z0-9]{3}[\s\-]+[A-Z0-9]{3}[\s\-]+[A-Z0-9]{3}',  # 5-ABC-DEF-GHI 格式
-            ]
-
-            for pattern in backup_patterns:
-                match = re.search(pattern, line)
-                if match:
-                    # 清理匹配結果
-                    candidate = re.sub(r'[\s\-]', '', match.group(0))
-                    if len(candidate) == 10 and candidate.startswith('5') and candidate[1:].isalnum():
-                        return candidate
+    # One pass of the compiled multi-format scanner (see batch_scanner.py)
+    return find_batch_number(text)
 
-    return None
+def product_info_json(batch_number, product):
+    """Shape a batch lookup result the way the URL extraction endpoints return it"""
+    if product:
+        return {
+            'found': True,
+            'name': product['name'],
+            'batch_number': product['batch_number'],
+            'product_code': product['code'],
+            'quantity': product['quantity']
+        }
+    return {
+        'found': False,
+        'batch_number': batch_number
+    }
 
 def get_product_info_by_batch(batch_number):
     """Get product information by batch number"""
     try:
-        product = get_product_by_batch(batch_number)
-        if product:
-            return {
-                'found': True,
-                'name': product['name'],
-                'batch_number': product['batch_number'],
-                'product_code': product['code'],
-                'quantity': product['quantity']
-            }
-        else:
-            return {
-                'found': False,
-                'batch_number': batch_number
-            }
+        return product_info_json(batch_number, get_product_by_batch(batch_number))
     except Exception as e:
         return {
             'found': False,
@@ -587,6 +1718,46 @@ def get_product_info_by_batch(batch_number):
             'error': str(e)
         }
 
+# Serving entry points (wsgi.py / gunicorn.conf.py)
+def create_app():
+    """Application factory for WSGI servers: apply migrations once, then return the app.
+
+    The connections opened while migrating are closed again, so workers
+    forked from a preloaded master never share a database connection.
+    """
+    init_db()
+    reset_db_pool()
+    return app
+
+def init_worker():
+    """Per-worker setup right after a prefork server forks.
+
+    Pools, clients, threads and locks copied from the master belong to it:
+    they are dropped (never closed or flushed) and rebuilt on first use.
+    """
+    global _db_pool, _db_pool_lock, _http_client, _http_client_lock
+    global _stock_buffer, _stock_flush_pool, _stock_buffer_lock, _resolver_lock
+    global _event_broker, _event_broker_lock
+    _db_pool, _db_pool_lock = None, threading.Lock()
+    _http_client, _http_client_lock = None, threading.Lock()
+    _stock_buffer, _stock_flush_pool, _stock_buffer_lock = None, None, threading.Lock()
+    _event_broker, _event_broker_lock = None, threading.Lock()
+    _resolver_lock = threading.Lock()
+    reset_batch_resolver()
+    recognition.forget_pool()
+    products_response_cache.clear()
+    batch_lookup_cache.clear()
+    frame_cache.clear()
+
+def shutdown_worker():
+    """Flush queued stock-ins, end event streams and release pools when a worker exits"""
+    close_stock_buffer()
+    reset_event_broker()
+    reset_db_pool()
+    reset_http_client()
+    recognition.shutdown_pool()
+
+
 if __name__ == "__main__":
     # Create templates directory if it doesn't exist
     os.makedirs('templates', exist_ok=True)
@@ -599,5 +1770,6 @@ if __name__ == "__main__":
         print(f"Database initialization error: {e}")
         # Continue anyway - tables might already exist
 
+    # Development server only; production runs gunicorn -c gunicorn.conf.py wsgi:app
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)  
\ No newline at end of file
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+容錯批次號解析：把 OCR 候選字串對應到已註冊的批次號
+
+OCR 常把 O/0、I/1、S/5、B/8 等字元互相認錯。索引以「混淆正規化」後的
+形式為鍵；找不到時再以分段索引做有上限的編輯距離搜尋，並回傳信心分數。
+"""
+
+import os
+import re
+import threading
+from typing import NamedTuple
+
+MAX_DISTANCE = int(os.environ.get('BATCH_RESOLVE_MAX_DISTANCE', 1))
+
+# Each OCR confusion class collapses onto one representative character
+CONFUSIONS = {'O': '0', 'Q': '0', 'D': '0', 'I': '1', 'L': '1', 'S': '5', 'B': '8', 'Z': '2', 'G': '6'}
+_NORMALIZE = str.maketrans(CONFUSIONS)
+_ALPHABET = sorted(set('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'.translate(_NORMALIZE)))
+_NOISE = re.compile(r'[\s\-_.]')
+
+
+def clean(candidate):
+    """Upper-case and drop the separators OCR leaves inside a code"""
+    return _NOISE.sub('', candidate.upper())
+
+
+def normalize(code):
+    return code.translate(_NORMALIZE)
+
+
+def _levenshtein(a, b, limit):
+    """Edit distance, or limit + 1 once it is certain to exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _bucket_add(index, key, value):
+    bucket = index.get(key)
+    if bucket is None:
+        index[key] = value  # most buckets hold one value: store it bare
+    elif isinstance(bucket, list):
+        if value not in bucket:
+            bucket.append(value)
+    elif bucket != value:
+        index[key] = [bucket, value]
+
+
+def _bucket_remove(index, key, value):
+    bucket = index.get(key)
+    if bucket is None:
+        return
+    if isinstance(bucket, list):
+        if value in bucket:
+            bucket.remove(value)
+        if len(bucket) == 1:
+            index[key] = bucket[0]
+    elif bucket == value:
+        del index[key]
+
+
+def _bucket_values(bucket):
+    if bucket is None:
+        return ()
+    return bucket if isinstance(bucket, list) else (bucket,)
+
+
+class Resolution(NamedTuple):
+    candidate: str
+    batch_number: object  # None when nothing is close enough
+    confidence: float
+    method: str  # exact, confusion, edit or none
+    distance: int
+    alternatives: list
+
+
+class BatchResolver:
+    """In-memory index of registered batch numbers for OCR-tolerant lookup.
+
+    _by_normal maps a normalized form to its batch number(s). Edit-distance
+    search splits normalized codes into max_distance + 1 segments: a code
+    within max_distance substitutions of the query matches at least one
+    segment exactly, so only codes sharing a segment are compared.
+    Insertions and deletions are handled by enumerating the query variants.
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE, code_length=10):
+        self.max_distance = max_distance
+        self.code_length = code_length
+        segments = max_distance + 1
+        edges = [code_length * i // segments for i in range(segments + 1)]
+        self._segments = list(zip(edges, edges[1:]))
+        self._by_normal = {}
+        self._by_segment = {}
+        self._lock = threading.RLock()
+        self.size = 0
+
+    def _segment_keys(self, normal):
+        return [f'{i}:{normal[lo:hi]}' for i, (lo, hi) in enumerate(self._segments)]
+
+    def add(self, batch_number):
+        with self._lock:
+            normal = normalize(batch_number)
+            if batch_number in _bucket_values(self._by_normal.get(normal)):
+                return
+            _bucket_add(self._by_normal, normal, batch_number)
+            self.size += 1
+            if len(normal) == self.code_length:
+                for key in self._segment_keys(normal):
+                    _bucket_add(self._by_segment, key, normal)
+
+    def remove(self, batch_number):
+        with self._lock:
+            normal = normalize(batch_number)
+            if batch_number not in _bucket_values(self._by_normal.get(normal)):
+                return
+            _bucket_remove(self._by_normal, normal, batch_number)
+            self.size -= 1
+            if normal not in self._by_normal and len(normal) == self.code_length:
+                for key in self._segment_keys(normal):
+                    _bucket_remove(self._by_segment, key, normal)
+
+    def rename(self, old, new):
+        with self._lock:
+            self.remove(old)
+            self.add(new)
+
+    def _near_normals(self, normal, limit):
+        """Registered normalized forms within `limit` edits of normal, as {form: distance}"""
+        found = {}
+        if len(normal) == self.code_length:
+            for key in self._segment_keys(normal):
+                for other in _bucket_values(self._by_segment.get(key)):
+                    if other not in found:
+                        distance = _levenshtein(normal, other, limit)
+                        if distance <= limit:
+                            found[other] = distance
+        elif limit and abs(len(normal) - self.code_length) == 1:
+            # One character too many or too few: try every single deletion/insertion
+            if len(normal) > self.code_length:
+                variants = {normal[:i] + normal[i + 1:] for i in range(len(normal))}
+            else:
+                variants = {normal[:i] + ch + normal[i:] for i in range(len(normal) + 1) for ch in _ALPHABET}
+            for variant in variants:
+                if variant in self._by_normal:
+                    found[variant] = 1
+                elif limit > 1:
+                    for other, distance in self._near_normals(variant, limit - 1).items():
+                        found[other] = min(found.get(other, limit), distance + 1)
+        return found
+
+    def resolve(self, candidate):
+        """Best registered batch number for one OCR candidate"""
+        code = clean(candidate)
+        normal = normalize(code)
+        with self._lock:
+            exact = _bucket_values(self._by_normal.get(normal))
+            if code in exact:
+                return Resolution(candidate, code, 1.0, 'exact', 0, [])
+            if exact:
+                # Same normalized form: rank by how many characters differ before normalizing
+                ranked = sorted((sum(a != b for a, b in zip(code, other)), other) for other in exact)
+                confused, best = ranked[0]
+                alternatives = [other for count, other in ranked[1:] if count == confused]
+                confidence = max(0.7, 1.0 - 0.05 * confused)
+                if alternatives:
+                    confidence /= 2
+                return Resolution(candidate, best, round(confidence, 3), 'confusion', 0, alternatives)
+
+            near = self._near_normals(normal, self.max_distance)
+            if not near:
+                return Resolution(candidate, None, 0.0, 'none', 0, [])
+            distance = min(near.values())
+            matches = sorted(number for other, d in near.items() if d == distance
+                             for number in _bucket_values(self._by_normal.get(other)))
+        confidence = max(0.1, 0.75 - 0.25 * (distance - 1))
+        if len(matches) > 1:
+            confidence /= len(matches)
+        return Resolution(candidate, matches[0], round(confidence, 3), 'edit', distance, matches[1:])
+
+    def status(self):
+        with self._lock:
+            return {'size': self.size, 'max_distance': self.max_distance}
+
+
+def build_resolver(batch_numbers, max_distance=MAX_DISTANCE):
+    resolver = BatchResolver(max_distance)
+    for batch_number in batch_numbers:
+        resolver.add(batch_number)
+    return resolver
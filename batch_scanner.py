@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+批次號識別引擎：多種批次號格式編譯成單一掃描器，一次掃描整段文字
+
+每種格式是一個正則表達式（作用於轉成大寫的文字）。所有格式合併成一個
+pattern：先以格式的首字元（預設為 5）做快速定位，再在該位置依優先順序
+嘗試各格式，因此相鄰或重疊的不同格式都能被找到。
+"""
+
+import json
+import os
+import re
+import threading
+from typing import NamedTuple
+
+_SEPARATORS = re.compile(r'[\s\-]')
+
+
+def strip_separators(raw):
+    """Default normalizer: drop spaces and hyphens (5-ABC-DEF-GHI -> 5ABCDEFGHI)"""
+    return _SEPARATORS.sub('', raw)
+
+
+def is_standard_batch(value):
+    """Default validator: 10 alphanumeric characters starting with 5"""
+    return len(value) == 10 and value.startswith('5') and value[1:].isalnum()
+
+
+class BatchFormat(NamedTuple):
+    name: str
+    pattern: str
+    lead: str = '5'  # characters a match can start with
+    normalize: object = strip_separators
+    validate: object = is_standard_batch
+
+
+class BatchMatch(NamedTuple):
+    format: str
+    offset: int  # position in the upper-cased text
+    raw: str
+    value: str
+    priority: int
+
+
+# Whitespace inside one line: \s without the newline
+_GAP = r'[^\S\n]+'
+_SEP = r'(?:[^\S\n]|-)+'
+
+DEFAULT_FORMATS = (
+    # 5開頭的10個字符批次號（獨立序列）
+    BatchFormat('standard', r'\b5[A-Z0-9]{9}\b'),
+    # 5 123 456 789 格式（數字）
+    BatchFormat('spaced', rf'5{_GAP}\d{{3}}{_GAP}\d{{3}}{_GAP}\d{{3}}'),
+    # 5-ABC-DEF-GHI 格式
+    BatchFormat('dashed', rf'5{_SEP}[A-Z0-9]{{3}}{_SEP}[A-Z0-9]{{3}}{_SEP}[A-Z0-9]{{3}}'),
+)
+
+_lock = threading.Lock()
+_formats = list(DEFAULT_FORMATS)
+_scanner = None  # (compiled pattern, formats) swapped atomically on registration
+
+
+def _compile(formats):
+    leads = sorted({ch for fmt in formats for ch in fmt.lead})
+    lead = re.escape(leads[0]) if len(leads) == 1 else '[' + ''.join(re.escape(ch) for ch in leads) + ']'
+    alternation = '|'.join(f'(?P<f{i}>{fmt.pattern})' for i, fmt in enumerate(formats))
+    # Consume one lead character so the engine can jump between candidates with a
+    # fast literal search, then look back at that position and try every format
+    # in priority order. Nothing beyond the lead character is consumed, so
+    # overlapping matches of different formats are all reported.
+    return re.compile(f'{lead}(?<=(?=(?:{alternation})){lead})')
+
+
+def _get_scanner():
+    global _scanner
+    scanner = _scanner
+    if scanner is None:
+        with _lock:
+            if _scanner is None:
+                formats = tuple(_formats)
+                _scanner = (_compile(formats), formats)
+            scanner = _scanner
+    return scanner
+
+
+def register_format(name, pattern, lead='5', normalize=strip_separators,
+                    validate=is_standard_batch):
+    """Add a batch-number format after the existing ones (lower priority).
+
+    pattern runs against upper-cased text and must not span lines; lead lists
+    every character a match can start with.
+    """
+    re.compile(pattern)  # fail early on a bad pattern
+    global _scanner
+    with _lock:
+        _formats.append(BatchFormat(name, pattern, lead, normalize, validate))
+        _scanner = None
+
+
+def reset_formats():
+    """Restore the built-in formats"""
+    global _scanner
+    with _lock:
+        _formats[:] = DEFAULT_FORMATS
+        _scanner = None
+
+
+def registered_formats():
+    return [fmt.name for fmt in _get_scanner()[1]]
+
+
+def scan(text):
+    """Yield every batch-number match in text, in offset order"""
+    return _scan_upper(text.upper())
+
+
+def _scan_upper(upper):
+    pattern, formats = _get_scanner()
+    for m in pattern.finditer(upper):
+        index = int(m.lastgroup[1:])
+        fmt = formats[index]
+        raw = m.group(m.lastgroup)
+        value = fmt.normalize(raw)
+        if fmt.validate(value):
+            yield BatchMatch(fmt.name, m.start(), raw, value, index)
+
+
+def find_batch_number(text, start=0, end=None):
+    """Return the batch number the legacy line-by-line extractor would pick.
+
+    The first line containing any match wins; within that line the highest
+    priority format wins, and the leftmost match among equals. Scanning stops
+    at the end of that line.
+
+    Only matches starting at or after `start` and ending by `end` count; the
+    text outside still decides word boundaries, so a streaming caller can
+    search a window without trusting its edges.
+    """
+    upper = text.upper()
+    best = None
+    line_end = None
+    for match in _scan_upper(upper):
+        if match.offset < start:
+            continue
+        if end is not None and match.offset + len(match.raw) > end:
+            break
+        if line_end is None:
+            line_end = upper.find('\n', match.offset)
+            if line_end == -1:
+                line_end = len(upper)
+        elif match.offset >= line_end:
+            break
+        if best is None or match.priority < best.priority:
+            best = match
+    return best.value if best else None
+
+
+def _load_env_formats():
+    """Register extra supplier formats from BATCH_EXTRA_FORMATS.
+
+    The variable holds a JSON list such as
+    [{"name": "supplier_x", "pattern": "\\\\bX[0-9]{8}\\\\b", "lead": "X"}];
+    extra formats accept any non-empty value after separators are removed.
+    """
+    config = os.environ.get('BATCH_EXTRA_FORMATS')
+    if not config:
+        return
+    for entry in json.loads(config):
+        register_format(entry['name'], entry['pattern'], lead=entry.get('lead', '5'),
+                        validate=bool)
+
+
+_load_env_formats()
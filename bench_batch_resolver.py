@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+容錯批次號解析基準測試：建立大量批次號的索引，量測建立時間、記憶體與
+每個 OCR 候選字串（正確、混淆字元、替換一字、漏讀一字）的解析時間
+
+用法: python bench_batch_resolver.py [批次號數量]
+"""
+
+import os
+import random
+import resource
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.dirname(__file__))
+
+from batch_resolver import build_resolver
+
+DIGITS = '0123456789'
+
+
+def misread(number, rng):
+    """One OCR-style mistake, or none"""
+    kind = rng.random()
+    if kind < 0.25:
+        return number
+    if kind < 0.5:
+        return number.replace('0', 'O').replace('8', 'B').replace('1', 'I')
+    position = rng.randrange(1, 10)
+    if kind < 0.75:
+        return number[:position] + rng.choice(DIGITS) + number[position + 1:]
+    return number[:position] + number[position + 1:]
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = random.Random(1)
+    numbers = list({'5' + ''.join(rng.choice(DIGITS) for _ in range(9)) for _ in range(total)})
+
+    print(f'=== 容錯批次號解析基準測試 ({len(numbers)} 個批次號) ===')
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    resolver = build_resolver(numbers)
+    print(f'建立索引: {time.perf_counter() - start:.1f} 秒, '
+          f'約 {(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024:.0f} MB')
+
+    queries = [misread(number, rng) for number in rng.sample(numbers, 2000)]
+    start = time.perf_counter()
+    results = [resolver.resolve(query) for query in queries]
+    per_query = (time.perf_counter() - start) / len(queries) * 1e6
+    print(f'每個候選字串: {per_query:.0f} µs')
+    print('解析方式:', dict(Counter(result.method for result in results)))
+
+
+if __name__ == "__main__":
+    main()
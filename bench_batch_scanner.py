@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+批次號識別基準測試：比較舊版逐行提取與單次掃描引擎
+
+用法: python bench_batch_scanner.py [文字大小MB]
+"""
+
+import random
+import re
+import string
+import sys
+import time
+
+from batch_scanner import find_batch_number
+
+
+def legacy_extract_batch_from_text(text):
+    """舊版 app.extract_batch_from_text（逐行、每行重新搜尋三個 pattern）"""
+    lines = text.split('\n')
+
+    for line in lines:
+        line = line.strip().upper()
+
+        batch_match = re.search(r'\b5[A-Z0-9]{9}\b', line)
+        if batch_match:
+            candidate = batch_match.group(0)
+            if len(candidate) == 10 and candidate.startswith('5'):
+                return candidate
+
+        if not batch_match:
+            backup_patterns = [
+                r'5\s+\d{3}\s+\d{3}\s+\d{3}',
+                r'5[\s\-]+[A-Z0-9]{3}[\s\-]+[A-Z0-9]{3}[\s\-]+[A-Z0-9]{3}',
+            ]
+
+            for pattern in backup_patterns:
+                match = re.search(pattern, line)
+                if match:
+                    candidate = re.sub(r'[\s\-]', '', match.group(0))
+                    if len(candidate) == 10 and candidate.startswith('5') and candidate[1:].isalnum():
+                        return candidate
+
+    return None
+
+
+def make_text(size_mb, seed=1):
+    """Random OCR-like noise with no batch number until the very last line"""
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits.replace('5', '')
+    words = [''.join(rng.choice(alphabet) for _ in range(rng.randint(2, 12))) for _ in range(5000)]
+    lines, size = [], 0
+    while size < size_mb * 1024 * 1024:
+        line = ' '.join(rng.choice(words) for _ in range(10))
+        lines.append(line)
+        size += len(line) + 1
+    lines.append('LOT: 5-ABC-DEF-GHI')
+    return '\n'.join(lines)
+
+
+def best_of(fn, text, rounds=3):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    text = make_text(size_mb)
+    print(f'=== 批次號識別基準測試 ({len(text) / 1024 / 1024:.1f} MB) ===')
+
+    legacy_time, legacy_result = best_of(legacy_extract_batch_from_text, text)
+    engine_time, engine_result = best_of(find_batch_number, text)
+    assert legacy_result == engine_result, (legacy_result, engine_result)
+
+    print(f'舊版逐行提取   {legacy_time * 1000:8.1f} ms  -> {legacy_result}')
+    print(f'單次掃描引擎   {engine_time * 1000:8.1f} ms  -> {engine_result}')
+    print(f'加速 {legacy_time / engine_time:.1f}x')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+目錄搜尋基準測試：建立大量批次的資料庫，量測部分批次號與名稱查詢的回應時間，
+並與沒有索引的 LIKE '%...%' 全表掃描比較
+
+用法: python bench_catalog_search.py [批次數量]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import app as app_module
+from catalog_search import search_catalog
+
+QUERIES = [
+    ('batch_number', '5012'),       # prefix
+    ('batch_number', '50123456'),   # long prefix
+    ('batch_number', '345678'),     # substring
+    ('name', 'product 12'),         # name prefix
+    ('name', 'uct 4242'),           # name substring
+    ('code', 'C42'),                # code prefix
+]
+
+
+def timed(function, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    products = max(total // 100, 1)
+
+    tmpdir = tempfile.TemporaryDirectory()
+    if not app_module.DATABASE_URL:
+        app_module.SQLITE_PATH = os.path.join(tmpdir.name, 'bench.db')
+    app_module.init_db()
+    engine = app_module.get_db_engine()
+
+    print(f'=== 目錄搜尋基準測試 ({engine}, {products} 個產品, {total} 個批次) ===')
+    rng = random.Random(1)
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        start = time.perf_counter()
+        db.executemany(app_module.format_query('INSERT INTO products (name, code) VALUES (?, ?)'),
+                       ((f'Product {i}', f'C{i}') for i in range(products)))
+        ids = [row[0] for row in db.execute('SELECT id FROM products').fetchall()]
+        numbers = {f'5{rng.randrange(10 ** 9):09d}' for _ in range(total)}
+        db.executemany(app_module.format_query(
+            'INSERT INTO batches (product_id, batch_number, quantity) VALUES (?, ?, 1)'),
+            ((rng.choice(ids), number) for number in numbers))
+        db.commit()
+        print(f'建立資料: {time.perf_counter() - start:.1f} 秒')
+
+        print(f'{"欄位":<14} {"查詢":<12} {"索引 ms":>9} {"全表掃描 ms":>12} {"結果":>6}')
+        for field, query in QUERIES:
+            indexed_ms, rows = timed(lambda: search_catalog(db, engine, query, (field,), 20))
+            column = {'batch_number': 'b.batch_number', 'name': 'p.name', 'code': 'p.code'}[field]
+            scan = app_module.format_query(f'''
+                SELECT p.id, b.id FROM products p JOIN batches b ON p.id = b.product_id
+                WHERE LOWER({column}) LIKE ? LIMIT 20''')
+            scan_ms, _ = timed(lambda: db.execute(scan, (f'%{query.lower()}%',)).fetchall(), repeat=3)
+            print(f'{field:<14} {query:<12} {indexed_ms:>9.2f} {scan_ms:>12.1f} {len(rows):>6}')
+
+    app_module.reset_db_pool()
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
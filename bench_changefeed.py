@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+變更紀錄基準測試：建立大量批次的目錄，少量批次入庫/刪除後，比較下載完整
+/api/products 與以 /api/changes 增量同步的傳輸量與時間
+
+用法: python bench_changefeed.py [批次數量] [變動批次數量]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import app as app_module
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def sync(client, since):
+    """Follow the changefeed to its end; returns (bytes, changes, new since)"""
+    transferred, count, cursor = 0, 0, None
+    while True:
+        url = f'/api/changes?since={since}&limit=10000' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        transferred += len(response.get_data())
+        page = response.get_json()
+        count += len(page['changes'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return transferred, count, page['version']
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    changed = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    products = max(total // 100, 1)
+
+    tmpdir = tempfile.TemporaryDirectory()
+    if not app_module.DATABASE_URL:
+        app_module.SQLITE_PATH = os.path.join(tmpdir.name, 'bench.db')
+    app_module.init_db()
+    engine = app_module.get_db_engine()
+
+    print(f'=== 變更紀錄基準測試 ({engine}, {products} 個產品, {total} 個批次, {changed} 個變動) ===')
+    rng = random.Random(1)
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        version = app_module.bump_catalog_version(db)
+        db.executemany(app_module.format_query('INSERT INTO products (name, code) VALUES (?, ?)'),
+                       ((f'Product {i}', f'C{i}') for i in range(products)))
+        ids = [row[0] for row in db.execute('SELECT id FROM products').fetchall()]
+        db.executemany(app_module.format_query(
+            'INSERT INTO batches (product_id, batch_number, quantity) VALUES (?, ?, 1)'),
+            ((rng.choice(ids), f'5{i:09d}') for i in range(total)))
+        for entity, table in (('product', 'products'), ('batch', 'batches')):
+            db.execute(app_module.format_query(f'''INSERT INTO catalog_changes (entity, entity_id, version)
+                                                   SELECT ?, id, ? FROM {table}'''), (entity, version))
+        db.commit()
+
+    client = app_module.app.test_client()
+    full_ms, response = timed(lambda: client.get('/api/products'))
+    full_bytes = len(response.get_data())
+    initial_ms, (initial_bytes, _, since) = timed(lambda: sync(client, 0))
+
+    batch_ids = rng.sample(range(1, total + 1), changed)
+    with app_module.app.app_context():
+        for batch_id in batch_ids[:changed // 2]:
+            app_module.adjust_batch_quantity(1, batch_id=batch_id)
+        for batch_id in batch_ids[changed // 2:]:
+            app_module.delete_batch(batch_id)
+    delta_ms, (delta_bytes, count, _) = timed(lambda: sync(client, since))
+
+    print(f'{"方式":<16} {"位元組":>12} {"毫秒":>10}')
+    print(f'{"完整 /api/products":<16} {full_bytes:>12} {full_ms:>10.1f}')
+    print(f'{"首次同步 since=0":<16} {initial_bytes:>12} {initial_ms:>10.1f}')
+    print(f'{"增量同步":<16} {delta_bytes:>12} {delta_ms:>10.1f}  ({count} 筆變動)')
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
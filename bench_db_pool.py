@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+連線池基準測試：比較 /api/search_product 在有無連線池時的每秒查詢數
+
+用法: python bench_db_pool.py [查詢次數]
+設定 DATABASE_URL 時改用 PostgreSQL（連線成本差異更明顯）。
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import app as app_module
+from db_pool import create_pool
+
+
+def seed(batch_count=1000):
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        product = app_module.add_product(f'Bench Product {time.time()}')
+        for i in range(batch_count):
+            query = app_module.format_query(
+                'INSERT INTO batches (product_id, batch_number, quantity) VALUES (?, ?, ?)')
+            db.execute(query, (product['id'], f'5{i:09d}', 1))
+        db.commit()
+    return [f'5{i:09d}' for i in range(batch_count)]
+
+
+def run(batch_numbers, lookups, pool_size):
+    app_module.reset_db_pool()
+    app_module._db_pool = create_pool(app_module.get_db_engine(),
+                                      app_module.get_db_connection_string(),
+                                      max_size=pool_size)
+    client = app_module.app.test_client()
+
+    start = time.perf_counter()
+    for i in range(lookups):
+        response = client.get(f'/api/search_product/{batch_numbers[i % len(batch_numbers)]}')
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - start
+
+    status = app_module.get_db_pool().status()
+    app_module.reset_db_pool()
+    return lookups / elapsed, status['created']
+
+
+def main():
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    tmpdir = tempfile.TemporaryDirectory()
+    if not app_module.DATABASE_URL:
+        app_module.SQLITE_PATH = os.path.join(tmpdir.name, 'bench.db')
+    app_module.init_db()
+    batch_numbers = seed()
+
+    print(f'=== 連線池基準測試 ({app_module.get_db_engine()}, {lookups} 次查詢) ===')
+    for label, pool_size in (('無連線池 (每請求連線)', 0), ('連線池', 10)):
+        rate, created = run(batch_numbers, lookups, pool_size)
+        print(f'{label:<20} {rate:10.0f} 查詢/秒   建立連線 {created} 次')
+
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+回應層基準測試：建立大量批次的目錄，比較 /api/products 以標準庫 json 與 orjson
+序列化的時間，以及各壓縮編碼的傳輸量與時間
+
+用法: python bench_responses.py [批次數量]
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import app as app_module
+import responses
+from flask.json.provider import DefaultJSONProvider
+
+
+def timed(function, repeat=3):
+    """Best of a few runs, in milliseconds"""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    products = max(total // 100, 1)
+
+    tmpdir = tempfile.TemporaryDirectory()
+    if not app_module.DATABASE_URL:
+        app_module.SQLITE_PATH = os.path.join(tmpdir.name, 'bench.db')
+    app_module.init_db()
+    engine = app_module.get_db_engine()
+
+    print(f'=== 回應層基準測試 ({engine}, {products} 個產品, {total} 個批次) ===')
+    rng = random.Random(1)
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        app_module.bump_catalog_version(db)
+        db.executemany(app_module.format_query('INSERT INTO products (name, code) VALUES (?, ?)'),
+                       ((f'產品 {i}', f'C{i}') for i in range(products)))
+        ids = [row[0] for row in db.execute('SELECT id FROM products').fetchall()]
+        db.executemany(app_module.format_query(
+            'INSERT INTO batches (product_id, batch_number, quantity) VALUES (?, ?, ?)'),
+            ((rng.choice(ids), f'5{i:09d}', rng.randint(0, 500)) for i in range(total)))
+        db.commit()
+
+    client = app_module.app.test_client()
+    body = client.get('/api/products').get_data()
+    rows = json.loads(body)
+
+    print(f'{"序列化":<12} {"位元組":>12} {"毫秒":>10}')
+    app = app_module.app
+    fast = app.json
+    with app.app_context():
+        for name, provider in (('json', DefaultJSONProvider(app)), ('orjson', fast)):
+            app.json = provider
+            ms, response = timed(lambda: app_module.jsonify(rows))
+            print(f'{name:<12} {len(response.get_data()):>12} {ms:>10.1f}')
+    app.json = fast
+
+    print(f'\n{"編碼":<12} {"位元組":>12} {"毫秒":>10}')
+    print(f'{"identity":<12} {len(body):>12} {0:>10.1f}')
+    for encoding in responses.ENCODINGS:
+        if encoding not in responses.ENCODERS:
+            print(f'{encoding:<12} {"未安裝":>12}')
+            continue
+        ms, compressed = timed(lambda: responses.compress_body(body, encoding))
+        print(f'{encoding:<12} {len(compressed):>12} {ms:>10.1f}')
+
+    print(f'\n{"GET /api/products":<24} {"位元組":>12} {"毫秒":>10}')
+    for label, headers in (('identity', {}), ('Accept-Encoding: gzip', {'Accept-Encoding': 'gzip'})):
+        # Large bodies are compressed lazily as they are sent, so time the read too
+        ms, data = timed(lambda: client.get('/api/products', headers=headers).get_data())
+        print(f'{label:<24} {len(data):>12} {ms:>10.1f}')
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+批量查詢基準測試：比較逐筆 /api/search_product 與一次 POST /api/search_products
+
+用法: python bench_search_products.py [批次號數量]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(__file__))
+
+import app as app_module
+
+
+def seed(batch_count):
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        product = app_module.add_product('Bench Product')
+        query = app_module.format_query(
+            'INSERT INTO batches (product_id, batch_number, quantity) VALUES (?, ?, ?)')
+        db.executemany(query, [(product['id'], f'5{i:09d}', 1) for i in range(0, batch_count * 2, 2)])
+        db.commit()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    tmpdir = tempfile.TemporaryDirectory()
+    if not app_module.DATABASE_URL:
+        app_module.SQLITE_PATH = os.path.join(tmpdir.name, 'bench.db')
+    app_module.init_db()
+    seed(count)
+    client = app_module.app.test_client()
+    # Every other number exists, so half the lookups are misses
+    numbers = [f'5{i:09d}' for i in range(count)]
+
+    print(f'=== 批量查詢基準測試 ({app_module.get_db_engine()}, {count} 個批次號) ===')
+
+    single = min(count, 5000)
+    start = time.perf_counter()
+    for number in numbers[:single]:
+        client.get(f'/api/search_product/{number}')
+    per_lookup = (time.perf_counter() - start) / single
+    print(f'逐筆查詢      {per_lookup * count:8.2f} 秒 (由 {single} 筆推估)')
+
+    body = '\n'.join(numbers).encode()
+
+    def bulk():
+        response = client.post('/api/search_products', data=body, content_type='text/plain',
+                               buffered=False)
+        return sum(len(part) for part in response.response)
+
+    start = time.perf_counter()
+    size = bulk()
+    elapsed = time.perf_counter() - start
+
+    # Separate run: tracemalloc slows allocation down too much to time with it on
+    tracemalloc.start()
+    bulk()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'批量查詢      {elapsed:8.2f} 秒   回應 {size / 1e6:.1f} MB   峰值記憶體 {peak / 1e6:.1f} MB')
+
+    app_module.reset_db_pool()
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+正式環境負載測試：以不同 worker 數啟動 gunicorn，多個用戶端程序同時查詢批次號，
+量測每秒請求數隨 worker（核心）數的變化
+
+用法: python bench_serving.py [最大 worker 數] [每輪秒數]
+"""
+
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.append(os.path.dirname(__file__))
+
+PORT = 5099
+BATCHES = 1000
+CLIENT_PROCESSES = max(4, multiprocessing.cpu_count())
+
+
+def seed(path):
+    os.environ['SQLITE_PATH'] = path
+    import app as app_module
+    app_module.SQLITE_PATH = path
+    app_module.init_db()
+    with app_module.app.app_context():
+        product = app_module.add_product('Load Test')
+        for i in range(BATCHES):
+            app_module.add_batch_to_product(product['id'], f'5{i:09d}')
+    app_module.reset_db_pool()
+
+
+def client(duration, counter):
+    session = requests.Session()
+    done, i = 0, os.getpid()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        i += 7
+        response = session.get(f'http://127.0.0.1:{PORT}/api/search_product/5{i % BATCHES:09d}')
+        if response.status_code == 200:
+            done += 1
+    with counter.get_lock():
+        counter.value += done
+
+
+def wait_until_up(timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{PORT}/api/cache_stats', timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start')
+
+
+def run(workers, duration, db_path):
+    env = dict(os.environ, SQLITE_PATH=db_path, PORT=str(PORT), WEB_CONCURRENCY=str(workers))
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up()
+        counter = multiprocessing.Value('i', 0)
+        clients = [multiprocessing.Process(target=client, args=(duration, counter))
+                   for _ in range(CLIENT_PROCESSES)]
+        for p in clients:
+            p.start()
+        for p in clients:
+            p.join()
+        return counter.value / duration
+    finally:
+        server.terminate()
+        server.wait(30)
+
+
+def main():
+    cores = multiprocessing.cpu_count()
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else cores * 2
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(tmpdir.name, 'bench.db')
+    seed(db_path)
+
+    print(f'=== gunicorn 負載測試 ({cores} 核心, {CLIENT_PROCESSES} 個用戶端程序, 每輪 {duration:g} 秒) ===')
+    print(f'{"workers":>8} {"請求/秒":>10}')
+    workers = 1
+    while workers <= max_workers:
+        print(f'{workers:>8} {run(workers, duration, db_path):>10.0f}')
+        workers *= 2
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
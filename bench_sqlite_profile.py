@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+SQLite 設定基準測試：並行入庫（寫）與批次號查詢（讀），
+比較舊預設（rollback journal、synchronous=FULL）與正式環境設定
+
+用法: python bench_sqlite_profile.py [秒數] [寫入執行緒] [讀取執行緒]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+from db_pool import SQLITE_PRAGMAS, sqlite_connector
+
+# What get_db() used before the profile: Python's defaults plus foreign keys
+LEGACY_PRAGMAS = (('journal_mode', 'DELETE'), ('synchronous', 'FULL'), ('foreign_keys', 'ON'))
+
+BATCHES = 10000
+
+
+def seed(path, pragmas):
+    conn = sqlite_connector(path, pragmas)()
+    conn.execute('CREATE TABLE batches (id INTEGER PRIMARY KEY, batch_number TEXT UNIQUE, quantity INTEGER)')
+    conn.executemany('INSERT INTO batches (batch_number, quantity) VALUES (?, 0)',
+                     [(f'5{i:09d}',) for i in range(BATCHES)])
+    conn.commit()
+    conn.close()
+
+
+def run(pragmas, seconds, writers, readers):
+    tmpdir = tempfile.TemporaryDirectory()
+    path = os.path.join(tmpdir.name, 'bench.db')
+    seed(path, pragmas)
+    counts = {'writes': 0, 'reads': 0, 'locked': 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def worker(write, offset):
+        conn = sqlite_connector(path, pragmas)()
+        done = locked = 0
+        i = offset
+        while time.perf_counter() < stop:
+            i = (i + 7919) % BATCHES
+            try:
+                if write:
+                    conn.execute('UPDATE batches SET quantity = quantity + 1 WHERE batch_number = ?',
+                                 (f'5{i:09d}',))
+                    conn.commit()
+                else:
+                    conn.execute('SELECT quantity FROM batches WHERE batch_number = ?',
+                                 (f'5{i:09d}',)).fetchone()
+                done += 1
+            except sqlite3.OperationalError:
+                conn.rollback()
+                locked += 1
+        conn.close()
+        with lock:
+            counts['writes' if write else 'reads'] += done
+            counts['locked'] += locked
+
+    threads = [threading.Thread(target=worker, args=(True, n)) for n in range(writers)]
+    threads += [threading.Thread(target=worker, args=(False, n)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tmpdir.cleanup()
+    return {key: value / seconds if key != 'locked' else value for key, value in counts.items()}
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    print(f'=== SQLite 設定基準測試 ({seconds:g} 秒, {writers} 寫 / {readers} 讀) ===')
+    for label, pragmas in (('舊預設', LEGACY_PRAGMAS), ('正式環境設定', SQLITE_PRAGMAS)):
+        result = run(pragmas, seconds, writers, readers)
+        print(f'{label:<12} 寫 {result["writes"]:8.0f}/秒   讀 {result["reads"]:8.0f}/秒   '
+              f'database is locked {result["locked"]} 次')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+庫存延後寫入基準測試：多個掃描器同時對少數批次入庫，比較逐筆提交與
+合併寫入的掃描吞吐量與每秒提交次數
+
+用法: python bench_write_behind.py [掃描器數量] [每個掃描器的掃描次數]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import app as app_module
+
+HOT_BATCHES = 4
+
+
+def run(scanners, scans_each, write_behind):
+    tmpdir = tempfile.TemporaryDirectory()
+    if not app_module.DATABASE_URL:
+        app_module.SQLITE_PATH = os.path.join(tmpdir.name, 'bench.db')
+    app_module.STOCK_WRITE_BEHIND = write_behind
+    app_module.reset_db_pool()
+    app_module.init_db()
+    with app_module.app.app_context():
+        product = app_module.add_product('Bench Product')
+        batch_ids = [app_module.add_batch_to_product(product['id'], f'51000000{i:02d}', 0)['id']
+                     for i in range(HOT_BATCHES)]
+
+    def scanner(index):
+        client = app_module.app.test_client()
+        for scan in range(scans_each):
+            batch_id = batch_ids[(index + scan) % HOT_BATCHES]
+            response = client.post(f'/api/batches/{batch_id}/stock', json={'delta': 1, 'source': 'scan'})
+            assert response.status_code == 200, response.get_data()
+
+    threads = [threading.Thread(target=scanner, args=(i,)) for i in range(scanners)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    buffer = app_module._stock_buffer
+    flushes = buffer.status()['flushes'] if buffer else 0
+    app_module.close_stock_buffer()  # the tail of the queue is part of the cost
+    elapsed = time.perf_counter() - start
+    flushes += 1 if buffer else 0
+
+    with app_module.app.app_context():
+        total = app_module.get_db().execute('SELECT SUM(quantity) FROM batches').fetchone()[0]
+    assert total == scanners * scans_each, total
+    commits = flushes if write_behind else scanners * scans_each
+    app_module.reset_db_pool()
+    tmpdir.cleanup()
+    return scanners * scans_each / elapsed, commits / elapsed
+
+
+def main():
+    scanners = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    scans_each = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    print(f'=== 庫存延後寫入基準測試 ({app_module.get_db_engine()}, {scanners} 個掃描器 x {scans_each} 次, '
+          f'{HOT_BATCHES} 個熱門批次) ===')
+    print(f'{"模式":<10} {"掃描/秒":>10} {"提交/秒":>10}')
+    for label, write_behind in (('逐筆提交', False), ('合併寫入', True)):
+        scans_per_second, commits_per_second = run(scanners, scans_each, write_behind)
+        print(f'{label:<10} {scans_per_second:>10.0f} {commits_per_second:>10.0f}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+批次大量匯入：串流解析 CSV / NDJSON，並以分段交易寫入資料庫
+"""
+
+import csv
+import io
+import json
+import os
+
+# 500 keeps each IN (...) list under SQLite's historical 999-variable limit
+CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 500))
+
+
+def is_valid_batch_number(batch_number):
+    """Batch numbers are 10 characters starting with 5"""
+    return isinstance(batch_number, str) and batch_number.startswith('5') and len(batch_number) == 10
+
+
+def _iter_raw_lines(stream, block_size=64 * 1024):
+    """Split a binary stream into lines, reading it in blocks.
+
+    Per-line readline() on a WSGI input stream costs far more than the
+    line itself; block reads keep large uploads fast and memory bounded.
+    """
+    if not hasattr(stream, 'read'):
+        yield from stream
+        return
+    pending = b''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        lines = (pending + block).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
+
+
+def iter_lines(stream):
+    """Decode a binary stream line by line without reading it all"""
+    first = True
+    for raw in _iter_raw_lines(stream):
+        line = raw.decode('utf-8', errors='replace') if isinstance(raw, bytes) else raw
+        if first:
+            line = line.lstrip('\ufeff')  # Excel-exported CSV starts with a BOM
+            first = False
+        yield line
+
+
+def parse_csv(lines, default_product_id=None):
+    """Yield (line, fields) from CSV with an optional header row.
+
+    Without a header the columns are product_id,batch_number[,quantity],
+    or a lone batch_number column when default_product_id is given.
+    """
+    reader = csv.reader(lines)
+    columns = None
+    for row in reader:
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        cells = [cell.strip() for cell in row]
+
+        if columns is None:
+            lowered = [cell.lower() for cell in cells]
+            if 'batch_number' in lowered:
+                columns = lowered
+                continue
+            if len(cells) == 1 and default_product_id is not None:
+                columns = ['batch_number']
+            else:
+                columns = ['product_id', 'batch_number', 'quantity'][:max(len(cells), 2)]
+
+        yield reader.line_num, dict(zip(columns, cells))
+
+
+def parse_ndjson(lines):
+    """Yield (line, fields) from newline-delimited JSON objects"""
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            yield line_num, None
+            continue
+        yield line_num, fields if isinstance(fields, dict) else None
+
+
+def validate_rows(parsed, default_product_id=None):
+    """Turn parsed fields into (line, product_id, batch_number, quantity) or a reject"""
+    for line_num, fields in parsed:
+        if fields is None:
+            yield line_num, None, 'Malformed row'
+            continue
+
+        batch_number = str(fields.get('batch_number') or '').strip()
+        if not is_valid_batch_number(batch_number):
+            yield line_num, batch_number, 'Batch number must be 10 characters starting with 5'
+            continue
+
+        try:
+            product_id = int(fields.get('product_id') or default_product_id)
+            quantity = fields.get('quantity')
+            quantity = 1 if quantity in (None, '') else int(quantity)
+        except (TypeError, ValueError):
+            yield line_num, batch_number, 'Product ID and quantity must be integers'
+            continue
+        if quantity < 0:
+            yield line_num, batch_number, 'Quantity must be a non-negative integer'
+            continue
+
+        yield line_num, batch_number, (product_id, quantity)
+
+
+def insert_chunk_sqlite(db, rows, before_commit=None):
+    """Insert one chunk in a single write transaction with executemany.
+
+    Returns (inserted_batch_numbers, problems) where problems are
+    (line, batch_number, status, reason).
+    """
+    problems = []
+    if db.in_transaction:
+        db.commit()
+    # Take the write lock up front so the duplicate check and the insert see the same data
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        numbers = [row[2] for row in rows]
+        product_ids = sorted({row[1] for row in rows})
+        existing = {r[0] for r in db.execute(
+            f'SELECT batch_number FROM batches WHERE batch_number IN ({",".join("?" * len(numbers))})',
+            numbers)}
+        known_products = {r[0] for r in db.execute(
+            f'SELECT id FROM products WHERE id IN ({",".join("?" * len(product_ids))})',
+            product_ids)}
+
+        to_insert = []
+        for line_num, product_id, batch_number, quantity in rows:
+            if batch_number in existing:
+                problems.append((line_num, batch_number, 'duplicate', 'Batch number already exists'))
+            elif product_id not in known_products:
+                problems.append((line_num, batch_number, 'rejected', 'Product not found'))
+            else:
+                to_insert.append((product_id, batch_number, quantity))
+
+        db.executemany('INSERT INTO batches (product_id, batch_number, quantity) VALUES (?, ?, ?)',
+                       to_insert)
+        if to_insert and before_commit:
+            before_commit(db, [row[1] for row in to_insert])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return [row[1] for row in to_insert], problems
+
+
+def _copy_escape(value):
+    """Escape a value for COPY's text format"""
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def insert_chunk_postgresql(db, rows, before_commit=None):
+    """Insert one chunk by COPYing into a staging table, then INSERT ... ON CONFLICT"""
+    cursor = db.raw.cursor()
+    try:
+        cursor.execute('''CREATE TEMP TABLE IF NOT EXISTS bulk_batches
+                          (line INTEGER, product_id INTEGER, batch_number TEXT, quantity INTEGER)
+                          ON COMMIT DELETE ROWS''')
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_escape(value) for value in row) + '\n')
+        buffer.seek(0)
+        cursor.copy_expert('COPY bulk_batches (line, product_id, batch_number, quantity) FROM STDIN', buffer)
+
+        cursor.execute('''
+            INSERT INTO batches (product_id, batch_number, quantity)
+            SELECT s.product_id, s.batch_number, s.quantity
+            FROM bulk_batches s JOIN products p ON p.id = s.product_id
+            ON CONFLICT (batch_number) DO NOTHING
+            RETURNING batch_number
+        ''')
+        inserted = {r[0] for r in cursor.fetchall()}
+
+        cursor.execute('''
+            SELECT s.line, s.batch_number, p.id IS NULL
+            FROM bulk_batches s LEFT JOIN products p ON p.id = s.product_id
+            ORDER BY s.line
+        ''')
+        problems = []
+        for line_num, batch_number, missing_product in cursor.fetchall():
+            if batch_number in inserted:
+                continue
+            if missing_product:
+                problems.append((line_num, batch_number, 'rejected', 'Product not found'))
+            else:
+                problems.append((line_num, batch_number, 'duplicate', 'Batch number already exists'))
+        if inserted and before_commit:
+            before_commit(db, sorted(inserted))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return sorted(inserted), problems
+
+
+def bulk_insert_batches(db, engine, validated, chunk_size=None, before_commit=None,
+                        on_inserted=None):
+    """Consume validated rows chunk by chunk and build the import report.
+
+    before_commit(db, batch_numbers) runs inside each chunk's transaction when
+    it inserted rows; on_inserted(batch_numbers) runs after each chunk commits.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    insert_chunk = insert_chunk_postgresql if engine == 'postgresql' else insert_chunk_sqlite
+    report = {'total_rows': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0, 'problems': []}
+
+    def record(line_num, batch_number, status, reason):
+        report['duplicates' if status == 'duplicate' else 'rejected'] += 1
+        report['problems'].append({'line': line_num, 'batch_number': batch_number,
+                                   'status': status, 'reason': reason})
+
+    def flush(chunk):
+        inserted, problems = insert_chunk(db, chunk, before_commit)
+        report['inserted'] += len(inserted)
+        if inserted and on_inserted:
+            on_inserted(inserted)
+        for problem in sorted(problems):
+            record(*problem)
+
+    chunk, seen = [], set()
+    for line_num, batch_number, result in validated:
+        report['total_rows'] += 1
+        if isinstance(result, str):
+            record(line_num, batch_number, 'rejected', result)
+            continue
+        if batch_number in seen:
+            # Earlier chunks are already committed, so the database catches cross-chunk repeats
+            record(line_num, batch_number, 'duplicate', 'Batch number repeated in upload')
+            continue
+        seen.add(batch_number)
+        chunk.append((line_num, result[0], batch_number, result[1]))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk, seen = [], set()
+
+    if chunk:
+        flush(chunk)
+
+    report['problems'].sort(key=lambda p: p['line'])
+    return report
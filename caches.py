@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+程序內快取：依目錄版本號快取已序列化的回應、批次號查詢快取，以及以感知雜湊比對的近似畫面快取
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class VersionedResponseCache:
+    """LRU of serialized response bodies that belong to one catalog version.
+
+    Entries are keyed by (version, key); seeing a newer version drops every
+    older entry at once, so invalidation needs no bookkeeping per write.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self._version:
+                self.stats['misses'] += 1
+                return None
+            body = self._entries.get(key)
+            if body is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return body
+
+    def put(self, version, key, body):
+        with self._lock:
+            if self._version is not None and version < self._version:
+                return  # a slower request finished after the catalog moved on
+            if version != self._version:
+                self._version = version
+                self._entries.clear()
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._entries.clear()
+
+    def status(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries), max_entries=self.max_entries,
+                        version=self._version)
+
+
+_MISSING = object()
+
+
+class LookupCache:
+    """Bounded LRU with TTL, negative-result caching and tag invalidation.
+
+    A cached value of None is a negative result ("not registered") and
+    expires after negative_ttl. Tags let writers drop every entry that
+    depends on a row (e.g. ('product', 3)) without knowing its key.
+    """
+
+    def __init__(self, max_entries=4096, ttl=10.0, negative_ttl=5.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, expires_at, tags)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+        self.generation = 0  # bumped by every invalidation
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0,
+                      'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key, default=_MISSING):
+        """Return the cached value, or default (a private sentinel) on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return default
+            value, expires_at, _ = entry
+            if self._clock() >= expires_at:
+                self._remove(key)
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self.stats['negative_hits' if value is None else 'hits'] += 1
+            return value
+
+    def is_miss(self, value):
+        return value is _MISSING
+
+    def put(self, key, value, tags=(), generation=None):
+        """Cache a value; pass the generation read before querying to skip
+        storing a result that an invalidation may already have outdated"""
+        ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, self._clock() + ttl, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self.generation += 1
+            if key in self._entries:
+                self._remove(key)
+                self.stats['invalidations'] += 1
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            self.generation += 1
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def status(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries), max_entries=self.max_entries,
+                        ttl=self.ttl, negative_ttl=self.negative_ttl)
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class NearDuplicateCache:
+    """LRU keyed by 64-bit perceptual hashes that also matches near duplicates.
+
+    get() finds an entry within max_distance bits (Hamming distance) of the
+    query hash. Hashes are split into max_distance + 1 bands: two hashes that
+    differ in at most max_distance bits agree exactly on at least one band,
+    so only entries sharing a band are compared. context holds everything
+    that must match exactly (e.g. crop and recognizer). Entries older than
+    ttl seconds are ignored and dropped.
+    """
+
+    def __init__(self, max_entries=256, max_distance=4, bits=64, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self._clock = clock
+        bands = max_distance + 1
+        edges = [bits * i // bands for i in range(bands + 1)]
+        self._bands = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self._entries = OrderedDict()  # (context, hash) -> (value, stored at)
+        self._buckets = {}  # (context, band, band value) -> set of hashes
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'near_hits': 0, 'misses': 0, 'rejected': 0, 'expired': 0, 'evictions': 0}
+
+    def _band_keys(self, context, value):
+        return [(context, i, (value >> shift) & mask) for i, (shift, mask) in enumerate(self._bands)]
+
+    def _remove(self, context, value):
+        del self._entries[(context, value)]
+        for key in self._band_keys(context, value):
+            bucket = self._buckets[key]
+            bucket.discard(value)
+            if not bucket:
+                del self._buckets[key]
+
+    def get(self, context, value, confirm=None):
+        """Return (cached value, distance) for the closest match, or None.
+
+        confirm, when given, is called with each candidate's cached value
+        (closest first) and must return True for it to count as a hit.
+        """
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(context, value):
+                candidates.update(self._buckets.get(key, ()))
+            ranked = sorted((distance, candidate) for candidate in candidates
+                            if (distance := (candidate ^ value).bit_count()) <= self.max_distance)
+
+            now = self._clock()
+            for distance, candidate in ranked:
+                cached, stored_at = self._entries[(context, candidate)]
+                if self.ttl is not None and now - stored_at > self.ttl:
+                    self._remove(context, candidate)
+                    self.stats['expired'] += 1
+                    continue
+                if confirm is not None and not confirm(cached):
+                    self.stats['rejected'] += 1
+                    continue
+                self._entries.move_to_end((context, candidate))
+                self.stats['hits' if distance == 0 else 'near_hits'] += 1
+                return cached, distance
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, context, value, result):
+        with self._lock:
+            if (context, value) in self._entries:
+                self._entries.move_to_end((context, value))
+            else:
+                for key in self._band_keys(context, value):
+                    self._buckets.setdefault(key, set()).add(value)
+            self._entries[(context, value)] = (result, self._clock())
+            while len(self._entries) > self.max_entries:
+                old_context, old_value = next(iter(self._entries))
+                self._remove(old_context, old_value)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def status(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries), max_entries=self.max_entries,
+                        max_distance=self.max_distance, ttl=self.ttl)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+目錄搜尋：批次號、產品名稱與代碼的前綴與子字串查詢
+
+前綴查詢走一般 B-tree 索引的範圍掃描；子字串查詢走三字元索引
+（SQLite FTS5 trigram、PostgreSQL pg_trgm，由 migrations.py 建立），
+因此不必掃描整個表。三個字元以下的查詢只做前綴比對。
+"""
+
+# field -> (column expression, how the query is normalized)
+FIELDS = {
+    'batch_number': ('b.batch_number', str.upper),
+    'name': ('LOWER(p.name)', str.lower),
+    'code': ('p.code', str.upper),
+}
+MIN_INFIX_LENGTH = 3  # shortest substring a trigram index can answer
+
+_SELECT = '''SELECT p.id, p.name, p.code, b.id AS batch_id, b.batch_number, b.quantity
+             FROM products p {join} batches b ON p.id = b.product_id'''
+
+
+def _sql(query, engine):
+    return query.replace('?', '%s') if engine == 'postgresql' else query
+
+
+def like_escape(text):
+    """Escape LIKE wildcards in user input (used with ESCAPE '\\')"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _fts_phrase(text):
+    """Quote user input as one FTS5 phrase (trigram phrases match substrings)"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def infix_condition(field, text, engine):
+    """SQL condition (and params) for 'field contains text', served by the trigram index.
+
+    Returns None when text is too short for the index; callers then fall back
+    to a prefix search or a plain LIKE.
+    """
+    column, normalize = FIELDS[field]
+    text = normalize(text)
+    if len(text) < MIN_INFIX_LENGTH:
+        return None
+    if engine == 'postgresql':
+        return f"{column} LIKE ? ESCAPE '\\'", [f'%{like_escape(text)}%']
+    if field == 'batch_number':
+        return 'b.id IN (SELECT rowid FROM batches_fts WHERE batches_fts MATCH ?)', [_fts_phrase(text)]
+    return ('p.id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)',
+            [f'{field} : {_fts_phrase(text)}'])
+
+
+def _prefix_matches(db, engine, field, text, limit):
+    column, _ = FIELDS[field]
+    join = 'JOIN' if field == 'batch_number' else 'LEFT JOIN'
+    query = f'''{_SELECT.format(join=join)}
+                WHERE {column} >= ? AND {column} < ?
+                ORDER BY {column}, p.id, b.batch_number
+                LIMIT ?'''
+    return db.execute(_sql(query, engine), (text, prefix_upper_bound(text), limit)).fetchall()
+
+
+def _infix_matches(db, engine, field, text, limit):
+    condition = infix_condition(field, text, engine)
+    if condition is None:
+        return []
+    sql, params = condition
+    column, _ = FIELDS[field]
+    join = 'JOIN' if field == 'batch_number' else 'LEFT JOIN'
+    # Prefix matches were already returned; no ORDER BY so the scan stops at LIMIT
+    query = f'''{_SELECT.format(join=join)}
+                WHERE {sql} AND NOT ({column} >= ? AND {column} < ?)
+                LIMIT ?'''
+    return db.execute(_sql(query, engine),
+                      (*params, text, prefix_upper_bound(text), limit)).fetchall()
+
+
+def search_catalog(db, engine, query, fields=tuple(FIELDS), limit=20):
+    """Ranked matches for a partial batch number, product name or code.
+
+    Exact matches come first, then prefix matches in index order, then
+    substring matches; within a rank, fields keep the order given. A product
+    matched by name or code appears once per batch, like /api/products rows.
+    Returns a list of dicts with the row plus 'field' and 'match'.
+    """
+    ranked = []
+    seen = set()
+    for field_rank, field in enumerate(fields):
+        _, normalize = FIELDS[field]
+        text = normalize(query.strip())
+        if not text:
+            continue
+        prefix = _prefix_matches(db, engine, field, text, limit)
+        infix = _infix_matches(db, engine, field, text, limit - len(prefix)) if len(prefix) < limit else []
+        for match, rows in (('prefix', prefix), ('infix', infix)):
+            for position, row in enumerate(rows):
+                key = (row['id'], row['batch_id'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                value = row['batch_number'] if field == 'batch_number' else row[field]
+                kind = 'exact' if match == 'prefix' and normalize(value) == text else match
+                rank = {'exact': 0, 'prefix': 1, 'infix': 2}[kind]
+                ranked.append(((rank, field_rank, position), dict(row, field=field, match=kind)))
+    ranked.sort(key=lambda item: item[0])
+    return [row for _, row in ranked[:limit]]
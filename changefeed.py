@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+目錄變更紀錄：每次寫入在同一個交易中把變動的產品/批次記到 catalog_changes，
+每個產品/批次一列，保存最後一次變動時的目錄版本；刪除留下墓碑
+
+GET /api/changes?since=<版本> 依版本順序回傳之後變動過的列（帶目前內容，或墓碑），
+保持同步的用戶端只需傳輸變動的部分。墓碑保留一段時間後清除，清除界線記在
+catalog_version.changes_horizon；since 早於界線的用戶端必須從 since=0 重新同步。
+
+用法: python changefeed.py prune [--days 天數]
+資料庫由 DATABASE_URL（PostgreSQL）或 SQLITE_PATH（預設 products.db）決定。
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from stock_ledger import timestamp_param
+
+# Tombstones older than this are pruned
+RETENTION_DAYS = float(os.environ.get('CHANGEFEED_RETENTION_DAYS', 30))
+PAGE_SIZE = int(os.environ.get('CHANGEFEED_PAGE_SIZE', 1000))
+MAX_PAGE_SIZE = int(os.environ.get('CHANGEFEED_MAX_PAGE_SIZE', 10000))
+
+ENTITIES = ('product', 'batch')
+
+
+class ChangesExpired(Exception):
+    """since is older than the pruning horizon, or newer than the catalog"""
+
+    def __init__(self, since, horizon, version):
+        super().__init__(f'Changes since version {since} are no longer available')
+        self.since = since
+        self.horizon = horizon
+        self.version = version
+
+
+def _sql(query, engine):
+    return query.replace('?', '%s') if engine == 'postgresql' else query
+
+
+_UPSERT = '''INSERT INTO catalog_changes (entity, entity_id, version, deleted) VALUES (?, ?, ?, ?)
+             ON CONFLICT (entity, entity_id) DO UPDATE
+             SET version = excluded.version, deleted = excluded.deleted, changed_at = excluded.changed_at'''
+
+
+def record_changes(db, engine, version, changes):
+    """Log (entity, entity_id, deleted) rows at `version` inside the caller's transaction"""
+    db.executemany(_sql(_UPSERT, engine),
+                   [(entity, entity_id, version, bool(deleted)) for entity, entity_id, deleted in changes])
+
+
+def record_batch_numbers(db, engine, version, batch_numbers):
+    """Log newly inserted batches by number (bulk import)"""
+    if not batch_numbers:
+        return
+    placeholders = ','.join('?' * len(batch_numbers))
+    db.execute(_sql(f'''INSERT INTO catalog_changes (entity, entity_id, version, deleted)
+                        SELECT 'batch', id, ?, ? FROM batches WHERE batch_number IN ({placeholders})
+                        ON CONFLICT (entity, entity_id) DO UPDATE
+                        SET version = excluded.version, deleted = excluded.deleted,
+                            changed_at = excluded.changed_at''', engine),
+               (version, False, *batch_numbers))
+
+
+def check_since(db, engine, since):
+    """Current catalog version, or ChangesExpired when `since` cannot be caught up from"""
+    version, horizon = db.execute('SELECT version, changes_horizon FROM catalog_version WHERE id = 1').fetchone()
+    # since=0 is a full sync and needs no tombstones; a since ahead of the
+    # catalog comes from another (or a restored) database
+    if since > version or (since > 0 and since < horizon):
+        raise ChangesExpired(since, horizon, version)
+    return version
+
+
+def change_json(row):
+    entity, entity_id, version, deleted = row[0], row[1], row[2], bool(row[3])
+    change = {'entity': entity, 'id': entity_id, 'version': version}
+    # A row deleted after it was logged reads as missing; its tombstone follows later
+    if entity == 'product' and not deleted and row[4] is not None:
+        change.update(deleted=False, name=row[4], code=row[5])
+    elif entity == 'batch' and not deleted and row[6] is not None:
+        change.update(deleted=False, product_id=row[6], batch_number=row[7],
+                      quantity=row[8] if row[8] is not None else 0)
+    else:
+        change['deleted'] = True
+    return change
+
+
+def changes_page(db, engine, since, after=None, limit=PAGE_SIZE):
+    """One page of changes after `since`, in (version, entity, id) order.
+
+    Each entity appears once, with its current contents. `after` is the
+    sort key of the last change already seen (from next_key). Returns
+    (changes, next_key); next_key is None on the last page.
+    """
+    if after:
+        condition, params = '(c.version, c.entity, c.entity_id) > (?, ?, ?)', list(after)
+    else:
+        condition, params = 'c.version > ?', [since]
+    rows = db.execute(_sql(f'''
+        SELECT c.entity, c.entity_id, c.version, c.deleted,
+               p.name, p.code, b.product_id, b.batch_number, b.quantity
+        FROM catalog_changes c
+        LEFT JOIN products p ON c.entity = 'product' AND p.id = c.entity_id
+        LEFT JOIN batches b ON c.entity = 'batch' AND b.id = c.entity_id
+        WHERE {condition}
+        ORDER BY c.version, c.entity, c.entity_id
+        LIMIT ?
+    ''', engine), (*params, limit + 1)).fetchall()
+
+    more = len(rows) > limit
+    changes = [change_json(row) for row in rows[:limit]]
+    if not more:
+        return changes, None
+    last = changes[-1]
+    return changes, [last['version'], last['entity'], last['id']]
+
+
+def prune_changes(db, engine, before):
+    """Drop tombstones logged before `before` and advance the horizon past them.
+
+    Returns (tombstones removed, horizon).
+    """
+    cutoff = timestamp_param(before, engine)
+    try:
+        removed = db.execute(_sql('DELETE FROM catalog_changes WHERE deleted = ? AND changed_at < ? RETURNING version',
+                                  engine), (True, cutoff)).fetchall()
+        if removed:
+            newest = max(row[0] for row in removed)
+            db.execute(_sql('UPDATE catalog_version SET changes_horizon = ? WHERE id = 1 AND changes_horizon < ?',
+                            engine), (newest, newest))
+        horizon = db.execute('SELECT changes_horizon FROM catalog_version WHERE id = 1').fetchone()[0]
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(removed), horizon
+
+
+def main():
+    from db_pool import postgres_connector, sqlite_connector
+
+    args = sys.argv[1:]
+    if not args or args[0] != 'prune':
+        print(__doc__)
+        sys.exit(1)
+    days = float(args[args.index('--days') + 1]) if '--days' in args else RETENTION_DAYS
+
+    database_url = os.environ.get('DATABASE_URL')
+    engine = 'postgresql' if database_url else 'sqlite'
+    connect = (postgres_connector(database_url) if database_url
+               else sqlite_connector(os.environ.get('SQLITE_PATH', 'products.db')))
+    db = connect()
+    try:
+        before = datetime.now(timezone.utc) - timedelta(days=days)
+        removed, horizon = prune_changes(db, engine, before)
+        print(f'已清除 {removed} 筆墓碑（{days:g} 天以前），since 早於版本 {horizon} 的用戶端需重新同步')
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
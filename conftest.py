@@ -0,0 +1,114 @@
+"""
+pytest 共用設定：每個測試使用獨立的臨時 SQLite 資料庫
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+
+import app as app_module
+
+
+@pytest.fixture
+def app_db(tmp_path, monkeypatch):
+    """Point the app at a fresh SQLite file with the schema created"""
+    monkeypatch.setattr(app_module, 'SQLITE_PATH', str(tmp_path / 'test_products.db'))
+    app_module.reset_db_pool()
+    app_module.init_db()
+    app_module.reset_http_client()
+    app_module.frame_cache.clear()
+    yield app_module
+    app_module.reset_db_pool()
+    app_module.reset_http_client()
+
+
+@pytest.fixture
+def client(app_db):
+    """Flask test client bound to the temporary database"""
+    return app_db.app.test_client()
+
+
+@pytest.fixture
+def make_batch(app_db):
+    """Factory: create a product with one batch and return the batch id"""
+    def make(quantity=1, batch_number='5123456789', product_name='Stock Test'):
+        with app_db.app.app_context():
+            product = app_db.add_product(product_name)
+            return app_db.add_batch_to_product(product['id'], batch_number, quantity)['id']
+    return make
+
+
+class StubServer:
+    """Local HTTP server whose routes are plain functions taking the request handler"""
+
+    def __init__(self):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.routes = {}
+        self.hits = {}
+        self.connections = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                stub.connections += 1
+                super().setup()
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                stub.hits[path] = stub.hits.get(path, 0) + 1
+                route = stub.routes.get(path)
+                if route is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                route(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self._server.server_address[1]}{path}'
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def send_body(handler, body, status=200, content_type='text/html; charset=utf-8', chunks=None, delay=0):
+    """Reply with body, optionally as several flushed pieces with a pause between them"""
+    import time
+
+    body = body.encode('utf-8') if isinstance(body, str) else body
+    pieces = chunks or [body]
+    handler.send_response(status)
+    handler.send_header('Content-Type', content_type)
+    handler.send_header('Content-Length', str(sum(len(p) for p in pieces)))
+    handler.end_headers()
+    try:
+        for piece in pieces:
+            handler.wfile.write(piece)
+            handler.wfile.flush()
+            if delay:
+                time.sleep(delay)
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # the client stopped reading early
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+資料庫連線池：SQLite 與 PostgreSQL 共用的有上限連線池，
+以及 SQLite 連線的正式環境設定（WAL、PRAGMA、定期 checkpoint）
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Pool limits (overridable through the environment)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+POOL_RECYCLE = float(os.environ.get('DB_POOL_RECYCLE', 3600))
+POOL_PING_INTERVAL = float(os.environ.get('DB_POOL_PING_INTERVAL', 30))
+
+# SQLite profile applied to every new connection, in this order
+SQLITE_PRAGMAS = (
+    ('busy_timeout', os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    ('journal_mode', os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')),
+    ('synchronous', os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+    ('mmap_size', os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    ('cache_size', os.environ.get('SQLITE_CACHE_SIZE', '-20000')),  # negative = KiB
+    ('foreign_keys', os.environ.get('SQLITE_FOREIGN_KEYS', 'ON')),
+    ('wal_autocheckpoint', os.environ.get('SQLITE_WAL_AUTOCHECKPOINT', '1000')),
+    ('journal_size_limit', os.environ.get('SQLITE_JOURNAL_SIZE_LIMIT', str(64 * 1024 * 1024))),
+)
+
+# Checkpoint policy: a PASSIVE checkpoint at most every interval seconds when a
+# connection is returned, TRUNCATE once the WAL file grows past the limit
+SQLITE_CHECKPOINT_INTERVAL = float(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', 30))
+SQLITE_WAL_TRUNCATE_BYTES = int(os.environ.get('SQLITE_WAL_TRUNCATE_BYTES', 64 * 1024 * 1024))
+
+_PRAGMA_VALUE = re.compile(r'^-?[A-Za-z0-9_]+$')
+
+
+class PoolTimeout(Exception):
+    """No connection became available before the checkout timeout"""
+
+
+class PostgresConnection:
+    """Give a psycopg2 connection the sqlite3-style execute() used by app.py"""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def execute(self, query, params=()):
+        import psycopg2.extras
+        cursor = self.raw.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.execute(query, params)
+        return cursor
+
+    def executemany(self, query, seq_of_params):
+        import psycopg2.extras
+        cursor = self.raw.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.executemany(query, seq_of_params)
+        return cursor
+
+    @property
+    def in_transaction(self):
+        import psycopg2.extensions
+        return self.raw.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+
+def apply_sqlite_pragmas(conn, pragmas=SQLITE_PRAGMAS):
+    """Run PRAGMA name = value for each (name, value); values come from config, not users"""
+    for name, value in pragmas:
+        value = str(value)
+        if not _PRAGMA_VALUE.match(value):
+            raise ValueError(f'Invalid value for PRAGMA {name}: {value!r}')
+        conn.execute(f'PRAGMA {name} = {value}').fetchall()
+
+
+def sqlite_connector(path, pragmas=SQLITE_PRAGMAS):
+    """Return a factory for pool-safe SQLite connections with the profile applied"""
+    def connect():
+        # Pooled connections move between worker threads, one holder at a time
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        apply_sqlite_pragmas(conn, pragmas)
+        return conn
+    return connect
+
+
+class CheckpointPolicy:
+    """Checkpoint the WAL from returned connections instead of a background thread.
+
+    wal_autocheckpoint already checkpoints from inside commits; this adds a
+    bounded-frequency PASSIVE checkpoint so a steady read load cannot keep
+    the WAL growing, and a TRUNCATE once the file passes truncate_bytes.
+    """
+
+    def __init__(self, path, interval=SQLITE_CHECKPOINT_INTERVAL,
+                 truncate_bytes=SQLITE_WAL_TRUNCATE_BYTES, clock=time.monotonic):
+        self.wal_path = path + '-wal'
+        self.interval = interval
+        self.truncate_bytes = truncate_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last = clock()
+        self.stats = {'checkpoints': 0, 'truncates': 0, 'busy': 0}
+
+    def __call__(self, conn):
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = self._clock()
+            if now - self._last < self.interval:
+                return
+            self._last = now
+        try:
+            wal_size = os.path.getsize(self.wal_path)
+        except OSError:
+            return  # not in WAL mode, or nothing written yet
+        mode = 'TRUNCATE' if wal_size > self.truncate_bytes else 'PASSIVE'
+        busy, _, _ = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+        with self._lock:
+            self.stats['checkpoints'] += 1
+            if busy:
+                self.stats['busy'] += 1
+            elif mode == 'TRUNCATE':
+                self.stats['truncates'] += 1
+
+    def status(self):
+        with self._lock:
+            return dict(self.stats, interval=self.interval)
+
+
+def postgres_connector(dsn):
+    """Return a factory for wrapped psycopg2 connections"""
+    def connect():
+        import psycopg2
+        return PostgresConnection(psycopg2.connect(dsn))
+    return connect
+
+
+class ConnectionPool:
+    """Bounded pool with per-thread checkout and health checks on reuse.
+
+    A thread that already holds a connection gets the same one back from
+    acquire(); it returns to the pool when the matching release() calls
+    bring the checkout depth back to zero. A max_size of 0 disables pooling:
+    every checkout opens a new connection and every return closes it.
+    """
+
+    def __init__(self, connect, max_size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 recycle=POOL_RECYCLE, ping_interval=POOL_PING_INTERVAL, on_checkin=None):
+        self._connect = connect
+        self._on_checkin = on_checkin  # called with each returned connection, outside any transaction
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._idle = []  # LIFO stack of (conn, created_at, last_used)
+        self._born = {}  # id(conn) -> created_at for checked-out connections
+        self._size = 0
+        self._closed = False
+        self.stats = {'created': 0, 'reused': 0, 'discarded': 0, 'timeouts': 0}
+
+    @property
+    def pooled(self):
+        return self.max_size > 0
+
+    def acquire(self):
+        """Check out a connection for the calling thread"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+
+        conn = self._checkout()
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection checked out by acquire()"""
+        if getattr(self._local, 'conn', None) is conn:
+            self._local.depth -= 1
+            if self._local.depth > 0:
+                return
+            self._local.conn = None
+        self._checkin(conn)
+
+    def dispose(self):
+        """Close every idle connection and refuse further returns"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+        self._local = threading.local()
+
+    def status(self):
+        """Snapshot of pool occupancy and counters"""
+        with self._cond:
+            return dict(self.stats, size=self._size, idle=len(self._idle),
+                        max_size=self.max_size)
+
+    def _checkout(self):
+        if not self.pooled:
+            conn = self._connect()
+            with self._cond:
+                self.stats['created'] += 1
+            self._born[id(conn)] = time.monotonic()
+            return conn
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise PoolTimeout(f'No database connection available within {self.timeout}s')
+                    self._cond.wait(remaining)
+
+            if entry is None:
+                return self._open()
+
+            conn, created_at, last_used = entry
+            if self._is_healthy(conn, created_at, last_used):
+                with self._cond:
+                    self.stats['reused'] += 1
+                self._born[id(conn)] = created_at
+                return conn
+
+            # Stale or broken: drop it and try the next idle slot
+            self._close_quietly(conn)
+            with self._cond:
+                self.stats['discarded'] += 1
+                self._size -= 1
+                self._cond.notify()
+
+    def _open(self):
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.stats['created'] += 1
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _checkin(self, conn):
+        created_at = self._born.pop(id(conn), time.monotonic())
+
+        reusable = self.pooled and not self._closed
+        if reusable:
+            try:
+                # Never hand an open transaction to the next request
+                if conn.in_transaction:
+                    conn.rollback()
+            except Exception:
+                reusable = False
+
+        if reusable and self._on_checkin is not None:
+            try:
+                self._on_checkin(conn)
+            except Exception:
+                pass  # housekeeping must never fail the request
+
+        if not reusable:
+            self._close_quietly(conn)
+            if self.pooled:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def _is_healthy(self, conn, created_at, last_used):
+        now = time.monotonic()
+        if self.recycle and now - created_at > self.recycle:
+            return False
+        if now - last_used < self.ping_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def create_pool(engine, dsn, **kwargs):
+    """Build the pool for the configured database engine"""
+    if engine == 'postgresql':
+        return ConnectionPool(postgres_connector(dsn), **kwargs)
+    kwargs.setdefault('on_checkin', CheckpointPolicy(dsn))
+    return ConnectionPool(sqlite_connector(dsn), **kwargs)
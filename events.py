@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+庫存異動推播（Server-Sent Events）：寫入函式在提交後發布精簡的異動事件，
+所有訂閱者共用同一個環形緩衝區，各自只保存讀取位置。其他程序的寫入由輪詢
+執行緒依目錄版本從 catalog_changes 讀回，轉成同樣的逐筆事件
+
+閒置的訂閱者只是在同一個 Condition 上等待，發布一個事件的成本與訂閱者數量
+無關（每個訂閱者醒來後送出已編碼好的同一段文字）。落後超過緩衝區的訂閱者、
+或帶著其他程序事件 id 重新連線的訂閱者會收到 resync 事件，由用戶端重新載入。
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import islice
+
+# Events kept for subscribers that are behind or reconnect with Last-Event-ID
+BACKLOG = int(os.environ.get('EVENTS_BACKLOG', 1024))
+# Open streams per process; each one holds a server thread while it is idle
+MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 64))
+# Comment frames on idle streams keep proxies open and detect gone clients
+HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15))
+# How often the catalog version is checked for writes made by other processes
+POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 2))
+# Past this many changes from other processes in one poll, clients resync instead
+RELAY_LIMIT = int(os.environ.get('EVENTS_RELAY_LIMIT', 500))
+# Browsers wait this long before reconnecting a dropped stream
+RETRY_MS = int(os.environ.get('EVENTS_RETRY_MS', 3000))
+
+
+def sse_frame(event_id, event, data):
+    """Encode one event in text/event-stream form"""
+    payload = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    return f'id: {event_id}\nevent: {event}\ndata: {payload}\n\n'
+
+
+def change_event(change):
+    """changefeed change -> (event, data) for a write made by another process.
+
+    The change carries the row's current state but not whether it is new,
+    so live rows become product_changed / batch_changed upserts.
+    """
+    if change['deleted']:
+        return f"{change['entity']}_deleted", {'id': change['id']}
+    if change['entity'] == 'product':
+        return 'product_changed', {'id': change['id'], 'name': change['name'], 'code': change['code']}
+    return 'batch_changed', {'id': change['id'], 'product_id': change['product_id'],
+                             'batch_number': change['batch_number'], 'quantity': change['quantity']}
+
+
+class Subscription:
+    """One open stream: a cursor into the broker's ring"""
+
+    def __init__(self, broker, cursor, resync):
+        self._broker = broker
+        self.cursor = cursor
+        self.resync = resync
+        self.closed = False
+
+    def close(self):
+        self._broker._unsubscribe(self)
+
+
+class EventBroker:
+    """Fan-out of change events to SSE subscribers.
+
+    publish() encodes an event once and appends it to a bounded ring;
+    subscribers wait on a shared Condition and send every frame past their
+    cursor. When `poll` is given, a background thread calls it every
+    `poll_interval` seconds while anyone is subscribed. When the catalog
+    version moved, `changes(after, upto, limit)` returns the changefeed rows
+    in that range (or None past `limit`); versions not published here were
+    written by another worker process and are relayed as per-entity events,
+    or as one resync when there are too many.
+    """
+
+    def __init__(self, backlog=BACKLOG, max_subscribers=MAX_SUBSCRIBERS, poll=None, changes=None,
+                 poll_interval=POLL_INTERVAL, relay_limit=RELAY_LIMIT):
+        self.max_subscribers = max_subscribers
+        self.poll_interval = poll_interval
+        self.relay_limit = relay_limit
+        self._poll = poll
+        self._changes = changes
+        self._relayed = None  # catalog version the poller has caught up to
+        self._local = set()  # versions published here after that
+        self._epoch = uuid.uuid4().hex[:8]  # event ids from another process never match
+        self._cond = threading.Condition()
+        self._ring = deque(maxlen=backlog)  # (seq, frame)
+        self._seq = 0
+        self._subscribers = 0
+        self._closed = False
+        self._poller = None
+        self.version = None
+        self.stats = {'published': 0, 'subscribed': 0, 'rejected': 0, 'resyncs': 0, 'polls': 0,
+                      'poll_failures': 0, 'relayed': 0}
+
+    def publish(self, event, data, version=None, relayed=False):
+        """Append an event for every subscriber; returns its id"""
+        with self._cond:
+            if version is not None:
+                if self.version is None or version > self.version:
+                    self.version = version
+                if not relayed and self._relayed is not None and version > self._relayed:
+                    self._local.add(version)
+                data = dict(data, version=version)
+            self._seq += 1
+            event_id = f'{self._epoch}-{self._seq}'
+            self._ring.append((self._seq, sse_frame(event_id, event, data)))
+            self.stats['published'] += 1
+            self._cond.notify_all()
+        return event_id
+
+    def subscribe(self, last_event_id=None):
+        """Open a subscription, or None when the broker is full or closed.
+
+        A Last-Event-ID from this broker resumes after that event when it is
+        still in the ring; any other id asks the client to resync.
+        """
+        with self._cond:
+            if self._closed or self._subscribers >= self.max_subscribers:
+                self.stats['rejected'] += 1
+                return None
+            cursor, resync = self._seq, False
+            if last_event_id:
+                epoch, _, seq = last_event_id.partition('-')
+                oldest = self._ring[0][0] if self._ring else self._seq + 1
+                if epoch == self._epoch and seq.isdigit() and oldest - 1 <= int(seq) <= self._seq:
+                    cursor = int(seq)
+                else:
+                    resync = True
+            self._subscribers += 1
+            self.stats['subscribed'] += 1
+            if self._poll is not None and self._poller is None:
+                self._poller = threading.Thread(target=self._run_poller, name='event-poller', daemon=True)
+                self._poller.start()
+            self._cond.notify_all()  # wake an idle poller
+        return Subscription(self, cursor, resync)
+
+    def _unsubscribe(self, subscription):
+        with self._cond:
+            if not subscription.closed:
+                subscription.closed = True
+                self._subscribers -= 1
+
+    def stream(self, subscription, heartbeat=HEARTBEAT, retry_ms=RETRY_MS):
+        """Yield SSE text for a subscription until it or the broker is closed"""
+        yield f'retry: {retry_ms}\n\n'
+        if subscription.resync:
+            self.stats['resyncs'] += 1
+            yield sse_frame(f'{self._epoch}-{subscription.cursor}', 'resync', {'version': self.version})
+        else:
+            yield sse_frame(f'{self._epoch}-{subscription.cursor}', 'hello', {'version': self.version})
+        while True:
+            frames = []
+            deadline = time.monotonic() + heartbeat
+            with self._cond:
+                # Wakeups for other reasons (subscribes, closes) are not worth a frame
+                while self._seq == subscription.cursor and not self._closed and not subscription.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed or subscription.closed:
+                    return
+                if self._seq != subscription.cursor:
+                    oldest = self._ring[0][0]
+                    if subscription.cursor < oldest - 1:
+                        # Fell behind the ring: the missed events are gone
+                        self.stats['resyncs'] += 1
+                        subscription.cursor = self._seq
+                        frames.append(sse_frame(f'{self._epoch}-{self._seq}', 'resync', {'version': self.version}))
+                    else:
+                        start = subscription.cursor - oldest + 1
+                        frames.extend(frame for _, frame in islice(self._ring, start, None))
+                        subscription.cursor = self._seq
+            # Write outside the lock: a slow client must not hold up the others
+            yield ''.join(frames) if frames else ': keepalive\n\n'
+
+    def _run_poller(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._subscribers == 0:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            try:
+                self._relay(self._poll())
+                self.stats['polls'] += 1
+            except Exception as e:
+                self.stats['poll_failures'] += 1
+                print(f"Event broker version poll failed: {e}")
+            deadline = time.monotonic() + self.poll_interval
+            with self._cond:
+                while not self._closed and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+
+    def _relay(self, version):
+        """Publish the changes other processes made up to `version`"""
+        if version is None:
+            return
+        with self._cond:
+            after = self._relayed
+            if after is None:
+                # Baseline: earlier writes are already in what clients loaded
+                self._relayed = version
+                if self.version is None or version > self.version:
+                    self.version = version
+                return
+        if version <= after:
+            return
+        changes = self._changes(after, version, self.relay_limit) if self._changes else None
+        with self._cond:
+            local = set(self._local)
+        if changes is None:
+            self.publish('resync', {}, version, relayed=True)
+        else:
+            # The feed keeps one row per entity at its latest version, so a batch
+            # can be older than the product it belongs to: send products first
+            for change in sorted(changes, key=lambda c: c['entity'] != 'product'):
+                if change['version'] not in local:
+                    event, data = change_event(change)
+                    self.publish(event, data, change['version'], relayed=True)
+                    self.stats['relayed'] += 1
+        with self._cond:
+            self._relayed = version
+            self._local = {v for v in self._local if v > version}
+            if self.version is None or version > self.version:
+                self.version = version
+
+    def close(self):
+        """End every open stream and stop the poller"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        poller = self._poller
+        if poller is not None and poller is not threading.current_thread():
+            poller.join(5)
+
+    def status(self):
+        with self._cond:
+            return dict(self.stats, subscribers=self._subscribers, max_subscribers=self.max_subscribers,
+                        backlog=len(self._ring), last_id=f'{self._epoch}-{self._seq}', version=self.version)
@@ -0,0 +1,56 @@
+"""
+gunicorn 正式環境設定：預先載入應用程式（遷移只在主程序執行一次），
+fork 出多個 gthread worker，每個 worker 在 fork 後重建自己的連線池
+
+用法: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import multiprocessing
+import os
+
+from write_behind import WRITE_BEHIND
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Processes scale with cores; threads cover requests waiting on the database or upstream hosts
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Queued stock-ins live in one process: another worker's stock-out guard and
+# reads could not see them, so write-behind runs a single worker
+_requested_workers = workers
+if WRITE_BEHIND:
+    workers = 1
+worker_class = 'gthread'
+# An open /api/events stream holds a thread while it waits for changes, so
+# streams get their own allowance on top of the request threads. The app admits
+# only REQUEST_CONCURRENCY (default GUNICORN_THREADS) other requests at once, so
+# the extra threads never compete for the DB_POOL_SIZE connections
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) + int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 64))
+
+# A worker silent for this long is killed and replaced; graceful restarts
+# (SIGHUP, max_requests) let in-flight requests finish within graceful_timeout
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers periodically so slow leaks cannot accumulate
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+preload_app = True
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')  # e.g. '-' for stdout
+errorlog = '-'
+
+
+def on_starting(server):
+    if workers != _requested_workers:
+        server.log.warning('STOCK_WRITE_BEHIND is on: running 1 worker instead of %d', _requested_workers)
+
+
+def post_fork(server, worker):
+    import app
+    app.init_worker()
+
+
+def worker_exit(server, worker):
+    import app
+    app.shutdown_worker()
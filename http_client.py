@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+對外 HTTP 用戶端：共用連線池與 keep-alive、每個主機的並行上限、
+分開的連線/讀取逾時，以及主機持續出錯時快速失敗的斷路器
+"""
+
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Limits (overridable through the environment)
+POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', 20))
+POOL_PER_HOST = int(os.environ.get('HTTP_POOL_PER_HOST', 10))
+HOST_CONCURRENCY = int(os.environ.get('HTTP_HOST_CONCURRENCY', 4))
+HOST_WAIT = float(os.environ.get('HTTP_HOST_WAIT', 5))
+CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+BREAKER_THRESHOLD = int(os.environ.get('HTTP_BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = float(os.environ.get('HTTP_BREAKER_COOLDOWN', 30))
+
+USER_AGENT = 'VAS-Batch-Identifier/1.0'
+
+
+class HostUnavailable(requests.exceptions.RequestException):
+    """The request was refused locally without contacting the host"""
+
+    def __init__(self, host, message, retry_after):
+        super().__init__(f'{host}: {message}')
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one host.
+
+    closed: requests pass. After `threshold` failures in a row the breaker
+    opens and refuses requests for `cooldown` seconds; then a single trial
+    request is let through (half-open) whose outcome closes or reopens it.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    def allow(self):
+        """Return 0 if a request may go ahead, else seconds until the next trial"""
+        with self._lock:
+            if self.state == 'closed':
+                return 0
+            remaining = self._opened_at + self.cooldown - self._clock()
+            if remaining > 0:
+                return remaining
+            if self._trial_running:
+                return self.cooldown
+            self.state = 'half_open'
+            self._trial_running = True
+            return 0
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_running = False
+
+    def cancel_trial(self):
+        """A granted half-open trial was never sent; let the next request try"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                self.state = 'open'
+                self._opened_at = self._clock()
+
+    def status(self):
+        with self._lock:
+            status = {'state': self.state, 'failures': self.failures}
+            if self.state != 'closed':
+                status['retry_in'] = round(max(0.0, self._opened_at + self.cooldown - self._clock()), 2)
+            return status
+
+
+class _Host:
+    def __init__(self, concurrency, breaker):
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.breaker = breaker
+        self.in_flight = 0
+
+
+class OutboundClient:
+    """requests.Session shared by every outbound fetch.
+
+    get() has the requests.get signature. A plain number as timeout is the
+    read timeout; the connect timeout stays short so a dead host is noticed
+    quickly. Connection errors, timeouts and 5xx answers count as host
+    failures for the breaker; other statuses count as successes.
+    """
+
+    def __init__(self, pool_hosts=POOL_HOSTS, pool_per_host=POOL_PER_HOST,
+                 host_concurrency=HOST_CONCURRENCY, host_wait=HOST_WAIT,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN):
+        self.host_concurrency = host_concurrency
+        self.host_wait = host_wait
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        # Retries are left to the caller; the breaker needs to see every failure
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_per_host,
+                              max_retries=0, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'failures': 0, 'rejected_open': 0, 'rejected_busy': 0}
+
+    def _host(self, netloc):
+        with self._lock:
+            host = self._hosts.get(netloc)
+            if host is None:
+                host = self._hosts[netloc] = _Host(
+                    self.host_concurrency,
+                    CircuitBreaker(self.breaker_threshold, self.breaker_cooldown))
+            return host
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _timeout(self, timeout):
+        if timeout is None:
+            return (self.connect_timeout, self.read_timeout)
+        if isinstance(timeout, tuple):
+            return timeout
+        return (min(self.connect_timeout, timeout), timeout)
+
+    def get(self, url, timeout=None, **kwargs):
+        """GET through the pool; raises HostUnavailable instead of waiting on a bad host"""
+        netloc = urlsplit(url).netloc.lower()
+        host = self._host(netloc)
+
+        retry_after = host.breaker.allow()
+        if retry_after:
+            self._count('rejected_open')
+            raise HostUnavailable(netloc, 'circuit open after repeated failures', retry_after)
+        if not host.slots.acquire(timeout=self.host_wait):
+            self._count('rejected_busy')
+            host.breaker.cancel_trial()
+            raise HostUnavailable(netloc, 'too many concurrent requests', self.host_wait)
+
+        with self._lock:
+            host.in_flight += 1
+            self.stats['requests'] += 1
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                with self._lock:
+                    host.in_flight -= 1
+                host.slots.release()
+
+        try:
+            response = self.session.get(url, timeout=self._timeout(timeout), **kwargs)
+        except requests.exceptions.RequestException:
+            self._count('failures')
+            host.breaker.record_failure()
+            release()
+            raise
+        except BaseException:
+            host.breaker.cancel_trial()
+            release()
+            raise
+
+        if response.status_code >= 500:
+            self._count('failures')
+            host.breaker.record_failure()
+        else:
+            host.breaker.record_success()
+
+        if kwargs.get('stream'):
+            # The body is still on the wire: hold the host slot until the caller closes it
+            close = response.close
+
+            def close_and_release():
+                try:
+                    close()
+                finally:
+                    release()
+            response.close = close_and_release
+        else:
+            release()
+        return response
+
+    def status(self):
+        """Counters plus breaker state and in-flight requests per host"""
+        with self._lock:
+            hosts = list(self._hosts.items())
+            stats = dict(self.stats)
+        stats['hosts'] = {netloc: dict(host.breaker.status(), in_flight=host.in_flight)
+                          for netloc, host in hosts}
+        return stats
+
+    def close(self):
+        self.session.close()
@@ -6,26 +6,17 @@
 import os
 import sqlite3
 
+from changefeed import record_changes
+from migrations import migrate
+from product_codes import allocate_code
+
 DATABASE = 'products.db'
 
 def init_database():
     """Initialize database and add sample data"""
-    # Create database and tables
+    # Create or upgrade the schema (all DDL lives in migrations.py)
     conn = sqlite3.connect(DATABASE)
-
-    # Create products table
-    conn.execute('''CREATE TABLE IF NOT EXISTS products
-                   (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    code TEXT UNIQUE NOT NULL)''')
-
-    # Create batches table
-    conn.execute('''CREATE TABLE IF NOT EXISTS batches
-                   (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_id INTEGER NOT NULL,
-                    batch_number TEXT UNIQUE NOT NULL,
-                    quantity INTEGER DEFAULT 1,
-                    FOREIGN KEY (product_id) REFERENCES products (id))''')
+    migrate(conn, 'sqlite')
 
     print("資料庫表已建立")
 
@@ -51,15 +42,17 @@ def init_database():
         # Group by product name
         products_added = {}
         batch_count = 0
+        changes = []
 
         for product_name, batch_number in sample_data:
             # Add product if not exists
             if product_name not in products_added:
                 # Generate product code (A, B, C, etc.)
-                code = chr(65 + len(products_added))  # A, B, C, ...
-                conn.execute('INSERT INTO products (name, code) VALUES (?, ?)',
-                           (product_name, code))
+                code = allocate_code(conn, 'sqlite')
+                cursor = conn.execute('INSERT INTO products (name, code) VALUES (?, ?)',
+                                      (product_name, code))
                 products_added[product_name] = code
+                changes.append(('product', cursor.lastrowid, False))
 
             # Get product ID
             cursor = conn.execute('SELECT id FROM products WHERE code = ?',
@@ -67,10 +60,16 @@ def init_database():
             product_id = cursor.fetchone()[0]
 
             # Add batch
-            conn.execute('INSERT INTO batches (product_id, batch_number) VALUES (?, ?)',
-                       (product_id, batch_number))
+            cursor = conn.execute('INSERT INTO batches (product_id, batch_number) VALUES (?, ?)',
+                                  (product_id, batch_number))
+            changes.append(('batch', cursor.lastrowid, False))
             batch_count += 1
 
+        # Log the sample rows like any other write, so a replica's first
+        # /api/changes?since=0 sync receives them
+        version = conn.execute('UPDATE catalog_version SET version = version + 1 WHERE id = 1 '
+                               'RETURNING version').fetchone()[0]
+        record_changes(conn, 'sqlite', version, changes)
         conn.commit()
         print(f"已添加 {len(products_added)} 個示例產品和 {batch_count} 個批次")
     except Exception as e:
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+資料庫結構遷移：依版本號依序套用遷移（SQLite 與 PostgreSQL），
+所有 DDL 都集中在這裡，已套用的版本記錄在 schema_version 表
+
+用法: python migrations.py [--status]
+資料庫由 DATABASE_URL（PostgreSQL）或 SQLITE_PATH（預設 products.db）決定。
+"""
+
+import os
+import sys
+from typing import NamedTuple
+
+from product_codes import seed_code_counter
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    # Steps per engine: SQL strings or callables taking (db, engine)
+    sqlite: tuple
+    postgresql: tuple
+
+
+class MigrationError(Exception):
+    """A migration found data it cannot carry over; the database is left as it was"""
+
+
+def _check_orphan_batches(db, engine):
+    """Stop before adding the cascading foreign key over batches whose product is gone.
+
+    Deleting them would silently lose their stock, so both engines abort with
+    the ids and leave the decision (reassign or delete) to the operator.
+    """
+    ids = [row[0] for row in db.execute(
+        'SELECT id FROM batches WHERE product_id NOT IN (SELECT id FROM products) ORDER BY id')]
+    if ids:
+        shown = ', '.join(map(str, ids[:20])) + (f' ... ({len(ids)} in total)' if len(ids) > 20 else '')
+        raise MigrationError(f'batches reference missing products: {shown}; '
+                             'reassign or delete them, then run the migration again')
+
+
+def _rebuild_batches_with_cascade(db, engine):
+    """SQLite cannot alter a foreign key, so copy batches into a new table.
+
+    Only the known columns are copied, which also drops leftovers such as
+    the old unique_code column.
+    """
+    db.execute('''CREATE TABLE batches_new
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  product_id INTEGER NOT NULL,
+                  batch_number TEXT UNIQUE NOT NULL,
+                  quantity INTEGER DEFAULT 1,
+                  FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE)''')
+    db.execute('''INSERT INTO batches_new (id, product_id, batch_number, quantity)
+                  SELECT id, product_id, batch_number, quantity FROM batches''')
+    db.execute('DROP TABLE batches')
+    db.execute('ALTER TABLE batches_new RENAME TO batches')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_batches_product_id ON batches (product_id)')
+
+
+MIGRATIONS = (
+    # CREATE ... IF NOT EXISTS: databases made before versioning already have these tables
+    Migration(1, 'products and batches', sqlite=(
+        '''CREATE TABLE IF NOT EXISTS products
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            code TEXT UNIQUE NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS batches
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            batch_number TEXT UNIQUE NOT NULL,
+            quantity INTEGER DEFAULT 1,
+            FOREIGN KEY (product_id) REFERENCES products (id))''',
+    ), postgresql=(
+        '''CREATE TABLE IF NOT EXISTS products
+           (id SERIAL PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            code TEXT UNIQUE NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS batches
+           (id SERIAL PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            batch_number TEXT UNIQUE NOT NULL,
+            quantity INTEGER DEFAULT 1,
+            FOREIGN KEY (product_id) REFERENCES products (id))''',
+    )),
+    Migration(2, 'catalog version', sqlite=(
+        '''CREATE TABLE IF NOT EXISTS catalog_version
+           (id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL)''',
+        'INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)',
+    ), postgresql=(
+        '''CREATE TABLE IF NOT EXISTS catalog_version
+           (id INTEGER PRIMARY KEY CHECK (id = 1),
+            version BIGINT NOT NULL)''',
+        'INSERT INTO catalog_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING',
+    )),
+    Migration(3, 'product code counter', sqlite=(
+        '''CREATE TABLE IF NOT EXISTS product_code_counter
+           (id INTEGER PRIMARY KEY CHECK (id = 1),
+            next_value INTEGER NOT NULL)''',
+        seed_code_counter,
+    ), postgresql=(
+        'CREATE SEQUENCE IF NOT EXISTS product_code_seq',
+        seed_code_counter,
+    )),
+    Migration(4, 'index batches.product_id and lower(products.name)', sqlite=(
+        'CREATE INDEX IF NOT EXISTS idx_batches_product_id ON batches (product_id)',
+        'CREATE INDEX IF NOT EXISTS idx_products_name_lower ON products (LOWER(name))',
+    ), postgresql=(
+        'CREATE INDEX IF NOT EXISTS idx_batches_product_id ON batches (product_id)',
+        'CREATE INDEX IF NOT EXISTS idx_products_name_lower ON products (LOWER(name))',
+    )),
+    Migration(5, 'delete batches with their product', sqlite=(
+        _check_orphan_batches,
+        _rebuild_batches_with_cascade,
+    ), postgresql=(
+        _check_orphan_batches,
+        'ALTER TABLE batches DROP CONSTRAINT IF EXISTS batches_product_id_fkey',
+        '''ALTER TABLE batches ADD CONSTRAINT batches_product_id_fkey
+           FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE''',
+    )),
+    # Substring search (catalog_search.py). SQLite keeps external-content FTS5
+    # tables in step with triggers; PostgreSQL uses trigram GIN indexes.
+    Migration(6, 'trigram search indexes', sqlite=(
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS batches_fts USING fts5
+           (batch_number, content='batches', content_rowid='id', tokenize='trigram')''',
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5
+           (name, code, content='products', content_rowid='id', tokenize='trigram')''',
+        '''CREATE TRIGGER IF NOT EXISTS batches_fts_insert AFTER INSERT ON batches BEGIN
+             INSERT INTO batches_fts (rowid, batch_number) VALUES (new.id, new.batch_number);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS batches_fts_delete AFTER DELETE ON batches BEGIN
+             INSERT INTO batches_fts (batches_fts, rowid, batch_number)
+             VALUES ('delete', old.id, old.batch_number);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS batches_fts_update AFTER UPDATE OF batch_number ON batches BEGIN
+             INSERT INTO batches_fts (batches_fts, rowid, batch_number)
+             VALUES ('delete', old.id, old.batch_number);
+             INSERT INTO batches_fts (rowid, batch_number) VALUES (new.id, new.batch_number);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+             INSERT INTO products_fts (rowid, name, code) VALUES (new.id, new.name, new.code);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+             INSERT INTO products_fts (products_fts, rowid, name, code)
+             VALUES ('delete', old.id, old.name, old.code);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, code ON products BEGIN
+             INSERT INTO products_fts (products_fts, rowid, name, code)
+             VALUES ('delete', old.id, old.name, old.code);
+             INSERT INTO products_fts (rowid, name, code) VALUES (new.id, new.name, new.code);
+           END''',
+        "INSERT INTO batches_fts (batches_fts) VALUES ('rebuild')",
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+    ), postgresql=(
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        'CREATE INDEX IF NOT EXISTS idx_batches_number_trgm ON batches USING gin (batch_number gin_trgm_ops)',
+        'CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin (LOWER(name) gin_trgm_ops)',
+        'CREATE INDEX IF NOT EXISTS idx_products_code_trgm ON products USING gin (code gin_trgm_ops)',
+    )),
+    # Append-only stock ledger (stock_ledger.py); created_at is fixed-width UTC text on SQLite
+    Migration(7, 'stock movement ledger', sqlite=(
+        '''CREATE TABLE IF NOT EXISTS stock_movements
+           (id INTEGER PRIMARY KEY,
+            batch_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            events INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+            FOREIGN KEY (batch_id) REFERENCES batches (id) ON DELETE CASCADE)''',
+        'CREATE INDEX IF NOT EXISTS idx_stock_movements_batch_time ON stock_movements (batch_id, created_at)',
+    ), postgresql=(
+        '''CREATE TABLE IF NOT EXISTS stock_movements
+           (id BIGSERIAL PRIMARY KEY,
+            batch_id INTEGER NOT NULL REFERENCES batches (id) ON DELETE CASCADE,
+            delta INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            events INTEGER NOT NULL DEFAULT 1,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now())''',
+        'CREATE INDEX IF NOT EXISTS idx_stock_movements_batch_time ON stock_movements (batch_id, created_at)',
+    )),
+    # Change log for /api/changes (changefeed.py): one row per product/batch at the
+    # version of its last change. Existing rows enter at the current version.
+    Migration(8, 'catalog change log', sqlite=(
+        '''CREATE TABLE IF NOT EXISTS catalog_changes
+           (entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+            PRIMARY KEY (entity, entity_id)) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_catalog_changes_version ON catalog_changes (version, entity, entity_id)',
+        'ALTER TABLE catalog_version ADD COLUMN changes_horizon INTEGER NOT NULL DEFAULT 0',
+        '''INSERT INTO catalog_changes (entity, entity_id, version)
+           SELECT 'product', id, (SELECT version FROM catalog_version WHERE id = 1) FROM products''',
+        '''INSERT INTO catalog_changes (entity, entity_id, version)
+           SELECT 'batch', id, (SELECT version FROM catalog_version WHERE id = 1) FROM batches''',
+    ), postgresql=(
+        '''CREATE TABLE IF NOT EXISTS catalog_changes
+           (entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            version BIGINT NOT NULL,
+            deleted BOOLEAN NOT NULL DEFAULT FALSE,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (entity, entity_id))''',
+        'CREATE INDEX IF NOT EXISTS idx_catalog_changes_version ON catalog_changes (version, entity, entity_id)',
+        'ALTER TABLE catalog_version ADD COLUMN IF NOT EXISTS changes_horizon BIGINT NOT NULL DEFAULT 0',
+        '''INSERT INTO catalog_changes (entity, entity_id, version)
+           SELECT 'product', id, (SELECT version FROM catalog_version WHERE id = 1) FROM products
+           ON CONFLICT DO NOTHING''',
+        '''INSERT INTO catalog_changes (entity, entity_id, version)
+           SELECT 'batch', id, (SELECT version FROM catalog_version WHERE id = 1) FROM batches
+           ON CONFLICT DO NOTHING''',
+    )),
+    # Movement history pages newest first by id (keyset on id); ordering the
+    # index by time made every page sort the batch's whole history. delta
+    # rides along so the balance of newer rows is summed from the index alone.
+    Migration(9, 'movement history index by id', sqlite=(
+        'CREATE INDEX IF NOT EXISTS idx_stock_movements_batch_id ON stock_movements (batch_id, id, delta)',
+        'DROP INDEX IF EXISTS idx_stock_movements_batch_time',
+    ), postgresql=(
+        'CREATE INDEX IF NOT EXISTS idx_stock_movements_batch_id ON stock_movements (batch_id, id) INCLUDE (delta)',
+        'DROP INDEX IF EXISTS idx_stock_movements_batch_time',
+    )),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# Serializes migration runs across processes sharing one PostgreSQL database
+_PG_LOCK_KEY = 0x56415301
+
+
+def _sql(query, engine):
+    return query.replace('?', '%s') if engine == 'postgresql' else query
+
+
+def _ensure_version_table(db, engine):
+    if engine == 'postgresql':
+        db.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                     (version INTEGER PRIMARY KEY,
+                      name TEXT NOT NULL,
+                      applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)''')
+    else:
+        db.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                     (version INTEGER PRIMARY KEY,
+                      name TEXT NOT NULL,
+                      applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)''')
+    db.commit()
+
+
+def current_version(db, engine):
+    """Highest applied migration (0 for a database that was never migrated)"""
+    _ensure_version_table(db, engine)
+    row = db.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def pending(db, engine):
+    """Migrations not applied yet, in order"""
+    version = current_version(db, engine)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def migrate(db, engine, target=None):
+    """Apply pending migrations up to target (default: latest); return the versions applied.
+
+    Each migration runs in its own transaction together with its
+    schema_version row, so a failure leaves the database at the previous
+    version. Concurrent runners (several workers starting at once) wait on
+    a lock and then skip what the first one applied.
+    """
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    for migration in pending(db, engine):
+        if migration.version > target:
+            break
+        if db.in_transaction:
+            db.commit()
+        try:
+            if engine == 'postgresql':
+                db.execute('SELECT pg_advisory_xact_lock(%s)', (_PG_LOCK_KEY,))
+            else:
+                db.execute('BEGIN IMMEDIATE')
+            done = db.execute(_sql('SELECT 1 FROM schema_version WHERE version = ?', engine),
+                              (migration.version,)).fetchone()
+            if done is None:
+                for step in getattr(migration, engine):
+                    if callable(step):
+                        step(db, engine)
+                    else:
+                        db.execute(step)
+                db.execute(_sql('INSERT INTO schema_version (version, name) VALUES (?, ?)', engine),
+                           (migration.version, migration.name))
+                applied.append(migration.version)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return applied
+
+
+def main():
+    from db_pool import postgres_connector, sqlite_connector
+
+    database_url = os.environ.get('DATABASE_URL')
+    engine = 'postgresql' if database_url else 'sqlite'
+    connect = (postgres_connector(database_url) if database_url
+               else sqlite_connector(os.environ.get('SQLITE_PATH', 'products.db')))
+    db = connect()
+    try:
+        if '--status' in sys.argv[1:]:
+            print(f'目前版本: {current_version(db, engine)} / 最新版本: {LATEST_VERSION}')
+            for migration in pending(db, engine):
+                print(f'  待套用 {migration.version}: {migration.name}')
+            return
+        try:
+            applied = migrate(db, engine)
+        except MigrationError as e:
+            print(f'遷移失敗: {e}')
+            sys.exit(1)
+        if applied:
+            print(f'已套用遷移: {", ".join(map(str, applied))}')
+        else:
+            print('資料庫結構已是最新版本')
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
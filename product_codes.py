@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+產品代碼分配：計數器（SQLite）或序列（PostgreSQL）產生遞增號碼，
+再以雙射 26 進位轉成 A..Z, AA, AB, ... 代碼，不受 Z 的限制
+"""
+
+import re
+
+_CODE = re.compile(r'^[A-Z]+$')
+
+
+def encode_code(number):
+    """1 -> A, 26 -> Z, 27 -> AA, 703 -> AAA (bijective base-26)"""
+    if number < 1:
+        raise ValueError('Product code numbers start at 1')
+    letters = []
+    while number:
+        number, rest = divmod(number - 1, 26)
+        letters.append(chr(ord('A') + rest))
+    return ''.join(reversed(letters))
+
+
+def decode_code(code):
+    """Inverse of encode_code(); None for codes outside the A..Z scheme"""
+    if not isinstance(code, str) or not _CODE.match(code):
+        return None
+    number = 0
+    for ch in code:
+        number = number * 26 + ord(ch) - ord('A') + 1
+    return number
+
+
+def _highest_existing(db):
+    """Largest number behind the codes already stored (0 for an empty table)"""
+    cursor = db.execute('SELECT code FROM products')
+    return max((decode_code(row[0]) or 0 for row in cursor.fetchall()), default=0)
+
+
+def seed_code_counter(db, engine):
+    """Start the counter/sequence (created by migrations.py) after any codes already in use"""
+    if engine == 'postgresql':
+        is_called = db.execute('SELECT is_called FROM product_code_seq').fetchone()[0]
+        if not is_called:
+            highest = _highest_existing(db)
+            if highest:
+                db.execute('SELECT setval(%s, %s)', ('product_code_seq', highest))
+    elif db.execute('SELECT 1 FROM product_code_counter WHERE id = 1').fetchone() is None:
+        db.execute('INSERT INTO product_code_counter (id, next_value) VALUES (1, ?)',
+                   (_highest_existing(db) + 1,))
+
+
+def allocate_code(db, engine):
+    """Take the next product code inside the caller's transaction.
+
+    SQLite: the counter UPDATE takes the write lock, so concurrent creators
+    queue up and a rolled-back insert gives its number back. PostgreSQL:
+    nextval() never blocks; a rolled-back insert leaves a gap.
+    """
+    if engine == 'postgresql':
+        number = db.execute("SELECT nextval('product_code_seq')").fetchone()[0]
+    else:
+        number = db.execute('''UPDATE product_code_counter SET next_value = next_value + 1
+                               WHERE id = 1 RETURNING next_value - 1''').fetchall()[0][0]
+    return encode_code(number)
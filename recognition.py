@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+伺服器端影像識別：NumPy 向量化前處理（灰階、對比拉伸、自適應二值化、
+感興趣區域裁切），再交給可替換的識別器在程序池中執行
+
+識別器是模組層級的函式 recognize(image) -> text，image 為 uint8 二維陣列；
+以 RECOGNIZER=模組:函式 指定（預設使用 pytesseract，需另外安裝）。
+"""
+
+import hashlib
+import importlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+RECOGNIZER = os.environ.get('RECOGNIZER', 'recognition:tesseract_recognizer')
+RECOGNIZE_WORKERS = int(os.environ.get('RECOGNIZE_WORKERS', 2))  # 0 runs in the request thread
+RECOGNIZE_TIMEOUT = float(os.environ.get('RECOGNIZE_TIMEOUT', 15))
+RECOGNIZE_MAX_BYTES = int(os.environ.get('RECOGNIZE_MAX_BYTES', 8 * 1024 * 1024))
+
+# Near-duplicate frame cache: frames whose dHash differs in at most this many bits are
+# candidates; the result is reused only when the binarized image is identical
+FRAME_CACHE_SIZE = int(os.environ.get('FRAME_CACHE_SIZE', 256))
+FRAME_CACHE_MAX_DISTANCE = int(os.environ.get('FRAME_CACHE_MAX_DISTANCE', 4))
+FRAME_CACHE_TTL = float(os.environ.get('FRAME_CACHE_TTL', 5))
+
+# Adaptive threshold: pixel is ink when darker than its block mean minus offset
+THRESHOLD_BLOCK = 31
+THRESHOLD_OFFSET = 10
+
+
+class FrameError(ValueError):
+    """The uploaded frame could not be decoded"""
+
+
+class UnsupportedFrameType(FrameError):
+    """Frame encoding that this installation cannot decode"""
+
+
+class RecognizerUnavailable(RuntimeError):
+    """The configured recognizer cannot run here (e.g. OCR engine not installed)"""
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RecognizerUnavailable('numpy is required for server-side recognition')
+    return numpy
+
+
+def decode_frame(body, content_type, width=None, height=None):
+    """Return the frame as an (h, w) gray or (h, w, channels) uint8 array.
+
+    application/octet-stream carries raw pixels (canvas getImageData RGBA,
+    RGB or gray) and needs width and height. PNG and JPEG need Pillow.
+    """
+    np = _numpy()
+    if content_type in ('image/png', 'image/jpeg'):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise UnsupportedFrameType('PNG/JPEG frames need Pillow; send raw pixels instead')
+        import io
+        try:
+            return np.asarray(Image.open(io.BytesIO(body)).convert('RGB'))
+        except Exception as e:
+            raise FrameError(f'Cannot decode image: {e}')
+
+    if content_type != 'application/octet-stream':
+        raise UnsupportedFrameType(f'Unsupported frame type: {content_type}')
+    if not width or not height or width <= 0 or height <= 0:
+        raise FrameError('width and height are required for raw frames')
+    channels, remainder = divmod(len(body), width * height)
+    if remainder or channels not in (1, 3, 4):
+        raise FrameError(f'{len(body)} bytes is not a {width}x{height} gray, RGB or RGBA frame')
+    pixels = np.frombuffer(body, dtype=np.uint8)
+    return pixels.reshape(height, width) if channels == 1 else pixels.reshape(height, width, channels)
+
+
+def parse_roi(value):
+    """'x,y,w,h' -> tuple of ints, or None"""
+    if not value:
+        return None
+    try:
+        x, y, w, h = (int(part) for part in value.split(','))
+    except ValueError:
+        raise FrameError('roi must be x,y,width,height')
+    if x < 0 or y < 0 or w <= 0 or h <= 0:
+        raise FrameError('roi must be x,y,width,height')
+    return x, y, w, h
+
+
+def to_grayscale(frame):
+    """ITU-R 601 luma, same weights as the browser preprocessing"""
+    np = _numpy()
+    if frame.ndim == 2:
+        return frame.astype(np.float32)
+    return frame[..., :3].astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def contrast_stretch(gray, low_percentile=2, high_percentile=98):
+    """Map the [low, high] percentile range onto 0..255"""
+    np = _numpy()
+    low, high = np.percentile(gray, (low_percentile, high_percentile))
+    if high - low < 1:
+        return np.zeros_like(gray)
+    return np.clip((gray - low) * (255.0 / (high - low)), 0, 255)
+
+
+def adaptive_threshold(gray, block=THRESHOLD_BLOCK, offset=THRESHOLD_OFFSET):
+    """Local-mean threshold with an integral image: dark text -> 0, background -> 255"""
+    np = _numpy()
+    height, width = gray.shape
+    radius = block // 2
+    integral = np.zeros((height + 1, width + 1), dtype=np.float64)
+    integral[1:, 1:] = gray.cumsum(axis=0).cumsum(axis=1)
+
+    rows = np.arange(height)
+    cols = np.arange(width)
+    top = np.clip(rows - radius, 0, height)[:, None]
+    bottom = np.clip(rows + radius + 1, 0, height)[:, None]
+    left = np.clip(cols - radius, 0, width)[None, :]
+    right = np.clip(cols + radius + 1, 0, width)[None, :]
+
+    sums = integral[bottom, right] - integral[top, right] - integral[bottom, left] + integral[top, left]
+    means = sums / ((bottom - top) * (right - left))
+    return np.where(gray < means - offset, 0, 255).astype(np.uint8)
+
+
+def crop(frame, roi):
+    """Apply an (x, y, w, h) region of interest"""
+    if roi is None:
+        return frame
+    x, y, w, h = roi
+    frame = frame[y:y + h, x:x + w]
+    if frame.size == 0:
+        raise FrameError('roi lies outside the frame')
+    return frame
+
+
+def dhash(frame, size=8):
+    """64-bit difference hash of a frame (near-identical frames differ in few bits).
+
+    Only a (size+1)*4 x size*4 grid of pixels is read and converted to gray,
+    so hashing a full camera frame costs microseconds, not a full-frame pass.
+    """
+    np = _numpy()
+    height, width = frame.shape[:2]
+    rows = np.linspace(0, height - 1, size * 4).astype(np.intp)
+    cols = np.linspace(0, width - 1, (size + 1) * 4).astype(np.intp)
+    small = to_grayscale(frame[rows[:, None], cols[None, :]])
+    # Average 4x4 blocks down to size x (size + 1), then compare horizontal neighbours
+    small = small.reshape(size, 4, size + 1, 4).mean(axis=(1, 3))
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def image_digest(image):
+    """Exact digest of a binarized image.
+
+    Labels that differ only in their digits can be a few dHash bits apart,
+    so a cached recognition is reused only when the ink matches exactly.
+    """
+    np = _numpy()
+    return hashlib.blake2b(np.packbits(image == 0).tobytes(), digest_size=16).digest()
+
+
+def preprocess(frame, roi=None):
+    """Crop, grayscale, stretch contrast and binarize a frame for OCR"""
+    return adaptive_threshold(contrast_stretch(to_grayscale(crop(frame, roi))))
+
+
+def load_recognizer(spec):
+    """'module:function' -> the function"""
+    module_name, _, function_name = spec.partition(':')
+    if not function_name:
+        raise RecognizerUnavailable(f'RECOGNIZER must look like module:function, got {spec!r}')
+    try:
+        return getattr(importlib.import_module(module_name), function_name)
+    except (ImportError, AttributeError) as e:
+        raise RecognizerUnavailable(f'Cannot load recognizer {spec}: {e}')
+
+
+def tesseract_recognizer(image):
+    """Default recognizer: Tesseract through pytesseract"""
+    try:
+        import pytesseract
+        from PIL import Image
+    except ImportError:
+        raise RecognizerUnavailable('Install pytesseract and Pillow (and the tesseract binary) '
+                                    'or set RECOGNIZER')
+    try:
+        return pytesseract.image_to_string(Image.fromarray(image), config='--psm 6')
+    except pytesseract.TesseractNotFoundError:
+        raise RecognizerUnavailable('tesseract binary not found')
+
+
+_recognizers = {}
+
+
+def run_recognizer(spec, image):
+    """Process-pool entry point: load the recognizer once per worker and run it"""
+    recognizer = _recognizers.get(spec)
+    if recognizer is None:
+        recognizer = _recognizers[spec] = load_recognizer(spec)
+    return recognizer(image)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers=None):
+    """Process pool shared by all requests (created on first use)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # The pool is created from a request thread; forking a threaded
+                # process can leave the child stuck on a lock another thread held
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                _pool = ProcessPoolExecutor(max_workers=workers or RECOGNIZE_WORKERS,
+                                            mp_context=multiprocessing.get_context(method))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def forget_pool():
+    """Drop a pool inherited through fork; its workers belong to the parent process"""
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+def recognize(image, spec=None, workers=None, timeout=None):
+    """Run the configured recognizer on a preprocessed image and return its text"""
+    spec = spec or RECOGNIZER
+    workers = RECOGNIZE_WORKERS if workers is None else workers
+    if workers <= 0:
+        return run_recognizer(spec, image)
+    future = get_pool(workers).submit(run_recognizer, spec, image)
+    return future.result(timeout=timeout or RECOGNIZE_TIMEOUT)
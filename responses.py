@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+回應層：JSON 以 orjson 序列化（未安裝時使用標準庫 json），並依 Accept-Encoding
+協商 zstd / br / gzip 壓縮
+
+小於門檻的回應不壓縮；大型回應與串流回應（NDJSON 等）邊壓縮邊送出，不必先把
+整個壓縮結果放在記憶體裡。brotli 需安裝 brotli（或 brotlicffi），zstd 需安裝
+zstandard；未安裝的編碼不會被選用。
+"""
+
+import json
+import os
+import zlib
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', '1').lower() in ('1', 'true', 'yes', 'on')
+# Server preference among the encodings a client accepts equally
+ENCODINGS = [e.strip() for e in os.environ.get('COMPRESS_ENCODINGS', 'zstd,br,gzip').split(',') if e.strip()]
+# Bodies smaller than this are sent as they are: the saving would not pay for the work
+MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+# Buffered bodies larger than this are compressed chunk by chunk as they are sent
+STREAM_THRESHOLD = int(os.environ.get('COMPRESS_STREAM_THRESHOLD', 1024 * 1024))
+CHUNK_SIZE = int(os.environ.get('COMPRESS_CHUNK_SIZE', 64 * 1024))
+GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+ZSTD_LEVEL = int(os.environ.get('COMPRESS_ZSTD_LEVEL', 3))
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml')
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes, through orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:  # orjson.JSONEncodeError, e.g. integers beyond 64 bits
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() through orjson.
+
+    Keeps Flask's key sorting and its conversions for dates, decimals,
+    UUIDs and dataclasses; non-ASCII text is sent as UTF-8 instead of
+    \\u escapes. Falls back to the stdlib path for debug pretty-printing,
+    without orjson, or for values orjson rejects.
+    """
+
+    def response(self, *args, **kwargs):
+        if orjson is None or self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        option = (orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE | orjson.OPT_PASSTHROUGH_DATETIME
+                  | orjson.OPT_PASSTHROUGH_DATACLASS)
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            body = orjson.dumps(obj, default=self.default, option=option)
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encoders():
+    """Content codings this installation can produce, by name"""
+    encoders = {'gzip': _GzipEncoder}
+    if brotli is not None:
+        encoders['br'] = _BrotliEncoder
+    if zstandard is not None:
+        encoders['zstd'] = _ZstdEncoder
+    return encoders
+
+
+ENCODERS = available_encoders()
+
+
+def negotiate(accept_encodings, encodings=None):
+    """Best coding for a parsed Accept-Encoding header, or None for identity.
+
+    The client's q-values decide; ties go to the server's preference order.
+    """
+    best, best_quality = None, 0
+    for name in encodings or ENCODINGS:
+        if name not in ENCODERS:
+            continue
+        quality = accept_encodings.quality(name)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compress_body(data, encoding):
+    """Compress a complete body in one call"""
+    encoder = ENCODERS[encoding]()
+    return encoder.compress(data) + encoder.finish()
+
+
+def compress_chunks(chunks, encoding, flush_each=False):
+    """Compress an iterable of byte chunks as they come.
+
+    flush_each ends a compressed block after every chunk so a streamed
+    response (one NDJSON line per result) still reaches the client as it
+    is produced.
+    """
+    encoder = ENCODERS[encoding]()
+    for chunk in chunks:
+        out = encoder.compress(chunk)
+        if flush_each:
+            out += encoder.flush()
+        if out:
+            yield out
+    yield encoder.finish()
+
+
+def _split(data, size):
+    view = memoryview(data)
+    for start in range(0, len(data), size):
+        yield view[start:start + size]
+
+
+def _compressible(response):
+    mimetype = response.mimetype or ''
+    return (mimetype.startswith('text/') and mimetype != 'text/event-stream') or mimetype in COMPRESSIBLE_TYPES
+
+
+def compress_response(response, accept_encodings):
+    """after_request hook: negotiate and apply a content coding"""
+    if 'Content-Encoding' in response.headers or response.direct_passthrough or not _compressible(response):
+        return response
+    encoding = negotiate(accept_encodings)
+    if encoding is None:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    # Each coding is its own representation, so a strong validator no longer
+    # applies byte for byte; If-None-Match compares weakly, so 304s still work
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+
+    if response.is_streamed:
+        original = response.response
+        response.response = ClosingIterator(
+            compress_chunks(response.iter_encoded(), encoding, flush_each=True),
+            [original.close] if hasattr(original, 'close') else None)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        if len(data) > STREAM_THRESHOLD:
+            # No second multi-megabyte buffer, and the first bytes leave sooner
+            response.response = compress_chunks(_split(data, CHUNK_SIZE), encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    """Install the fast JSON provider and, unless disabled, response compression"""
+    from flask import request
+
+    app.json = FastJSONProvider(app)
+    if COMPRESSION:
+        app.after_request(lambda response: compress_response(response, request.accept_encodings))
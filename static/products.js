@@ -1,8 +1,24 @@
 // Global variables
 let productsData = [];
+let nextCursor = null;
+let filterTimer = null;
+let loadSequence = 0;
+const PAGE_SIZE = 200;
 let currentEditingId = null;
 let currentDeletingType = null; // 'product' or 'batch'
 
+// Live updates from /api/events
+let eventSource = null;
+let liveConnected = false;
+let initialLoadStarted = false;
+let loadInFlight = false;
+let queuedEvents = [];
+let renderScheduled = false;
+let reloadTimer = null;
+const CHANGE_EVENTS = ['product_created', 'product_updated', 'product_deleted', 'batch_created',
+                       'batch_updated', 'batch_deleted', 'quantity_changed', 'batches_imported',
+                       'product_changed', 'batch_changed', 'resync'];
+
 // DOM elements
 const addProductBtn = document.getElementById('addProductBtn');
 const addBatchBtn = document.getElementById('addBatchBtn');
@@ -26,11 +42,13 @@ const filterProductCode = document.getElementById('filterProductCode');
 const filterBatchNumber = document.getElementById('filterBatchNumber');
 const filterShowEmpty = document.getElementById('filterShowEmpty');
 const clearFiltersBtn = document.getElementById('clearFiltersBtn');
+const loadMoreBtn = document.getElementById('loadMoreBtn');
 
 // Initialize
 document.addEventListener('DOMContentLoaded', function() {
-    loadProducts();
     setupEventListeners();
+    // The first load waits for the stream to open, so no change can fall in between
+    if (!connectEvents()) startInitialLoad();
 });
 
 // Setup event listeners
@@ -83,121 +101,227 @@ function setupEventListeners() {
     filterBatchNumber.addEventListener('input', applyFilters);
     filterShowEmpty.addEventListener('change', applyFilters);
     clearFiltersBtn.addEventListener('click', clearFilters);
+    loadMoreBtn.addEventListener('click', () => loadProducts(true));
+}
+
+// Build the /api/products query from the filter inputs (filtering happens in SQL)
+function buildProductsQuery(cursor) {
+    const params = new URLSearchParams();
+    const name = filterProductName.value.trim();
+    const code = filterProductCode.value.trim();
+    const batch = filterBatchNumber.value.trim();
+
+    if (name) params.set('name', name);
+    if (code) params.set('code', code);
+    if (batch) params.set('batch', batch);
+    params.set('show_empty', filterShowEmpty.value);
+    params.set('limit', PAGE_SIZE);
+    params.set('shape', 'grouped');
+    if (cursor) params.set('cursor', cursor);
+    return params.toString();
 }
 
-// Load products from server
-async function loadProducts() {
+// Load products from server, one keyset page at a time
+async function loadProducts(append = false) {
+    const sequence = ++loadSequence;
+    loadInFlight = true;
     try {
         console.log('Loading products from API...');
-        const response = await fetch('/api/products');
+        const response = await fetch(`/api/products?${buildProductsQuery(append ? nextCursor : null)}`);
 
         if (!response.ok) {
             throw new Error(`HTTP ${response.status}: ${response.statusText}`);
         }
 
-        const products = await response.json();
-        console.log(`Loaded ${products.length} product items`);
+        const page = await response.json();
+
+        // Ignore responses that were overtaken by a newer filter change
+        if (sequence !== loadSequence) return;
 
-        productsData = products;
-        applyFilters();
+        console.log(`Loaded ${page.items.length} products`);
+        productsData = append ? mergeProductPages(productsData, page.items) : page.items;
+        nextCursor = page.next_cursor;
+
+        renderProductsTable(productsData);
+        loadMoreBtn.style.display = nextCursor ? 'inline-block' : 'none';
         console.log('Products loaded successfully');
     } catch (error) {
         console.error('Error loading products:', error);
         showMessage(`載入產品失敗: ${error.message}`, 'error');
+    } finally {
+        if (sequence === loadSequence) {
+            // Changes that arrived while the page was loading apply on top of it
+            loadInFlight = false;
+            const pending = queuedEvents;
+            queuedEvents = [];
+            pending.forEach(([type, data]) => applyChangeEvent(type, data));
+        }
     }
 }
 
-// Filter functions
-function applyFilters() {
-    const filteredProducts = filterProducts(productsData);
-    renderProductsTable(filteredProducts);
-}
-
-function filterProducts(products) {
-    const nameFilter = filterProductName.value.trim().toLowerCase();
-    const codeFilter = filterProductCode.value.trim().toLowerCase();
-    const batchFilter = filterBatchNumber.value.trim().toLowerCase();
-    const showEmptyFilter = filterShowEmpty.value;
-
-    // Group products by product_id first
-    const productGroups = {};
-    products.forEach(item => {
-        if (!productGroups[item.id]) {
-            productGroups[item.id] = {
-                id: item.id,
-                name: item.name,
-                code: item.code,
-                batches: []
-            };
-        }
-        if (item.batch_id) {
-            productGroups[item.id].batches.push({
-                id: item.batch_id,
-                batch_number: item.batch_number,
-                quantity: item.quantity
-            });
+// After our own write: the change event updates the table; reload only without a live stream
+function refreshAfterWrite() {
+    if (!liveConnected) loadProducts();
+}
+
+function startInitialLoad() {
+    if (initialLoadStarted) return;
+    initialLoadStarted = true;
+    loadProducts();
+}
+
+// Subscribe to change events; returns false when the browser has no EventSource
+function connectEvents() {
+    if (!window.EventSource) return false;
+    eventSource = new EventSource('/api/events');
+
+    eventSource.addEventListener('hello', () => {
+        liveConnected = true;
+        startInitialLoad();
+    });
+    CHANGE_EVENTS.forEach(type => {
+        eventSource.addEventListener(type, (e) => {
+            liveConnected = true;
+            handleChangeEvent(type, JSON.parse(e.data));
+        });
+    });
+    eventSource.addEventListener('error', () => {
+        liveConnected = false;
+        startInitialLoad();
+        // The browser retries dropped streams itself, but not refused ones (e.g. 503)
+        if (eventSource.readyState === EventSource.CLOSED) {
+            eventSource = null;
+            setTimeout(connectEvents, 30000);
         }
     });
+    return true;
+}
 
-    // Apply filters
-    const filteredGroups = Object.values(productGroups).filter(product => {
-        // Filter by product name
-        if (nameFilter && !product.name.toLowerCase().includes(nameFilter)) {
-            return false;
-        }
+function handleChangeEvent(type, data) {
+    if (loadInFlight) {
+        queuedEvents.push([type, data]);
+    } else {
+        applyChangeEvent(type, data);
+    }
+}
 
-        // Filter by product code
-        if (codeFilter && !product.code.toLowerCase().includes(codeFilter)) {
-            return false;
-        }
+function filtersActive() {
+    return Boolean(filterProductName.value.trim() || filterProductCode.value.trim() ||
+                   filterBatchNumber.value.trim() || filterShowEmpty.value !== 'all');
+}
+
+function findBatch(batchId) {
+    for (const product of productsData) {
+        const batch = product.batches.find(b => b.id === batchId);
+        if (batch) return { product, batch };
+    }
+    return null;
+}
 
-        // Filter by batch number (check if any batch matches)
-        if (batchFilter) {
-            // Filter batches that match the batch number filter
-            product.batches = product.batches.filter(batch =>
-                batch.batch_number.toLowerCase().includes(batchFilter)
-            );
-            // If no batches match, exclude the product
-            if (product.batches.length === 0) {
-                return false;
+function updateBatch(found, data) {
+    found.batch.quantity = data.quantity ?? 0;
+    if (data.batch_number && data.batch_number !== found.batch.batch_number) {
+        found.batch.batch_number = data.batch_number;
+        found.product.batches.sort((a, b) => a.batch_number.localeCompare(b.batch_number));
+    }
+}
+
+// Apply one change event to the loaded rows. Events carry absolute values, so
+// applying one the loaded page already reflects is harmless.
+function applyChangeEvent(type, data) {
+    switch (type) {
+        case 'quantity_changed':
+        case 'batch_updated': {
+            const found = findBatch(data.id);
+            if (!found) return;  // not on screen
+            updateBatch(found, data);
+            break;
+        }
+        // *_changed events relay another server process's writes: the row's
+        // current state, new or edited
+        case 'batch_created':
+        case 'batch_changed': {
+            const found = findBatch(data.id);
+            if (found) {
+                updateBatch(found, data);
+                break;
             }
+            // Whether a new row matches the filters is the server's call
+            if (filtersActive()) return scheduleReload();
+            const product = productsData.find(p => p.id === data.product_id);
+            if (!product) return;
+            product.batches.push({ id: data.id, batch_number: data.batch_number, quantity: data.quantity ?? 0 });
+            product.batches.sort((a, b) => a.batch_number.localeCompare(b.batch_number));
+            break;
         }
-
-        // Filter by show empty option
-        if (showEmptyFilter === 'with_batches' && product.batches.length === 0) {
-            return false;
+        case 'product_created':
+        case 'product_changed': {
+            const existing = productsData.find(p => p.id === data.id);
+            if (existing) {
+                existing.name = data.name;
+                break;
+            }
+            if (filtersActive()) return scheduleReload();
+            const index = productsData.findIndex(p => p.name.localeCompare(data.name) > 0);
+            // Past the last loaded row it belongs to a page not fetched yet
+            if (index === -1 && nextCursor) return;
+            const product = { id: data.id, name: data.name, code: data.code, batches: [] };
+            productsData.splice(index === -1 ? productsData.length : index, 0, product);
+            break;
         }
-        if (showEmptyFilter === 'without_batches' && product.batches.length > 0) {
-            return false;
+        case 'product_updated': {
+            const product = productsData.find(p => p.id === data.id);
+            if (!product) return;
+            product.name = data.name;
+            break;
         }
+        case 'product_deleted':
+            productsData = productsData.filter(p => p.id !== data.id);
+            break;
+        case 'batch_deleted': {
+            // Relayed deletions carry only the batch id
+            const found = findBatch(data.id);
+            if (!found) return;
+            found.product.batches = found.product.batches.filter(b => b.id !== data.id);
+            break;
+        }
+        default:
+            // batches_imported, resync
+            return scheduleReload();
+    }
+    scheduleRender();
+}
 
-        return true;
+// Coalesce bursts of events into one table render per frame
+function scheduleRender() {
+    if (renderScheduled) return;
+    renderScheduled = true;
+    requestAnimationFrame(() => {
+        renderScheduled = false;
+        renderProductsTable(productsData);
     });
+}
 
-    // Convert back to flat array format for rendering
-    const filteredProducts = [];
-    filteredGroups.forEach(product => {
-        // Add product entry
-        filteredProducts.push({
-            id: product.id,
-            name: product.name,
-            code: product.code
-        });
+function scheduleReload() {
+    clearTimeout(reloadTimer);
+    reloadTimer = setTimeout(() => loadProducts(), 500);
+}
 
-        // Add batch entries
-        product.batches.forEach(batch => {
-            filteredProducts.push({
-                id: product.id,
-                name: product.name,
-                code: product.code,
-                batch_id: batch.id,
-                batch_number: batch.batch_number,
-                quantity: batch.quantity
-            });
-        });
-    });
+// Append a grouped page; a product split across the page boundary continues its batch list
+function mergeProductPages(loaded, items) {
+    if (loaded.length && items.length && loaded[loaded.length - 1].id === items[0].id) {
+        const last = loaded[loaded.length - 1];
+        loaded = loaded.slice(0, -1).concat({ ...last, batches: last.batches.concat(items[0].batches) });
+        items = items.slice(1);
+    }
+    return loaded.concat(items);
+}
 
-    return filteredProducts;
+// Filter functions
+function applyFilters() {
+    // Debounce keystrokes so typing does not fire a request per character
+    clearTimeout(filterTimer);
+    filterTimer = setTimeout(() => loadProducts(), 250);
 }
 
 function clearFilters() {
@@ -215,38 +339,17 @@ function renderProductsTable(products) {
         return;
     }
 
-    // Group products by product_id to show hierarchy
-    const productGroups = {};
-    products.forEach(item => {
-        if (!productGroups[item.id]) {
-            productGroups[item.id] = {
-                id: item.id,
-                name: item.name,
-                code: item.code,
-                batches: [],
-                totalQuantity: 0
-            };
-        }
-        if (item.batch_id) {
-            const quantity = item.quantity || 1;
-            productGroups[item.id].batches.push({
-                id: item.batch_id,
-                batch_number: item.batch_number,
-                quantity: quantity
-            });
-            productGroups[item.id].totalQuantity += quantity;
-        }
-    });
-
     const rows = [];
-    Object.values(productGroups).forEach(product => {
+    products.forEach(product => {
+        const totalQuantity = product.batches.reduce((sum, batch) => sum + batch.quantity, 0);
+
         // Product header row
         rows.push(`
             <tr class="product-header">
                 <td><strong>${escapeHtml(product.name)}</strong></td>
                 <td style="text-align: center; font-weight: bold;">${escapeHtml(product.code)}</td>
                 <td></td>
-                <td style="text-align: center; font-weight: bold; color: #28a745;">${product.totalQuantity}</td>
+                <td style="text-align: center; font-weight: bold; color: #28a745;">${totalQuantity}</td>
                 <td style="text-align: center;">
                     <button class="btn btn-small" onclick="editProduct(${product.id}, '${escapeHtml(product.name)}')" style="padding: 2px 6px; font-size: 11px;">編輯</button>
                     <button class="btn btn-danger btn-small" onclick="deleteProduct(${product.id}, '${escapeHtml(product.name)}')" style="padding: 2px 6px; font-size: 11px;">刪除</button>
@@ -402,7 +505,7 @@ async function handleProductFormSubmit(e) {
         if (response.ok) {
             showMessage('產品新增成功', 'success');
             closeProductModal();
-            loadProducts();
+            refreshAfterWrite();
         } else {
             const error = await response.json();
             showMessage(error.error || '新增產品失敗', 'error');
@@ -446,7 +549,7 @@ async function handleBatchFormSubmit(e) {
         if (response.ok) {
             showMessage('批次新增成功', 'success');
             closeBatchModal();
-            loadProducts();
+            refreshAfterWrite();
         } else {
             const error = await response.json();
             showMessage(error.error || '新增批次失敗', 'error');
@@ -482,7 +585,7 @@ async function handleEditProductFormSubmit(e) {
         if (response.ok) {
             showMessage('產品更新成功', 'success');
             closeEditProductModal();
-            loadProducts();
+            refreshAfterWrite();
         } else {
             const error = await response.json();
             showMessage(error.error || '更新產品失敗', 'error');
@@ -525,7 +628,7 @@ async function handleEditBatchFormSubmit(e) {
         if (response.ok) {
             showMessage('批次更新成功', 'success');
             closeEditBatchModal();
-            loadProducts();
+            refreshAfterWrite();
         } else {
             const error = await response.json();
             showMessage(error.error || '更新批次失敗', 'error');
@@ -548,9 +651,10 @@ function editBatch(batchId, batchNumber) {
 
     // Find the batch quantity from productsData
     let batchQuantity = 1; // default
-    for (const item of productsData) {
-        if (parseInt(item.batch_id, 10) === numericBatchId) {
-            batchQuantity = item.quantity || 1;
+    for (const product of productsData) {
+        const batch = product.batches.find(b => b.id === numericBatchId);
+        if (batch) {
+            batchQuantity = batch.quantity || 1;
             break;
         }
     }
@@ -590,7 +694,7 @@ async function confirmDelete() {
             const itemType = currentDeletingType === 'product' ? '產品' : '批次';
             showMessage(`${itemType}刪除成功`, 'success');
             closeDeleteModal();
-            loadProducts();
+            refreshAfterWrite();
         } else {
             const error = await response.json();
             showMessage(error.error || '刪除失敗', 'error');
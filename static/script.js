@@ -317,21 +317,20 @@ async function displayResults(results) {
                             stockInBtn.disabled = true;
                             stockInBtn.textContent = '處理中...';
 
-                            const response = await fetch(`/api/batches/${productInfo.batch_id}`, {
-                                method: 'PUT',
+                            // Server applies quantity + 1 atomically, so concurrent scanners never lose increments
+                            const response = await fetch(`/api/batches/${productInfo.batch_id}/stock`, {
+                                method: 'POST',
                                 headers: {
                                     'Content-Type': 'application/json',
                                 },
-                                body: JSON.stringify({
-                                    batch_number: results.batch,
-                                    quantity: productInfo.quantity + 1
-                                })
+                                body: JSON.stringify({ delta: 1, source: 'scan' })
                             });
 
                             if (response.ok) {
+                                const stockResult = await response.json();
                                 statusDiv.textContent = '入庫成功！數量已增加。';
                                 statusDiv.style.color = '#28a745';
-                                productInfo.quantity += 1;
+                                productInfo.quantity = stockResult.quantity;
 
                                 // Update displayed quantity
                                 const quantityDiv = stockInBtn.parentElement.querySelector('div:nth-child(3)');
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+庫存異動帳：每次入庫/出庫追加一筆 stock_movements 記錄，batches.quantity
+在同一個交易中更新為物化數量；舊異動可壓縮成每個批次一筆快照
+
+用法: python stock_ledger.py compact [--days 天數]
+資料庫由 DATABASE_URL（PostgreSQL）或 SQLITE_PATH（預設 products.db）決定。
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Movements older than this are folded into one snapshot row per batch
+RETENTION_DAYS = float(os.environ.get('STOCK_LEDGER_RETENTION_DAYS', 90))
+SOURCE_MAX_LENGTH = 64
+
+
+def _sql(query, engine):
+    return query.replace('?', '%s') if engine == 'postgresql' else query
+
+
+def timestamp_param(value, engine):
+    """ISO-8601 text or datetime -> the form stored in created_at (UTC).
+
+    SQLite stores fixed-width text, so bounds must use the same format to
+    compare correctly. Raises ValueError for malformed input.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    if engine == 'postgresql':
+        return value
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + f'{value.microsecond // 1000:03d}Z'
+
+
+def record_movement(db, engine, batch_id, delta, source, events=1):
+    """Append one movement inside the caller's transaction"""
+    db.execute(_sql('INSERT INTO stock_movements (batch_id, delta, source, events) VALUES (?, ?, ?, ?)',
+                    engine), (batch_id, delta, source, events))
+
+
+def record_movements(db, engine, rows):
+    """Append (batch_id, delta, source, events) rows, skipping batches deleted meanwhile"""
+    db.executemany(_sql('''INSERT INTO stock_movements (batch_id, delta, source, events)
+                           SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM batches WHERE id = ?)''', engine),
+                   [(batch_id, delta, source, events, batch_id) for batch_id, delta, source, events in rows])
+
+
+def movement_json(row, balance_after):
+    created_at = row['created_at']
+    return {
+        'id': row['id'],
+        'delta': row['delta'],
+        'source': row['source'],
+        'events': row['events'],
+        'created_at': created_at if isinstance(created_at, str) else created_at.isoformat(),
+        'balance_after': balance_after
+    }
+
+
+def movement_history(db, engine, batch_id, quantity, since=None, until=None, before_id=None, limit=100):
+    """One page of a batch's movements, newest first, with the balance after each.
+
+    Balances are derived backwards from the materialized quantity, so they
+    stay right after compaction and for stock that predates the ledger.
+    Returns (movements, next_before_id); next_before_id is None on the last page.
+    """
+    conditions, params = ['batch_id = ?'], [batch_id]
+    if since is not None:
+        conditions.append('created_at >= ?')
+        params.append(timestamp_param(since, engine))
+    if until is not None:
+        conditions.append('created_at < ?')
+        params.append(timestamp_param(until, engine))
+    if before_id is not None:
+        conditions.append('id < ?')
+        params.append(before_id)
+    rows = db.execute(_sql(f'''SELECT id, delta, source, events, created_at FROM stock_movements
+                               WHERE {' AND '.join(conditions)}
+                               ORDER BY id DESC LIMIT ?''', engine), (*params, limit + 1)).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], None
+
+    newer = db.execute(_sql('SELECT COALESCE(SUM(delta), 0) FROM stock_movements WHERE batch_id = ? AND id > ?',
+                            engine), (batch_id, rows[0]['id'])).fetchone()[0]
+    balance = quantity - newer
+    movements = []
+    for row in rows:
+        movements.append(movement_json(row, balance))
+        balance -= row['delta']
+    return movements, rows[-1]['id'] if more else None
+
+
+def compact_movements(db, engine, before):
+    """Fold each batch's movements older than `before` into one snapshot row.
+
+    The newest folded row is kept (so ids stay in time order) and takes the
+    summed delta and event count; the others are deleted. Quantities and
+    balances are unchanged. Returns (batches compacted, rows removed).
+    """
+    cutoff = timestamp_param(before, engine)
+    try:
+        groups = db.execute(_sql('''SELECT batch_id, MAX(id), SUM(delta), SUM(events), COUNT(*)
+                                    FROM stock_movements WHERE created_at < ?
+                                    GROUP BY batch_id HAVING COUNT(*) > 1''', engine), (cutoff,)).fetchall()
+        db.executemany(_sql("UPDATE stock_movements SET delta = ?, events = ?, source = 'snapshot' WHERE id = ?",
+                            engine), [(total, events, keep) for _, keep, total, events, _ in groups])
+        db.executemany(_sql('DELETE FROM stock_movements WHERE batch_id = ? AND created_at < ? AND id <> ?',
+                            engine), [(batch_id, cutoff, keep) for batch_id, keep, _, _, _ in groups])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(groups), sum(count - 1 for *_, count in groups)
+
+
+def main():
+    from db_pool import postgres_connector, sqlite_connector
+
+    args = sys.argv[1:]
+    if not args or args[0] != 'compact':
+        print(__doc__)
+        sys.exit(1)
+    days = float(args[args.index('--days') + 1]) if '--days' in args else RETENTION_DAYS
+
+    database_url = os.environ.get('DATABASE_URL')
+    engine = 'postgresql' if database_url else 'sqlite'
+    connect = (postgres_connector(database_url) if database_url
+               else sqlite_connector(os.environ.get('SQLITE_PATH', 'products.db')))
+    db = connect()
+    try:
+        before = datetime.now(timezone.utc) - timedelta(days=days)
+        batches, removed = compact_movements(db, engine, before)
+        print(f'已壓縮 {batches} 個批次的異動，刪除 {removed} 筆（{days:g} 天以前）')
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+測試批次號查詢快取（LRU、TTL、負向快取與失效）
+"""
+
+from caches import LookupCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_and_counters():
+    cache = LookupCache(max_entries=2)
+    cache.put('a', {'v': 1})
+    cache.put('b', {'v': 2})
+    cache.get('a')  # 'a' becomes most recently used
+    cache.put('c', {'v': 3})
+
+    assert cache.is_miss(cache.get('b'))
+    assert cache.get('a') == {'v': 1}
+    status = cache.status()
+    assert status['evictions'] == 1
+    assert status['hits'] == 2
+    assert status['misses'] == 1
+
+
+def test_ttl_and_negative_ttl():
+    clock = FakeClock()
+    cache = LookupCache(ttl=10, negative_ttl=2, clock=clock)
+    cache.put('found', {'v': 1})
+    cache.put('unknown', None)
+
+    assert cache.get('unknown') is None
+    assert cache.status()['negative_hits'] == 1
+
+    clock.now = 3
+    assert cache.is_miss(cache.get('unknown'))
+    assert cache.get('found') == {'v': 1}
+
+    clock.now = 11
+    assert cache.is_miss(cache.get('found'))
+    assert cache.status()['expirations'] == 2
+
+
+def test_tag_invalidation_and_generation_guard():
+    cache = LookupCache()
+    cache.put('x', {'v': 1}, tags=[('product', 1)])
+    cache.put('y', {'v': 2}, tags=[('product', 1)])
+    cache.put('z', {'v': 3}, tags=[('product', 2)])
+
+    generation = cache.generation
+    cache.invalidate_tag(('product', 1))
+    assert cache.is_miss(cache.get('x')) and cache.is_miss(cache.get('y'))
+    assert cache.get('z') == {'v': 3}
+
+    # A result read before the invalidation must not be stored afterwards
+    cache.put('x', {'v': 'stale'}, generation=generation)
+    assert cache.is_miss(cache.get('x'))
+
+
+def test_lookups_are_cached_and_invalidated_by_writes(client, app_db, monkeypatch):
+    with app_db.app.app_context():
+        product = app_db.add_product('Cached Lookup')
+        batch = app_db.add_batch_to_product(product['id'], '5000000001')
+
+    queries = []
+    original = app_db.query_product_by_batch
+
+    def counting_query(batch_number):
+        queries.append(batch_number)
+        return original(batch_number)
+
+    monkeypatch.setattr(app_db, 'query_product_by_batch', counting_query)
+
+    for _ in range(3):
+        assert client.get('/api/search_product/5000000001').get_json()['quantity'] == 1
+    assert queries == ['5000000001']
+
+    client.post(f"/api/batches/{batch['id']}/stock", json={'delta': 2})
+    assert client.get('/api/search_product/5000000001').get_json()['quantity'] == 3
+
+    client.put(f"/api/products/{product['id']}", json={'name': 'Renamed'})
+    assert client.get('/api/search_product/5000000001').get_json()['name'] == 'Renamed'
+
+    client.delete(f"/api/batches/{batch['id']}")
+    assert client.get('/api/search_product/5000000001').get_json()['found'] is False
+    assert len(queries) == 4
+
+
+def test_negative_result_cleared_when_batch_registered(client, app_db):
+    with app_db.app.app_context():
+        product_id = app_db.add_product('Late Registration')['id']
+
+    assert client.get('/api/search_product/5000000002').get_json()['found'] is False
+    assert client.get('/api/search_product/5000000002').get_json()['found'] is False
+
+    client.post('/api/batches', json={'product_id': product_id, 'batch_number': '5000000002'})
+    assert client.get('/api/search_product/5000000002').get_json()['found'] is True
+
+    client.post(f'/api/batches/bulk?product_id={product_id}', data='5000000003\n',
+                content_type='text/csv')
+    stats = client.get('/api/cache_stats').get_json()['batch_lookup']
+    assert stats['negative_hits'] == 1
+    assert stats['invalidations'] >= 2
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+測試容錯批次號解析（OCR 混淆字元、編輯距離、與資料庫寫入同步）
+"""
+
+import random
+import time
+
+from batch_resolver import BatchResolver, build_resolver
+
+
+def test_exact_and_confusion_matches():
+    resolver = build_resolver(['5012345678', '5098765432'])
+
+    assert resolver.resolve('5012345678')[1:4] == ('5012345678', 1.0, 'exact')
+    result = resolver.resolve('5O1234S678')
+    assert (result.batch_number, result.method, result.distance) == ('5012345678', 'confusion', 0)
+    assert 0.7 <= result.confidence < 1.0
+    assert resolver.resolve(' 50-1234 5678 ').method == 'exact'
+
+
+def test_edit_distance_substitution_and_indels():
+    resolver = build_resolver(['5012345678', '5111111111'])
+
+    assert resolver.resolve('5012345679')[1:5] == ('5012345678', 0.75, 'edit', 1)
+    assert resolver.resolve('501234567')[1:5] == ('5012345678', 0.75, 'edit', 1)    # dropped digit
+    assert resolver.resolve('50123456789')[1:5] == ('5012345678', 0.75, 'edit', 1)  # extra digit
+    assert resolver.resolve('5999999999').method == 'none'
+
+
+def test_ties_are_reported_with_lower_confidence():
+    resolver = build_resolver(['5000000001', '5000000002'])
+
+    result = resolver.resolve('5000000003')
+    assert result.batch_number == '5000000001'
+    assert result.alternatives == ['5000000002']
+    assert result.confidence == 0.375
+
+
+def test_matches_brute_force_levenshtein():
+    from batch_resolver import _levenshtein, normalize
+    rng = random.Random(3)
+    numbers = ['5' + ''.join(rng.choice('0123456789') for _ in range(9)) for _ in range(400)]
+    resolver = build_resolver(numbers)
+
+    for _ in range(150):
+        chars = list(rng.choice(numbers))
+        position = rng.randrange(10)
+        operation = rng.choice(('sub', 'del', 'ins'))
+        if operation == 'sub':
+            chars[position] = rng.choice('0123456789')
+        elif operation == 'del':
+            del chars[position]
+        else:
+            chars.insert(position, rng.choice('0123456789'))
+        query = ''.join(chars)
+
+        best = min(_levenshtein(query, normalize(n), 1) for n in numbers)
+        result = resolver.resolve(query)
+        if best == 0:
+            assert result.method == 'exact'
+        else:
+            assert result.distance == best
+            assert _levenshtein(query, result.batch_number, 1) == best
+
+
+def test_remove_and_rename():
+    resolver = BatchResolver()
+    resolver.add('5012345678')
+    resolver.rename('5012345678', '5087654321')
+
+    assert resolver.resolve('5012345678').method == 'none'
+    assert resolver.resolve('5087654321').method == 'exact'
+    resolver.remove('5087654321')
+    assert resolver.status()['size'] == 0
+
+
+def test_resolve_is_fast_on_a_large_catalog():
+    rng = random.Random(5)
+    resolver = build_resolver('5' + ''.join(rng.choice('0123456789') for _ in range(9))
+                              for _ in range(100000))
+    queries = ['5' + ''.join(rng.choice('0123456789O') for _ in range(9)) for _ in range(500)]
+
+    started = time.perf_counter()
+    for query in queries:
+        resolver.resolve(query)
+    assert (time.perf_counter() - started) / len(queries) < 0.005
+
+
+def test_endpoint_follows_catalog_writes(client, app_db):
+    with app_db.app.app_context():
+        product = app_db.add_product('Resolver Test')
+        batch = app_db.add_batch_to_product(product['id'], '5012345678', 3)
+
+    data = client.post('/api/resolve_batch', json={'candidates': ['5O12345678', '5999999999']}).get_json()
+    first, second = data['results']
+    assert (first['batch_number'], first['method']) == ('5012345678', 'confusion')
+    assert first['product_info']['name'] == 'Resolver Test'
+    assert (second['batch_number'], second['product_info']) == (None, None)
+
+    with app_db.app.app_context():
+        app_db.update_batch(batch['id'], batch_number='5087654321')
+    data = client.post('/api/resolve_batch', json={'candidate': '5O87654321'}).get_json()
+    assert data['results'][0]['batch_number'] == '5087654321'
+
+    with app_db.app.app_context():
+        app_db.delete_product(product['id'])
+    data = client.post('/api/resolve_batch', json={'candidate': '5087654321'}).get_json()
+    assert data['results'][0]['method'] == 'none'
+
+
+def test_endpoint_validation(client):
+    assert client.post('/api/resolve_batch', json={}).status_code == 400
+    assert client.post('/api/resolve_batch', json={'candidates': [1]}).status_code == 400
+
+
+def test_other_process_writes_are_picked_up_by_resync(client, app_db, monkeypatch):
+    monkeypatch.setattr(app_db, 'BATCH_RESOLVER_RESYNC_INTERVAL', 0)
+    client.post('/api/resolve_batch', json={'candidate': '5012345678'})  # builds the index
+
+    # Written behind the resolver's back, as another worker would
+    with app_db.app.app_context():
+        db = app_db.get_db()
+        db.execute("INSERT INTO products (name, code) VALUES ('Elsewhere', 'ZZ')")
+        db.execute("INSERT INTO batches (product_id, batch_number) VALUES (last_insert_rowid(), '5012345678')")
+        app_db.bump_catalog_version(db)
+        db.commit()
+
+    client.post('/api/resolve_batch', json={'candidate': '5012345678'})  # starts the rebuild
+    deadline = time.monotonic() + 5
+    while app_db._resolver_state['pending'] is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    data = client.post('/api/resolve_batch', json={'candidate': '5012345678'}).get_json()
+    assert data['results'][0]['method'] == 'exact'
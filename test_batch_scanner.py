@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+測試批次號識別引擎（與舊版逐行提取邏輯相容）
+"""
+
+import pytest
+
+import batch_scanner
+from app import extract_batch_from_text
+
+# Same cases as test_batch_extraction.py
+LEGACY_CASES = [
+    ("PRODUCT: 5123456789 LOT: ABC123", "5123456789"),
+    ("BATCH 5ABCDEFGHI STATUS: OK", "5ABCDEFGHI"),
+    ("CODE: 5A1B2C3D4E QUALITY: GOOD", "5A1B2C3D4E"),
+    ("ITEM: 5 123 456 789 TYPE: A", "5123456789"),
+    ("NUMBER: 5-ABC-DEF-GHI STATUS: PASS", "5ABCDEFGHI"),
+    ("LOT: L123456789 STATUS: OK", None),
+    ("CODE: 512345678 STATUS: OK", None),
+    ("BATCH: 6123456789 TYPE: B", None),
+    ("START 5123456789 END", "5123456789"),
+    ("BEFORE 5ABCDEFGHI AFTER", "5ABCDEFGHI"),
+]
+
+
+@pytest.fixture(autouse=True)
+def default_formats():
+    batch_scanner.reset_formats()
+    yield
+    batch_scanner.reset_formats()
+
+
+@pytest.mark.parametrize('text, expected', LEGACY_CASES)
+def test_legacy_cases(text, expected):
+    assert extract_batch_from_text(text) == expected
+
+
+def test_lowercase_and_multiline_input():
+    assert extract_batch_from_text('header\n  lot: 5abc123def  \nfooter') == '5ABC123DEF'
+
+
+def test_first_line_with_any_match_wins():
+    text = 'ITEM 5 123 456 789\nPRODUCT 5999999999'
+    assert extract_batch_from_text(text) == '5123456789'
+
+
+def test_standard_format_beats_earlier_spaced_on_same_line():
+    assert extract_batch_from_text('5 111 222 333 THEN 5999999999') == '5999999999'
+    # The standard code overlaps the spaced match and must still be found
+    assert extract_batch_from_text('5 123 456 5123456789') == '5123456789'
+
+
+def test_spaced_format_does_not_cross_lines():
+    assert extract_batch_from_text('5\n123 456 789') is None
+
+
+def test_scan_reports_every_match_with_format_and_offset():
+    matches = list(batch_scanner.scan('A 5123456789 B 5-ABC-DEF-GHI\n5 000 111 222'))
+    assert [(m.format, m.offset, m.value) for m in matches] == [
+        ('standard', 2, '5123456789'),
+        ('dashed', 15, '5ABCDEFGHI'),
+        ('spaced', 29, '5000111222'),
+    ]
+
+
+def test_extra_supplier_format():
+    batch_scanner.register_format('supplier_x', r'\bX[0-9]{8}\b', lead='X', validate=bool)
+    assert batch_scanner.registered_formats() == ['standard', 'spaced', 'dashed', 'supplier_x']
+
+    matches = list(batch_scanner.scan('lot x12345678 / 5123456789'))
+    assert [(m.format, m.value) for m in matches] == [('supplier_x', 'X12345678'), ('standard', '5123456789')]
+    # Built-in formats keep priority on the same line
+    assert extract_batch_from_text('lot x12345678 / 5123456789') == '5123456789'
+    assert extract_batch_from_text('lot x12345678') == 'X12345678'
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+測試批次大量匯入 API
+"""
+
+import json
+
+import bulk_import
+
+
+def make_product(app_db, name='Bulk Test'):
+    with app_db.app.app_context():
+        return app_db.add_product(name)['id']
+
+
+def count_batches(app_db):
+    with app_db.app.app_context():
+        return app_db.get_db().execute('SELECT COUNT(*) FROM batches').fetchone()[0]
+
+
+def test_csv_with_header(client, app_db):
+    product_id = make_product(app_db)
+    body = f'product_id,batch_number,quantity\n{product_id},5000000001,3\n{product_id},5000000002,\n'
+
+    response = client.post('/api/batches/bulk', data=body, content_type='text/csv')
+    report = response.get_json()
+
+    assert response.status_code == 200
+    assert report['inserted'] == 2
+    assert report['problems'] == []
+    info = client.get('/api/search_product/5000000001').get_json()
+    assert info['quantity'] == 3
+
+
+def test_csv_batch_numbers_only_with_default_product(client, app_db):
+    product_id = make_product(app_db)
+    body = '5000000001\n5000000002\n\n5000000003\n'
+
+    response = client.post(f'/api/batches/bulk?product_id={product_id}', data=body,
+                           content_type='text/csv')
+
+    assert response.get_json()['inserted'] == 3
+
+
+def test_ndjson_reports_duplicates_and_rejects(client, app_db):
+    product_id = make_product(app_db)
+    with app_db.app.app_context():
+        app_db.add_batch_to_product(product_id, '5000000001')
+
+    rows = [
+        {'product_id': product_id, 'batch_number': '5000000001'},  # already registered
+        {'product_id': product_id, 'batch_number': '5000000002'},
+        {'product_id': product_id, 'batch_number': '5000000002'},  # repeated in upload
+        {'product_id': product_id, 'batch_number': '6000000003'},  # wrong prefix
+        {'product_id': 999, 'batch_number': '5000000004'},         # unknown product
+    ]
+    body = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+
+    response = client.post('/api/batches/bulk', data=body, content_type='application/x-ndjson')
+    report = response.get_json()
+
+    assert report['total_rows'] == 6
+    assert report['inserted'] == 1
+    assert report['duplicates'] == 2
+    assert report['rejected'] == 3
+    assert [(p['line'], p['status']) for p in report['problems']] == [
+        (1, 'duplicate'), (3, 'duplicate'), (4, 'rejected'), (5, 'rejected'), (6, 'rejected'),
+    ]
+
+
+def test_large_upload_is_inserted_in_chunks(client, app_db, monkeypatch):
+    monkeypatch.setattr(bulk_import, 'CHUNK_SIZE', 100)
+    product_id = make_product(app_db)
+    calls = []
+    original = bulk_import.insert_chunk_sqlite
+
+    def counting_insert(db, rows, before_commit=None):
+        calls.append(len(rows))
+        return original(db, rows, before_commit)
+
+    monkeypatch.setattr(bulk_import, 'insert_chunk_sqlite', counting_insert)
+
+    # Repeat the first batch at the end so the cross-chunk duplicate is caught by the database
+    body = ''.join(f'{product_id},5{i:09d}\n' for i in range(1050)) + f'{product_id},5000000000\n'
+    response = client.post('/api/batches/bulk', data=body, content_type='text/csv')
+    report = response.get_json()
+
+    assert report['inserted'] == 1050
+    assert report['duplicates'] == 1
+    assert calls == [100] * 10 + [51]
+    assert count_batches(app_db) == 1050
+
+
+def test_unknown_format_is_rejected(client, app_db):
+    response = client.post('/api/batches/bulk?format=xml', data='<x/>')
+    assert response.status_code == 400
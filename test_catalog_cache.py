@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+測試目錄版本號、ETag/304 與回應快取
+"""
+
+
+def version(app_db):
+    with app_db.app.app_context():
+        return app_db.get_catalog_version()
+
+
+def test_every_write_path_bumps_version(client, app_db):
+    start = version(app_db)
+    with app_db.app.app_context():
+        product = app_db.add_product('Versioned')
+        batch = app_db.add_batch_to_product(product['id'], '5000000001')
+        assert app_db.update_product(product['id'], 'Versioned 2')
+        assert app_db.update_batch(batch['id'], quantity=7)
+        assert app_db.adjust_batch_quantity(1, batch_id=batch['id'])
+        assert app_db.delete_batch(batch['id'])
+        assert app_db.delete_product(product['id'])
+    assert version(app_db) == start + 7
+
+    # Writes that change nothing leave the version alone
+    with app_db.app.app_context():
+        assert not app_db.update_product(999, 'Missing')
+        assert not app_db.delete_batch(999)
+    assert version(app_db) == start + 7
+
+
+def test_bulk_import_bumps_version(client, app_db):
+    with app_db.app.app_context():
+        product_id = app_db.add_product('Bulk')['id']
+    before = version(app_db)
+    client.post(f'/api/batches/bulk?product_id={product_id}', data='5000000001\n5000000002\n',
+                content_type='text/csv')
+    assert version(app_db) == before + 1
+
+
+def test_etag_and_not_modified(client, app_db):
+    with app_db.app.app_context():
+        app_db.add_product('Tagged')
+
+    first = client.get('/api/products')
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+
+    second = client.get('/api/products', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+
+    # Different query parameters are a different representation
+    other = client.get('/api/products?shape=grouped', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+    assert other.headers['ETag'] != etag
+
+    client.post('/api/products', json={'name': 'Another', 'batch_number': '5000000009'})
+    third = client.get('/api/products', headers={'If-None-Match': etag})
+    assert third.status_code == 200
+    assert len(third.get_json()) == 2
+
+
+def test_unchanged_catalog_is_served_from_cache(client, app_db, monkeypatch):
+    with app_db.app.app_context():
+        app_db.add_product('Cached')
+
+    first = client.get('/api/products?shape=grouped')
+
+    def fail(*args, **kwargs):
+        raise AssertionError('catalog should not be re-queried')
+
+    monkeypatch.setattr(app_db, 'iter_all_products', fail)
+    second = client.get('/api/products?shape=grouped')
+    assert second.data == first.data
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+測試目錄搜尋 API（GET /api/search）：前綴與子字串比對、排序、三字元索引同步
+"""
+
+
+def add_catalog(app_db):
+    with app_db.app.app_context():
+        tea = app_db.add_product('Green Tea')
+        teapot = app_db.add_product('Teapot')
+        coffee = app_db.add_product('Iced Coffee')
+        app_db.add_batch_to_product(tea['id'], '5012345678')
+        app_db.add_batch_to_product(tea['id'], '5012399999')
+        app_db.add_batch_to_product(coffee['id'], '5099912345')
+        return tea, teapot, coffee
+
+
+def search(client, **params):
+    response = client.get('/api/search', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()['results']
+
+
+def test_batch_prefix_then_infix(client, app_db):
+    add_catalog(app_db)
+
+    results = search(client, q='50123', fields='batch_number')
+    assert [(r['batch_number'], r['match']) for r in results] == [
+        ('5012345678', 'prefix'), ('5012399999', 'prefix')]
+
+    results = search(client, q='12345', fields='batch_number')
+    assert sorted(r['batch_number'] for r in results) == ['5012345678', '5099912345']
+    assert {r['match'] for r in results} == {'infix'}
+    assert search(client, q='5012345678')[0]['match'] == 'exact'
+
+
+def test_name_search_is_case_insensitive_and_ranked(client, app_db):
+    add_catalog(app_db)
+
+    results = search(client, q='tea', fields='name')
+    # Prefix match (Teapot) ranks above the substring match (Green Tea, once per batch)
+    assert [(r['name'], r['match']) for r in results] == [
+        ('Teapot', 'prefix'), ('Green Tea', 'infix'), ('Green Tea', 'infix')]
+    assert search(client, q='COFF', fields='name')[0]['name'] == 'Iced Coffee'
+
+
+def test_short_queries_only_match_prefixes(client, app_db):
+    add_catalog(app_db)
+
+    assert [r['name'] for r in search(client, q='te', fields='name')] == ['Teapot']
+    assert [r['code'] for r in search(client, q='b', fields='code')] == ['B']
+
+
+def test_limit_and_validation(client, app_db):
+    add_catalog(app_db)
+
+    assert len(search(client, q='50', limit=2)) == 2
+    assert client.get('/api/search').status_code == 400
+    assert client.get('/api/search?q=50&fields=quantity').status_code == 400
+
+
+def test_index_follows_updates_and_deletes(client, app_db):
+    tea, _, coffee = add_catalog(app_db)
+    batch_id = search(client, q='5099912345')[0]['batch_id']
+    with app_db.app.app_context():
+        app_db.update_batch(batch_id, batch_number='5077777777')
+        app_db.update_product(tea['id'], 'Black Tea')
+        app_db.delete_product(coffee['id'])
+
+    assert search(client, q='99912', fields='batch_number') == []
+    assert search(client, q='Green', fields='name') == []
+    assert {r['name'] for r in search(client, q='ack t', fields='name')} == {'Black Tea'}
+    assert search(client, q='77777', fields='batch_number') == []  # deleted with its product
+
+
+def test_substring_queries_use_the_trigram_index(app_db):
+    from catalog_search import infix_condition
+    add_catalog(app_db)
+    with app_db.app.app_context():
+        db = app_db.get_db()
+        for field, table in (('batch_number', 'batches_fts'), ('name', 'products_fts')):
+            sql, params = infix_condition(field, 'abc', 'sqlite')
+            plan = ' | '.join(row[3] for row in db.execute(
+                f'EXPLAIN QUERY PLAN SELECT p.id FROM products p JOIN batches b ON p.id = b.product_id '
+                f'WHERE {sql}', params))
+            assert 'VIRTUAL TABLE INDEX' in plan and table in plan, plan
+
+
+def test_products_page_name_filter_matches_substrings(client, app_db):
+    add_catalog(app_db)
+
+    items = client.get('/api/products?name=een%20t').get_json()['items']
+    assert {item['name'] for item in items} == {'Green Tea'}
+    items = client.get('/api/products?name=t').get_json()['items']  # short: plain LIKE
+    assert {item['name'] for item in items} == {'Green Tea', 'Teapot'}
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+測試目錄變更紀錄（增量同步、墓碑、分頁、墓碑清除後要求重新同步、遷移回填）
+"""
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import init_db
+import migrations
+from changefeed import prune_changes
+
+
+def sync(client, since=0, limit=1000):
+    """Follow next_cursor to the end; returns (changes, new since, bytes transferred)"""
+    changes, cursor, transferred = [], None, 0
+    while True:
+        url = f'/api/changes?since={since}&limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200, response.get_json()
+        transferred += len(response.get_data())
+        page = response.get_json()
+        changes.extend(page['changes'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return changes, page['version'], transferred
+
+
+def apply(replica, changes):
+    for change in changes:
+        key = (change['entity'], change['id'])
+        if change['deleted']:
+            replica.pop(key, None)
+        else:
+            replica[key] = {k: v for k, v in change.items() if k not in ('entity', 'id', 'version', 'deleted')}
+
+
+def catalog(client):
+    """The same shape as a replica, from the full /api/products dump"""
+    state = {}
+    for row in client.get('/api/products').get_json():
+        state[('product', row['id'])] = {'name': row['name'], 'code': row['code']}
+        if row['batch_id'] is not None:
+            state[('batch', row['batch_id'])] = {'product_id': row['id'], 'batch_number': row['batch_number'],
+                                                 'quantity': row['quantity']}
+    return state
+
+
+def test_replica_catches_up_with_only_the_changed_rows(client):
+    ids = [client.post('/api/products', json={'name': f'P{i}', 'batch_number': f'50000000{i:02d}'}).get_json()
+           for i in range(20)]
+    replica = {}
+    changes, since, full_bytes = sync(client)
+    apply(replica, changes)
+    assert replica == catalog(client) and len(changes) == 40
+
+    client.post(f'/api/batches/{ids[0]["batch_id"]}/stock', json={'delta': 2})
+    client.post(f'/api/batches/{ids[0]["batch_id"]}/stock', json={'delta': 3})
+    client.put(f'/api/products/{ids[1]["id"]}', json={'name': 'Renamed'})
+    client.delete(f'/api/batches/{ids[2]["batch_id"]}')
+    client.delete(f'/api/products/{ids[3]["id"]}')
+
+    changes, new_since, delta_bytes = sync(client, since)
+    assert new_since > since
+    assert sorted((c['entity'], c['id'], c['deleted']) for c in changes) == sorted([
+        ('batch', ids[0]['batch_id'], False), ('product', ids[1]['id'], False),
+        ('batch', ids[2]['batch_id'], True), ('product', ids[3]['id'], True), ('batch', ids[3]['batch_id'], True)])
+    apply(replica, changes)
+    assert replica == catalog(client)
+    assert replica[('batch', ids[0]['batch_id'])]['quantity'] == 6
+    assert delta_bytes < full_bytes / 4
+
+    assert sync(client, new_since)[:2] == ([], new_since)
+
+
+def test_paging_splits_one_version_without_gaps(client):
+    product = client.post('/api/products', json={'name': 'Bulk', 'batch_number': '5000000000'}).get_json()
+    _, since, _ = sync(client)
+    body = ''.join(f'5{i:09d}\n' for i in range(1, 26))
+    client.post(f'/api/batches/bulk?product_id={product["id"]}', data=body, content_type='text/csv')
+
+    changes, _, _ = sync(client, since, limit=7)
+    assert len(changes) == 25 and len({c['id'] for c in changes}) == 25
+    assert len({c['version'] for c in changes}) == 1
+
+
+def test_pruned_tombstones_force_a_full_resync(client, app_db):
+    first = client.post('/api/products', json={'name': 'Gone', 'batch_number': '5000000001'}).get_json()
+    client.post('/api/products', json={'name': 'Kept', 'batch_number': '5000000002'})
+    _, since, _ = sync(client)
+    client.delete(f'/api/products/{first["id"]}')
+
+    with app_db.app.app_context():
+        removed, horizon = prune_changes(app_db.get_db(), 'sqlite', datetime.now(timezone.utc) + timedelta(days=1))
+    assert removed == 2 and horizon > since
+
+    response = client.get(f'/api/changes?since={since}')
+    assert response.status_code == 410
+    assert response.get_json()['horizon'] == horizon
+    changes, _, _ = sync(client, 0)
+    assert {c['entity'] for c in changes} == {'product', 'batch'} and not any(c['deleted'] for c in changes)
+    assert client.get('/api/changes?since=999999').status_code == 410
+
+
+def test_write_behind_flush_is_logged(client, app_db, monkeypatch):
+    monkeypatch.setattr(app_db, 'STOCK_WRITE_BEHIND', True)
+    product = client.post('/api/products', json={'name': 'Buffered', 'batch_number': '5000000001'}).get_json()
+    _, since, _ = sync(client)
+    client.post(f'/api/batches/{product["batch_id"]}/stock', json={'delta': 4, 'source': 'scan'})
+    app_db.close_stock_buffer()
+
+    changes, _, _ = sync(client, since)
+    assert [(c['id'], c['quantity']) for c in changes] == [(product['batch_id'], 5)]
+
+
+def test_rejects_bad_parameters(client):
+    assert client.get('/api/changes?since=-1').status_code == 400
+    assert client.get('/api/changes?since=abc').status_code == 400
+    assert client.get('/api/changes?cursor=bogus').status_code == 400
+
+
+def test_migration_backfills_existing_rows(tmp_path):
+    db = sqlite3.connect(str(tmp_path / 'old.db'))
+    db.row_factory = sqlite3.Row
+    migrations.migrate(db, 'sqlite', target=7)
+    db.execute("INSERT INTO products (id, name, code) VALUES (1, 'Old', 'A')")
+    db.execute("INSERT INTO batches (id, product_id, batch_number) VALUES (7, 1, '5000000007')")
+    db.execute('UPDATE catalog_version SET version = 12')
+    db.commit()
+
+    assert migrations.migrate(db, 'sqlite') == [8, 9]
+    rows = db.execute('SELECT entity, entity_id, version, deleted FROM catalog_changes ORDER BY entity').fetchall()
+    assert [tuple(r) for r in rows] == [('batch', 7, 12, 0), ('product', 1, 12, 0)]
+
+
+def test_sample_data_is_logged(tmp_path, monkeypatch):
+    monkeypatch.setattr(init_db, 'DATABASE', str(tmp_path / 'sample.db'))
+    init_db.init_database()
+
+    db = sqlite3.connect(init_db.DATABASE)
+    version = db.execute('SELECT version FROM catalog_version').fetchone()[0]
+    rows = db.execute('SELECT entity, COUNT(*), MIN(version) FROM catalog_changes GROUP BY entity ORDER BY entity')
+    assert version > 0 and [tuple(r) for r in rows] == [('batch', 5, version), ('product', 3, version)]
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+測試資料庫連線池
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeout, sqlite_connector
+
+
+def make_pool(tmp_path, **kwargs):
+    return ConnectionPool(sqlite_connector(str(tmp_path / 'pool.db')), **kwargs)
+
+
+def test_connection_is_reused(tmp_path):
+    pool = make_pool(tmp_path, max_size=2)
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+    pool.release(second)
+
+    assert first is second
+    assert pool.status()['created'] == 1
+    assert pool.status()['reused'] == 1
+
+
+def test_same_thread_gets_same_connection(tmp_path):
+    pool = make_pool(tmp_path, max_size=1)
+    outer = pool.acquire()
+    inner = pool.acquire()
+    assert inner is outer
+
+    pool.release(inner)
+    assert pool.status()['idle'] == 0
+    pool.release(outer)
+    assert pool.status()['idle'] == 1
+
+
+def test_pool_is_bounded(tmp_path):
+    pool = make_pool(tmp_path, max_size=1, timeout=0.05)
+    held = pool.acquire()
+    errors = []
+
+    def worker():
+        try:
+            pool.acquire()
+        except PoolTimeout as e:
+            errors.append(e)
+
+    t = threading.Thread(target=worker)
+    t.start()
+    t.join()
+    pool.release(held)
+
+    assert len(errors) == 1
+    assert pool.status()['timeouts'] == 1
+
+
+def test_broken_connection_is_replaced(tmp_path):
+    pool = make_pool(tmp_path, max_size=1, ping_interval=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.close()  # simulate a connection dropped while idle
+
+    fresh = pool.acquire()
+    assert fresh is not conn
+    assert fresh.execute('SELECT 1').fetchone()[0] == 1
+    pool.release(fresh)
+    assert pool.status()['discarded'] == 1
+
+
+def test_open_transaction_is_rolled_back_on_return(tmp_path):
+    pool = make_pool(tmp_path, max_size=1)
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.commit()
+    conn.execute('INSERT INTO t VALUES (1)')
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    pool.release(conn)
+
+
+def test_unpooled_mode_closes_connections(tmp_path):
+    pool = make_pool(tmp_path, max_size=0)
+    conn = pool.acquire()
+    pool.release(conn)
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+
+
+def test_requests_share_pooled_connection(client, app_db):
+    client.get('/api/search_product/5123456789')
+    client.get('/api/search_product/5123456789')
+
+    status = app_db.get_db_pool().status()
+    assert status['size'] == 1
+    assert status['idle'] == 1
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+測試庫存異動推播（事件廣播、斷線續傳、落後重新同步、訂閱上限、/api/events 串流）
+"""
+
+import json
+import time
+
+import pytest
+
+from events import EventBroker
+
+
+def parse_frames(text):
+    """SSE text -> [(event, data)] for the frames that carry an event"""
+    frames = []
+    for block in text.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            frames.append((fields['event'], json.loads(fields['data'])))
+    return frames
+
+
+def read_events(stream, count):
+    """Pull chunks until `count` events (after hello/resync) have arrived"""
+    events = []
+    while len(events) < count:
+        events.extend(parse_frames(next(stream)))
+    return events
+
+
+def test_one_publish_reaches_every_subscriber():
+    broker = EventBroker(max_subscribers=200)
+    streams = [broker.stream(broker.subscribe(), heartbeat=5) for _ in range(200)]
+    for stream in streams:
+        next(stream)  # retry
+        assert parse_frames(next(stream))[0][0] == 'hello'
+
+    broker.publish('quantity_changed', {'id': 1, 'quantity': 4}, version=7)
+    for stream in streams:
+        assert parse_frames(next(stream)) == [('quantity_changed', {'id': 1, 'quantity': 4, 'version': 7})]
+    assert broker.status()['subscribers'] == 200
+    assert broker.status()['published'] == 1
+
+
+def test_reconnect_resumes_or_resyncs():
+    broker = EventBroker(backlog=3)
+    first = broker.publish('product_created', {'id': 1})
+    broker.publish('product_updated', {'id': 1, 'name': 'B'})
+
+    stream = broker.stream(broker.subscribe(first), heartbeat=5)
+    next(stream)
+    assert parse_frames(next(stream))[0][0] == 'hello'
+    assert read_events(stream, 1) == [('product_updated', {'id': 1, 'name': 'B'})]
+
+    for i in range(5):
+        broker.publish('product_deleted', {'id': i})
+    for last_id in (first, 'otherprocess-2', 'garbage'):
+        stream = broker.stream(broker.subscribe(last_id), heartbeat=5)
+        next(stream)
+        assert parse_frames(next(stream))[0][0] == 'resync'
+
+
+def test_slow_subscriber_past_the_ring_gets_resync():
+    broker = EventBroker(backlog=2)
+    stream = broker.stream(broker.subscribe(), heartbeat=5)
+    next(stream), next(stream)
+    for i in range(5):
+        broker.publish('batch_deleted', {'id': i}, version=i + 1)
+    assert parse_frames(next(stream)) == [('resync', {'version': 5})]
+
+
+def test_subscriber_limit_and_close():
+    broker = EventBroker(max_subscribers=2)
+    subscriptions = [broker.subscribe(), broker.subscribe()]
+    assert broker.subscribe() is None
+    subscriptions[0].close()
+    subscriptions[0].close()  # idempotent
+    assert broker.subscribe() is not None
+
+    stream = broker.stream(subscriptions[1], heartbeat=0.01)
+    next(stream), next(stream)
+    assert next(stream) == ': keepalive\n\n'
+    broker.close()
+    with pytest.raises(StopIteration):
+        next(stream)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_poller_relays_writes_from_other_processes():
+    version = 3
+    feed = [{'entity': 'batch', 'id': 9, 'version': 4, 'deleted': False, 'product_id': 2,
+             'batch_number': '5000000009', 'quantity': 3},
+            {'entity': 'product', 'id': 2, 'version': 5, 'deleted': False, 'name': 'Mine', 'code': 'B'},
+            {'entity': 'product', 'id': 1, 'version': 6, 'deleted': True}]
+
+    def changes(after, upto, limit):
+        assert limit == 100
+        return feed if (after, upto) == (3, 6) else None
+
+    broker = EventBroker(poll=lambda: version, changes=changes, poll_interval=0.01, relay_limit=100)
+    stream = broker.stream(broker.subscribe(), heartbeat=5)
+    next(stream), next(stream)
+    wait_for(lambda: broker.stats['polls'] >= 1)
+
+    broker.publish('product_updated', {'id': 2, 'name': 'Mine'}, version=5)  # this process's write
+    version = 6
+    assert read_events(stream, 3) == [
+        ('product_updated', {'id': 2, 'name': 'Mine', 'version': 5}),
+        ('product_deleted', {'id': 1, 'version': 6}),
+        ('batch_changed', {'id': 9, 'product_id': 2, 'batch_number': '5000000009', 'quantity': 3, 'version': 4})]
+
+    wait_for(lambda: broker.status()['version'] == 6)
+    version = 8  # too many changes to relay one by one
+    assert read_events(stream, 1) == [('resync', {'version': 8})]
+    assert broker.stats['relayed'] == 2
+    broker.close()
+
+
+@pytest.fixture
+def events_client(app_db, client):
+    yield app_db, client
+    app_db.reset_event_broker()
+
+
+def open_stream(client):
+    response = client.get('/api/events', buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    stream = response.iter_encoded()
+    next(stream)
+    hello = parse_frames(next(stream).decode())
+    return response, (chunk.decode() for chunk in stream), hello
+
+
+def test_writes_publish_change_events(events_client):
+    app_db, client = events_client
+    response, stream, hello = open_stream(client)
+    assert hello[0][0] == 'hello'
+
+    product = client.post('/api/products', json={'name': 'Live', 'batch_number': '5000000001'}).get_json()
+    batch_id = product['batch_id']
+    client.post(f'/api/batches/{batch_id}/stock', json={'delta': 4, 'source': 'scan'})
+    client.put(f'/api/batches/{batch_id}', json={'batch_number': '5000000002'})
+    client.put(f'/api/products/{product["id"]}', json={'name': 'Live 2'})
+    client.delete(f'/api/batches/{batch_id}')
+    client.delete(f'/api/products/{product["id"]}')
+
+    events = read_events(stream, 7)
+    assert [event for event, _ in events] == [
+        'product_created', 'batch_created', 'quantity_changed', 'batch_updated',
+        'product_updated', 'batch_deleted', 'product_deleted']
+    data = [data for _, data in events]
+    assert data[0] == {'id': product['id'], 'name': 'Live', 'code': product['code'], 'version': data[0]['version']}
+    assert data[2]['quantity'] == 5 and data[2]['delta'] == 4 and data[2]['source'] == 'scan'
+    assert data[3]['batch_number'] == '5000000002' and data[3]['quantity'] == 5
+    assert data[6]['batch_ids'] == []
+    versions = [d['version'] for d in data]
+    assert versions == sorted(versions) and len(set(versions)) == 7
+    response.close()
+    assert app_db.get_event_broker().status()['subscribers'] == 0
+
+
+def test_bulk_import_publishes_one_event_per_chunk(events_client):
+    app_db, client = events_client
+    product = client.post('/api/products', json={'name': 'Bulk', 'batch_number': '5000000001'}).get_json()
+    response, stream, _ = open_stream(client)
+
+    body = ''.join(f'5{i:09d}\n' for i in range(2, 12))
+    report = client.post(f'/api/batches/bulk?product_id={product["id"]}', data=body,
+                         content_type='text/csv').get_json()
+    assert report['inserted'] == 10
+    event, data = read_events(stream, 1)[0]
+    assert event == 'batches_imported' and data['count'] == 10 and data['version']
+    response.close()
+
+
+def test_event_stream_refuses_past_the_subscriber_limit(events_client, monkeypatch):
+    app_db, client = events_client
+    monkeypatch.setattr(app_db.get_event_broker(), 'max_subscribers', 1)
+    response, _, _ = open_stream(client)
+
+    refused = client.get('/api/events')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '30'
+    response.close()
+    assert client.get('/api/events', buffered=False).status_code == 200
+
+
+def test_write_behind_flush_publishes_resulting_quantities(events_client, monkeypatch):
+    app_db, client = events_client
+    monkeypatch.setattr(app_db, 'STOCK_WRITE_BEHIND', True)
+    product = client.post('/api/products', json={'name': 'Buffered', 'batch_number': '5000000001'}).get_json()
+    response, stream, _ = open_stream(client)
+
+    for _ in range(3):
+        client.post(f'/api/batches/{product["batch_id"]}/stock', json={'delta': 1, 'source': 'scan'})
+    app_db.close_stock_buffer()
+
+    changes = []
+    while not changes or changes[-1]['quantity'] < 4:  # the scans may span several flushes
+        changes.extend(data for _, data in read_events(stream, 1))
+    assert changes[-1]['quantity'] == 4 and {c['source'] for c in changes} == {'write_behind'}
+    response.close()
+
+
+def test_other_workers_writes_arrive_as_entity_events(events_client, monkeypatch):
+    app_db, client = events_client
+    monkeypatch.setattr(app_db.get_event_broker(), 'poll_interval', 0.01)
+    response, stream, _ = open_stream(client)
+    wait_for(lambda: app_db.get_event_broker().stats['polls'] >= 1)
+    mine = client.post('/api/products', json={'name': 'Mine', 'batch_number': '5000000001'}).get_json()
+    assert [event for event, _ in read_events(stream, 2)] == ['product_created', 'batch_created']
+
+    # Writes whose events went to another worker's subscribers, seen by one poll
+    broker = app_db.get_event_broker()
+    poll, broker._poll = broker._poll, lambda: None
+    monkeypatch.setattr(app_db, 'publish_event', lambda *args: None)
+    client.post(f'/api/batches/{mine["batch_id"]}/stock', json={'delta': 4, 'source': 'scan'})
+    other = client.post('/api/products', json={'name': 'Other', 'batch_number': '5000000002'}).get_json()
+    client.put(f'/api/products/{mine["id"]}', json={'name': 'Mine 2'})
+    client.delete(f'/api/batches/{mine["batch_id"]}')
+    broker._poll = poll
+
+    events = [(event, {k: v for k, v in data.items() if k != 'version'}) for event, data in read_events(stream, 4)]
+    assert events == [
+        ('product_changed', {'id': other['id'], 'name': 'Other', 'code': other['code']}),
+        ('product_changed', {'id': mine['id'], 'name': 'Mine 2', 'code': mine['code']}),
+        ('batch_changed', {'id': other['batch_id'], 'product_id': other['id'], 'batch_number': '5000000002',
+                           'quantity': 1}),
+        ('batch_deleted', {'id': mine['batch_id']})]
+    response.close()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+測試近似畫面快取（dHash 與漢明距離查詢）
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+import recognition
+from caches import NearDuplicateCache
+from test_recognize import text_frame
+
+
+def test_lookup_matches_brute_force_hamming_search():
+    rng = random.Random(7)
+    cache = NearDuplicateCache(max_entries=500, max_distance=4)
+    stored = [rng.getrandbits(64) for _ in range(300)]
+    for value in stored:
+        cache.put('ctx', value, value)
+
+    for _ in range(300):
+        query = rng.choice(stored)
+        for bit in rng.sample(range(64), rng.randint(0, 6)):
+            query ^= 1 << bit
+        expected = min(((q ^ query).bit_count(), q) for q in stored)
+        hit = cache.get('ctx', query)
+        if expected[0] <= 4:
+            assert hit is not None and hit[1] == expected[0]
+        else:
+            assert hit is None
+
+
+def test_context_must_match_and_lru_evicts():
+    cache = NearDuplicateCache(max_entries=2, max_distance=2)
+    cache.put('a', 0b1111, 'first')
+    assert cache.get('b', 0b1111) is None
+
+    cache.put('a', 0xFFFF << 20, 'second')
+    assert cache.get('a', 0b1110) == ('first', 1)  # refreshes 'first'
+    cache.put('a', 0xFFFF << 44, 'third')
+
+    assert cache.get('a', 0xFFFF << 20) is None
+    assert cache.get('a', 0b1111) == ('first', 0)
+    assert cache.status()['evictions'] == 1
+
+
+def test_entries_expire_and_confirm_rejects_a_candidate():
+    now = [0.0]
+    cache = NearDuplicateCache(max_entries=10, max_distance=2, ttl=5, clock=lambda: now[0])
+    cache.put('a', 0b1111, 'first')
+    assert cache.get('a', 0b1111, confirm=lambda value: value == 'other') is None
+    assert cache.get('a', 0b1111) == ('first', 0)
+
+    now[0] = 6.0
+    assert cache.get('a', 0b1111) is None
+    assert cache.status()['expired'] == 1 and cache.status()['rejected'] == 1 and cache.status()['size'] == 0
+
+
+def label_frame(digits, width=640, height=480):
+    """Same label layout every time; only the 'printed' digits (3x5 cell glyphs) change"""
+    frame = text_frame(width, height)
+    glyphs = np.random.default_rng(3).integers(0, 2, (10, 5, 3)).astype(bool)
+    for i, digit in enumerate(digits):
+        cells = np.kron(glyphs[int(digit)], np.ones((6, 6), dtype=bool))
+        x = 200 + i * 24
+        frame[300:330, x:x + 18, :3][cells] = 30
+    return frame
+
+
+def test_dhash_tolerates_sensor_noise():
+    frame = text_frame(640, 480)
+    noisy = np.clip(frame.astype(np.int16) + np.random.default_rng(1).integers(-3, 4, frame.shape),
+                    0, 255).astype(np.uint8)
+    shifted = np.roll(frame, 200, axis=1)
+
+    assert (recognition.dhash(frame) ^ recognition.dhash(noisy)).bit_count() <= 4
+    assert (recognition.dhash(frame) ^ recognition.dhash(shifted)).bit_count() > 4
+
+
+@pytest.fixture
+def counting_recognizer(monkeypatch):
+    calls = []
+    monkeypatch.setattr(recognition, 'RECOGNIZER', 'test_recognize:stand_in_recognizer')
+    monkeypatch.setattr(recognition, 'RECOGNIZE_WORKERS', 0)
+    original = recognition.recognize
+    monkeypatch.setattr(recognition, 'recognize', lambda image: calls.append(1) or original(image))
+    return calls
+
+
+def test_repeated_frames_skip_recognition(client, counting_recognizer):
+    frame = text_frame()
+    noisy = frame.copy()
+    noisy[0, 0, :3] += 5
+
+    def post(pixels):
+        return client.post('/api/recognize?width=120&height=40', data=pixels.tobytes(),
+                           content_type='application/octet-stream').get_json()
+
+    first, second, third = post(frame), post(frame), post(noisy)
+
+    assert len(counting_recognizer) == 1
+    assert first['cached'] is False and second['cached'] is True and third['cached'] is True
+    assert second['batch_number'] == first['batch_number']
+    assert 'recognize_ms' not in second['timings']
+    assert client.get('/api/cache_stats').get_json()['frame_recognition']['hits'] >= 1
+
+
+def post_frame(client, pixels, session=None, width=120, height=40):
+    headers = {'X-Scanner-Session': session} if session else {}
+    return client.post(f'/api/recognize?width={width}&height={height}', data=pixels.tobytes(),
+                       content_type='application/octet-stream', headers=headers).get_json()
+
+
+def test_next_label_with_different_digits_is_recognized_again(client, counting_recognizer):
+    first, second = label_frame('5123456789'), label_frame('5123456780')
+    # Whole-frame hashes cannot tell the two labels apart...
+    assert (recognition.dhash(first) ^ recognition.dhash(second)).bit_count() <= recognition.FRAME_CACHE_MAX_DISTANCE
+
+    # ...so the binarized image decides
+    assert post_frame(client, first, width=640, height=480)['cached'] is False
+    assert post_frame(client, second, width=640, height=480)['cached'] is False
+    assert post_frame(client, second, width=640, height=480)['cached'] is True
+    assert len(counting_recognizer) == 2
+
+
+def test_cached_results_are_kept_per_scanner(client, counting_recognizer):
+    frame = text_frame()
+    assert post_frame(client, frame, session='a')['cached'] is False
+    assert post_frame(client, frame, session='b')['cached'] is False
+    assert post_frame(client, frame, session='a')['cached'] is True
+    assert len(counting_recognizer) == 2
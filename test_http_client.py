@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+測試對外 HTTP 用戶端（連線重用、主機並行上限、逾時與斷路器）
+"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+from conftest import send_body
+from http_client import CircuitBreaker, HostUnavailable, OutboundClient
+
+
+@pytest.fixture
+def outbound():
+    client = OutboundClient(host_concurrency=2, host_wait=0.2, connect_timeout=1, read_timeout=1,
+                            breaker_threshold=3, breaker_cooldown=60)
+    yield client
+    client.close()
+
+
+def test_keep_alive_reuses_one_connection(stub_server, outbound):
+    stub_server.routes['/ok'] = lambda h: send_body(h, 'ok')
+
+    for _ in range(5):
+        assert outbound.get(stub_server.url('/ok')).text == 'ok'
+
+    assert stub_server.hits['/ok'] == 5
+    assert stub_server.connections == 1
+
+
+def test_per_host_limit_rejects_excess_requests(stub_server, outbound):
+    release = threading.Event()
+    stub_server.routes['/slow'] = lambda h: (release.wait(5), send_body(h, 'done'))
+
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(outbound.get(stub_server.url('/slow')).text))
+               for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.1)
+
+    with pytest.raises(HostUnavailable, match='too many concurrent requests'):
+        outbound.get(stub_server.url('/slow'))
+
+    release.set()
+    for worker in workers:
+        worker.join()
+    assert results == ['done', 'done']
+    assert outbound.status()['rejected_busy'] == 1
+
+
+def test_streamed_response_holds_slot_until_closed(stub_server, outbound):
+    stub_server.routes['/ok'] = lambda h: send_body(h, 'ok')
+
+    first = outbound.get(stub_server.url('/ok'), stream=True)
+    second = outbound.get(stub_server.url('/ok'), stream=True)
+    assert outbound.status()['hosts'][first.url.split('/')[2]]['in_flight'] == 2
+    with pytest.raises(HostUnavailable):
+        outbound.get(stub_server.url('/ok'), stream=True)
+
+    first.close()
+    outbound.get(stub_server.url('/ok'), stream=True).close()
+    second.close()
+
+
+def test_read_timeout_is_separate(stub_server, outbound):
+    stub_server.routes['/hang'] = lambda h: (time.sleep(1.5), send_body(h, 'late'))
+
+    started = time.perf_counter()
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        outbound.get(stub_server.url('/hang'), timeout=0.3)
+    assert time.perf_counter() - started < 1
+
+
+def test_breaker_opens_after_consecutive_failures(stub_server, outbound):
+    stub_server.routes['/broken'] = lambda h: send_body(h, 'boom', status=502)
+
+    for _ in range(3):
+        assert outbound.get(stub_server.url('/broken')).status_code == 502
+    with pytest.raises(HostUnavailable, match='circuit open'):
+        outbound.get(stub_server.url('/broken'))
+
+    assert stub_server.hits['/broken'] == 3
+    host = outbound.status()['hosts'][stub_server.url('').split('/')[2]]
+    assert host['state'] == 'open'
+
+
+def test_breaker_half_open_trial():
+    now = [0.0]
+    breaker = CircuitBreaker(threshold=2, cooldown=10, clock=lambda: now[0])
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow() == 10
+
+    now[0] = 10
+    assert breaker.allow() == 0  # the trial request
+    assert breaker.allow() > 0   # everyone else waits for it
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    now[0] = 20
+    assert breaker.allow() == 0
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow() == 0
+
+
+def test_endpoints_return_503_while_breaker_open(client, app_db, stub_server, monkeypatch):
+    monkeypatch.setattr(app_db, '_http_client',
+                        OutboundClient(breaker_threshold=1, breaker_cooldown=60))
+    stub_server.routes['/broken'] = lambda h: send_body(h, 'boom', status=500)
+    url = stub_server.url('/broken')
+
+    assert client.get('/api/fetch_url', query_string={'url': url}).status_code == 400
+    response = client.get('/api/extract_batch_from_url', query_string={'url': url})
+
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) > 0
+    assert stub_server.hits['/broken'] == 1
+    assert client.get('/api/http_client_stats').get_json()['rejected_open'] == 1
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+測試資料庫結構遷移與熱門查詢的索引使用（EXPLAIN QUERY PLAN）
+"""
+
+import sqlite3
+
+import pytest
+
+import migrations
+from db_pool import sqlite_connector
+
+
+@pytest.fixture
+def db(tmp_path):
+    conn = sqlite_connector(str(tmp_path / 'schema.db'))()
+    yield conn
+    conn.close()
+
+
+def plan(db, query, params=()):
+    return ' | '.join(row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + query, params))
+
+
+def test_fresh_database_reaches_latest_version(db):
+    assert migrations.migrate(db, 'sqlite') == [m.version for m in migrations.MIGRATIONS]
+    assert migrations.current_version(db, 'sqlite') == migrations.LATEST_VERSION
+    assert migrations.migrate(db, 'sqlite') == []
+    assert migrations.pending(db, 'sqlite') == []
+
+
+def test_target_version_and_resume(db):
+    assert migrations.migrate(db, 'sqlite', target=2) == [1, 2]
+    assert [m.version for m in migrations.pending(db, 'sqlite')] == [3, 4, 5, 6, 7, 8, 9]
+    assert migrations.migrate(db, 'sqlite') == [3, 4, 5, 6, 7, 8, 9]
+
+
+def test_failed_migration_rolls_back(db, monkeypatch):
+    def broken(conn, engine):
+        conn.execute('CREATE TABLE half_done (id INTEGER)')
+        raise RuntimeError('boom')
+
+    bad = migrations.Migration(99, 'broken', sqlite=(broken,), postgresql=())
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + (bad,))
+    with pytest.raises(RuntimeError):
+        migrations.migrate(db, 'sqlite', target=99)
+
+    assert migrations.current_version(db, 'sqlite') == migrations.LATEST_VERSION
+    assert db.execute("SELECT 1 FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+
+
+def test_legacy_database_is_upgraded(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    legacy = sqlite3.connect(path)
+    legacy.executescript('''
+        CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                               code TEXT UNIQUE NOT NULL);
+        CREATE TABLE batches (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL,
+                              batch_number TEXT UNIQUE NOT NULL, unique_code TEXT,
+                              quantity INTEGER DEFAULT 1,
+                              FOREIGN KEY (product_id) REFERENCES products (id));
+        INSERT INTO products (name, code) VALUES ('iPhone', 'A'), ('iPad', 'B');
+        INSERT INTO batches (product_id, batch_number, unique_code, quantity)
+        VALUES (1, '5000000001', 'x', 4), (2, '5000000002', 'y', 1), (9, '5000000009', 'z', 1);
+    ''')
+    legacy.close()
+
+    db = sqlite_connector(path)()
+    # Batch 3 belongs to a missing product: stop instead of deleting its stock
+    with pytest.raises(migrations.MigrationError, match='missing products: 3;'):
+        migrations.migrate(db, 'sqlite')
+    assert migrations.current_version(db, 'sqlite') == 4
+    assert db.execute('SELECT COUNT(*) FROM batches').fetchone()[0] == 3
+
+    db.execute('UPDATE batches SET product_id = 2 WHERE id = 3')
+    db.commit()
+    migrations.migrate(db, 'sqlite')
+
+    columns = [row[1] for row in db.execute('PRAGMA table_info(batches)')]
+    assert columns == ['id', 'product_id', 'batch_number', 'quantity']
+    assert [tuple(r) for r in db.execute('SELECT id, batch_number, quantity FROM batches ORDER BY id')] == [
+        (1, '5000000001', 4), (2, '5000000002', 1), (3, '5000000009', 1)]
+    assert db.execute('SELECT next_value FROM product_code_counter').fetchone()[0] == 3
+    assert db.execute('SELECT version FROM catalog_version').fetchone()[0] == 0
+
+    db.execute('DELETE FROM products WHERE id = 1')
+    assert db.execute('SELECT COUNT(*) FROM batches WHERE product_id = 1').fetchone()[0] == 0
+    db.close()
+
+
+def test_hot_queries_use_indexes(db):
+    migrations.migrate(db, 'sqlite')
+
+    listing = plan(db, '''
+        SELECT p.id, p.name, p.code, b.id, b.batch_number, b.quantity
+        FROM products p LEFT JOIN batches b ON p.id = b.product_id
+        ORDER BY p.name, b.batch_number''')
+    assert 'idx_batches_product_id' in listing
+
+    assert 'idx_batches_product_id' in plan(db, 'DELETE FROM batches WHERE product_id = ?', (1,))
+    assert 'sqlite_autoindex_batches_1' in plan(db, '''
+        SELECT p.id, p.name FROM products p JOIN batches b ON p.id = b.product_id
+        WHERE b.batch_number = ?''', ('5000000001',))
+    assert 'idx_products_name_lower' in plan(db, 'SELECT id FROM products WHERE LOWER(name) = ?', ('x',))
+    assert 'idx_products_name_lower' in plan(
+        db, 'SELECT id FROM products WHERE LOWER(name) >= ? AND LOWER(name) < ?', ('ip', 'iq'))
+
+
+def test_app_delete_product_cascades(client, app_db):
+    with app_db.app.app_context():
+        product = app_db.add_product('Cascade')
+        app_db.add_batch_to_product(product['id'], '5000000001')
+        db = app_db.get_db()
+        db.execute('DELETE FROM products WHERE id = ?', (product['id'],))
+        db.commit()
+        assert db.execute('SELECT COUNT(*) FROM batches').fetchone()[0] == 0
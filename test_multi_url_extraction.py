@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+測試多網址並行批次號提取（POST /api/extract_batch_from_urls）
+"""
+
+import json
+import time
+
+from conftest import send_body
+
+
+def read_lines(response):
+    return [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+
+
+def add_batch(app_db, batch_number):
+    with app_db.app.app_context():
+        product = app_db.add_product('URL Test')
+        app_db.add_batch_to_product(product['id'], batch_number, 3)
+
+
+def test_fetches_concurrently_and_resolves_products(client, app_db, stub_server):
+    add_batch(app_db, '5000000001')
+    for i in range(1, 7):
+        stub_server.routes[f'/p{i}'] = (
+            lambda h, i=i: (time.sleep(0.3), send_body(h, f'<p>批次號 500000000{i}</p>')))
+
+    urls = [stub_server.url(f'/p{i}') for i in range(1, 7)]
+    started = time.perf_counter()
+    response = client.post('/api/extract_batch_from_urls', json={'urls': urls})
+    lines = read_lines(response)
+    elapsed = time.perf_counter() - started
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert elapsed < 6 * 0.3
+    results, summary = lines[:-1], lines[-1]
+    assert sorted(r['indexes'][0] for r in results) == list(range(6))
+    assert all(r['type'] == 'result' and r['batch_found'] for r in results)
+
+    assert summary['type'] == 'summary'
+    assert summary['batch_found'] == 6
+    assert summary['products']['5000000001']['found'] is True
+    assert summary['products']['5000000001']['quantity'] == 3
+    assert summary['products']['5000000002'] == {'found': False, 'batch_number': '5000000002'}
+
+
+def test_results_stream_in_completion_order(client, stub_server):
+    stub_server.routes['/slow'] = lambda h: (time.sleep(0.5), send_body(h, '5111111111'))
+    stub_server.routes['/fast'] = lambda h: send_body(h, '5222222222')
+
+    lines = read_lines(client.post('/api/extract_batch_from_urls', json={
+        'urls': [stub_server.url('/slow'), stub_server.url('/fast')]}))
+
+    assert [line.get('batch_number') for line in lines[:2]] == ['5222222222', '5111111111']
+
+
+def test_duplicate_urls_are_fetched_once(client, stub_server):
+    stub_server.routes['/same'] = lambda h: send_body(h, '5333333333')
+    url = stub_server.url('/same')
+
+    lines = read_lines(client.post('/api/extract_batch_from_urls', json={'urls': [url, url, ' ' + url]}))
+
+    assert stub_server.hits['/same'] == 1
+    assert lines[0]['indexes'] == [0, 1, 2]
+    assert lines[-1]['urls'] == 3 and lines[-1]['unique_urls'] == 1
+
+
+def test_bad_urls_and_upstream_errors_are_reported_per_url(client, stub_server):
+    lines = read_lines(client.post('/api/extract_batch_from_urls', json={
+        'urls': ['not a url', stub_server.url('/missing')]}))
+
+    errors = {line['url']: line for line in lines[:-1]}
+    assert errors['not a url']['status'] == 400
+    assert errors[stub_server.url('/missing')]['error'].startswith('HTTP 404')
+    assert lines[-1]['errors'] == 2 and lines[-1]['products'] == {}
+
+
+def test_rejects_missing_or_oversized_url_list(client, app_db, monkeypatch):
+    assert client.post('/api/extract_batch_from_urls', json={}).status_code == 400
+    monkeypatch.setattr(app_db, 'URL_BATCH_MAX_URLS', 2)
+    response = client.post('/api/extract_batch_from_urls', json={'urls': ['http://a/'] * 3})
+    assert response.status_code == 400
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+測試產品代碼分配（雙射 26 進位、計數器、並行建立）
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from migrations import migrate
+from product_codes import allocate_code, decode_code, encode_code
+
+
+@pytest.mark.parametrize('number, code', [
+    (1, 'A'), (26, 'Z'), (27, 'AA'), (52, 'AZ'), (53, 'BA'), (702, 'ZZ'), (703, 'AAA'),
+])
+def test_bijective_base26(number, code):
+    assert encode_code(number) == code
+    assert decode_code(code) == number
+
+
+def test_round_trip_and_invalid_codes():
+    assert all(decode_code(encode_code(n)) == n for n in range(1, 20000))
+    assert decode_code('a1') is None and decode_code('') is None
+    with pytest.raises(ValueError):
+        encode_code(0)
+
+
+def test_counter_starts_after_existing_codes():
+    db = sqlite3.connect(':memory:')
+    db.execute('CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, code TEXT UNIQUE)')
+    db.executemany('INSERT INTO products (name, code) VALUES (?, ?)',
+                   [('a', 'A'), ('b', 'C'), ('legacy', '[')])
+    db.commit()
+    migrate(db, 'sqlite')
+
+    assert [allocate_code(db, 'sqlite') for _ in range(3)] == ['D', 'E', 'F']
+
+
+def test_add_product_goes_past_z(app_db):
+    with app_db.app.app_context():
+        codes = [app_db.add_product(f'Product {i}')['code'] for i in range(28)]
+    assert codes[:3] == ['A', 'B', 'C']
+    assert codes[25:] == ['Z', 'AA', 'AB']
+
+
+def test_failed_insert_returns_its_code(app_db):
+    with app_db.app.app_context():
+        app_db.add_product('Same')
+        with pytest.raises(ValueError, match='name already exists'):
+            app_db.add_product('Same')
+        assert app_db.add_product('Other')['code'] == 'B'
+
+
+def test_concurrent_creation_gets_unique_codes(app_db):
+    codes, errors = [], []
+
+    def creator(worker):
+        with app_db.app.app_context():
+            for i in range(20):
+                try:
+                    codes.append(app_db.add_product(f'Worker {worker} #{i}')['code'])
+                except Exception as e:  # pragma: no cover - reported below
+                    errors.append(e)
+
+    threads = [threading.Thread(target=creator, args=(w,)) for w in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(codes, key=decode_code) == [encode_code(n) for n in range(1, 81)]
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+測試 /api/products 伺服器端篩選與游標分頁
+"""
+
+
+def seed(app_db):
+    with app_db.app.app_context():
+        apple = app_db.add_product('Apple Juice')
+        banana = app_db.add_product('Banana 100%')
+        app_db.add_product('Cherry')  # no batches
+        for number in ('5000000003', '5000000001', '5000000002'):
+            app_db.add_batch_to_product(apple['id'], number)
+        app_db.add_batch_to_product(banana['id'], '5111111111')
+
+
+def collect_pages(client, query):
+    rows, cursor, pages = [], None, 0
+    while True:
+        url = f'/api/products?{query}' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(url).get_json()
+        rows.extend(page['items'])
+        pages += 1
+        cursor = page['next_cursor']
+        if not cursor:
+            return rows, pages
+
+
+def test_bare_request_keeps_flat_list(client, app_db):
+    seed(app_db)
+    data = client.get('/api/products').get_json()
+    assert isinstance(data, list)
+    assert len(data) == 5
+
+
+def test_keyset_pages_cover_everything_once_in_stable_order(client, app_db):
+    seed(app_db)
+    rows, pages = collect_pages(client, 'limit=2')
+
+    assert pages == 3
+    assert [(r['name'], r['batch_number']) for r in rows] == [
+        ('Apple Juice', '5000000001'),
+        ('Apple Juice', '5000000002'),
+        ('Apple Juice', '5000000003'),
+        ('Banana 100%', '5111111111'),
+        ('Cherry', None),
+    ]
+
+
+def test_filters_are_applied_server_side(client, app_db):
+    seed(app_db)
+
+    rows = client.get('/api/products?name=juice').get_json()['items']
+    assert {r['name'] for r in rows} == {'Apple Juice'}
+
+    # LIKE wildcards in the filter are matched literally
+    rows = client.get('/api/products?name=0%25').get_json()['items']
+    assert [r['name'] for r in rows] == ['Banana 100%']
+
+    rows = client.get('/api/products?batch=500000000').get_json()['items']
+    assert [r['batch_number'] for r in rows] == ['5000000001', '5000000002', '5000000003']
+
+    rows = client.get('/api/products?code=b').get_json()['items']
+    assert [r['name'] for r in rows] == ['Banana 100%']
+
+    rows = client.get('/api/products?show_empty=without_batches').get_json()['items']
+    assert [r['name'] for r in rows] == ['Cherry']
+
+    rows = client.get('/api/products?show_empty=with_batches').get_json()['items']
+    assert 'Cherry' not in {r['name'] for r in rows}
+
+
+def test_page_size_is_capped(client, app_db, monkeypatch):
+    seed(app_db)
+    monkeypatch.setattr(app_db, 'PRODUCTS_MAX_PAGE_SIZE', 2)
+    page = client.get('/api/products?limit=1000').get_json()
+    assert page['limit'] == 2
+    assert len(page['items']) == 2
+
+
+def test_bad_parameters_are_rejected(client, app_db):
+    assert client.get('/api/products?cursor=not-a-cursor').status_code == 400
+    assert client.get('/api/products?show_empty=maybe').status_code == 400
+
+
+def test_grouped_shape_lists_each_product_once(client, app_db):
+    seed(app_db)
+    data = client.get('/api/products?shape=grouped').get_json()
+
+    assert [p['name'] for p in data] == ['Apple Juice', 'Banana 100%', 'Cherry']
+    assert [b['batch_number'] for b in data[0]['batches']] == ['5000000001', '5000000002', '5000000003']
+    assert data[0]['batches'][0] == {'id': 2, 'batch_number': '5000000001', 'quantity': 1}
+    assert data[2]['batches'] == []
+
+
+def test_grouped_shape_with_paging(client, app_db):
+    seed(app_db)
+    first = client.get('/api/products?shape=grouped&limit=2').get_json()
+    assert [(p['name'], len(p['batches'])) for p in first['items']] == [('Apple Juice', 2)]
+
+    second = client.get(f"/api/products?shape=grouped&limit=2&cursor={first['next_cursor']}").get_json()
+    assert [(p['name'], len(p['batches'])) for p in second['items']] == [('Apple Juice', 1), ('Banana 100%', 1)]
+
+    assert client.get('/api/products?shape=nested').status_code == 400
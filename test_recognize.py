@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+測試伺服器端影像識別（前處理與 POST /api/recognize，以替代識別器取代 OCR）
+"""
+
+import io
+
+import numpy as np
+import pytest
+
+import recognition
+
+
+def stand_in_recognizer(image):
+    """Reads 'ink' as a batch number so the pipeline can run without an OCR engine"""
+    assert image.dtype == np.uint8 and set(np.unique(image)) <= {0, 255}
+    ink = int((image == 0).sum())
+    return f'LOT NO.\n5{ink:09d}\n' if ink else 'no text'
+
+
+def slow_recognizer(image):
+    import time
+    time.sleep(5)
+    return ''
+
+
+def text_frame(width=120, height=40):
+    """Light RGBA frame with a dark bar as the 'text' and a brightness gradient"""
+    gradient = np.linspace(150, 230, width, dtype=np.float32)[None, :].repeat(height, axis=0)
+    gray = gradient.copy()
+    gray[15:25, 20:60] = 30
+    rgba = np.zeros((height, width, 4), dtype=np.uint8)
+    rgba[..., :3] = gray.astype(np.uint8)[..., None]
+    rgba[..., 3] = 255
+    return rgba
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    monkeypatch.setattr(recognition, 'RECOGNIZER', 'test_recognize:stand_in_recognizer')
+    monkeypatch.setattr(recognition, 'RECOGNIZE_WORKERS', 0)
+
+
+def test_preprocess_binarizes_despite_uneven_lighting():
+    image = recognition.preprocess(text_frame())
+
+    assert image.shape == (40, 120)
+    assert (image[15:25, 20:60] == 0).all()
+    assert (image[:10] == 255).all()  # the gradient alone is not ink
+
+
+def test_decode_raw_frames_and_roi():
+    frame = recognition.decode_frame(text_frame().tobytes(), 'application/octet-stream', 120, 40)
+    assert frame.shape == (40, 120, 4)
+    gray = recognition.decode_frame(bytes(120 * 40), 'application/octet-stream', 120, 40)
+    assert gray.shape == (40, 120)
+
+    with pytest.raises(recognition.FrameError):
+        recognition.decode_frame(b'123', 'application/octet-stream', 120, 40)
+    with pytest.raises(recognition.UnsupportedFrameType):
+        recognition.decode_frame(b'', 'image/gif')
+
+    cropped = recognition.preprocess(frame, recognition.parse_roi('20,15,40,10'))
+    assert cropped.shape == (10, 40)
+
+
+def test_endpoint_recognizes_and_looks_up_product(client, app_db, stand_in):
+    ink = 10 * 40
+    with app_db.app.app_context():
+        product = app_db.add_product('Scanned')
+        app_db.add_batch_to_product(product['id'], f'5{ink:09d}')
+
+    response = client.post('/api/recognize?width=120&height=40', data=text_frame().tobytes(),
+                           content_type='application/octet-stream')
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert data['batch_number'] == f'5{ink:09d}'
+    assert data['product_info']['found'] is True
+    assert data['product_info']['name'] == 'Scanned'
+    assert set(data['timings']) == {'decode_ms', 'hash_ms', 'preprocess_ms', 'recognize_ms'}
+    assert data['cached'] is False
+
+
+def test_recognizer_runs_in_process_pool(monkeypatch):
+    monkeypatch.setattr(recognition, 'RECOGNIZER', 'test_recognize:stand_in_recognizer')
+    try:
+        text = recognition.recognize(recognition.preprocess(text_frame()), workers=1)
+    finally:
+        recognition.shutdown_pool()
+    assert text.splitlines()[1] == '5000000400'
+
+
+def test_endpoint_errors(client, monkeypatch, stand_in):
+    assert client.post('/api/recognize', data=b'x', content_type='application/octet-stream').status_code == 400
+    assert client.post('/api/recognize', data=b'x', content_type='text/plain').status_code == 415
+
+    monkeypatch.setattr(recognition, 'RECOGNIZER', 'no_such_module:recognize')
+    response = client.post('/api/recognize?width=120&height=40', data=text_frame().tobytes(),
+                           content_type='application/octet-stream')
+    assert response.status_code == 503
+
+    # Chunked upload without Content-Length: the limit is enforced while reading
+    monkeypatch.setattr(recognition, 'RECOGNIZE_MAX_BYTES', 1000)
+    response = client.post('/api/recognize?width=120&height=40', input_stream=io.BytesIO(text_frame().tobytes()),
+                           content_type='application/octet-stream', headers={'Transfer-Encoding': 'chunked'},
+                           environ_overrides={'wsgi.input_terminated': True})
+    assert response.status_code == 413
+
+
+def test_recognition_timeout(client, monkeypatch):
+    monkeypatch.setattr(recognition, 'RECOGNIZER', 'test_recognize:slow_recognizer')
+    monkeypatch.setattr(recognition, 'RECOGNIZE_WORKERS', 1)
+    monkeypatch.setattr(recognition, 'RECOGNIZE_TIMEOUT', 0.5)
+    try:
+        response = client.post('/api/recognize?width=120&height=40', data=text_frame().tobytes(),
+                               content_type='application/octet-stream')
+    finally:
+        recognition.shutdown_pool()
+    assert response.status_code == 504
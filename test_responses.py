@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+測試回應層（orjson 序列化與標準庫相容、Accept-Encoding 協商、壓縮門檻、串流壓縮、ETag）
+"""
+
+import datetime
+import decimal
+import gzip
+import json
+import zlib
+
+import pytest
+from werkzeug.http import parse_accept_header
+
+import responses
+
+
+def accept(header):
+    return parse_accept_header(header)
+
+
+def test_dumps_matches_stdlib_and_falls_back():
+    obj = {'name': '產品', 'n': [1, 2.5, None, True], 3: 'int key'}
+    assert json.loads(responses.dumps(obj)) == json.loads(json.dumps(obj))
+    assert json.loads(responses.dumps({'big': 2 ** 70})) == {'big': 2 ** 70}
+
+
+def test_jsonify_keeps_flask_conversions(app_db):
+    with app_db.app.test_request_context():
+        body = app_db.jsonify({'b': datetime.datetime(2024, 1, 2, 3, 4, 5), 'a': decimal.Decimal('1.5'),
+                               'c': '批次'}).get_data()
+    assert body.startswith(b'{"a":"1.5","b":"Tue, 02 Jan 2024 03:04:05 GMT"')
+    assert '批次'.encode('utf-8') in body and body.endswith(b'\n')
+
+
+def test_negotiation_follows_q_values_then_server_order():
+    assert responses.negotiate(accept('gzip, deflate')) == 'gzip'
+    assert responses.negotiate(accept('identity')) is None
+    assert responses.negotiate(accept('gzip;q=0, deflate')) is None
+    assert responses.negotiate(accept('*')) == [e for e in responses.ENCODINGS if e in responses.ENCODERS][0]
+    assert responses.negotiate(accept('br;q=0.5, gzip;q=0.8, zstd;q=0.1'), ['br', 'gzip']) == 'gzip'
+    assert responses.negotiate(accept('unknown')) is None
+
+
+def seed(client, count=50):
+    product = client.post('/api/products', json={'name': 'Compress', 'batch_number': '5000000000'}).get_json()
+    body = ''.join(f'5{i:09d}\n' for i in range(1, count))
+    client.post(f'/api/batches/bulk?product_id={product["id"]}', data=body, content_type='text/csv')
+
+
+def test_large_json_is_gzipped_and_small_is_not(client):
+    seed(client)
+    plain = client.get('/api/products')
+    assert 'Content-Encoding' not in plain.headers
+
+    compressed = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert int(compressed.headers['Content-Length']) == len(compressed.get_data())
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+
+    small = client.get('/api/search_product/5000000001', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+
+def test_weak_etag_still_yields_304(client):
+    seed(client)
+    first = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['ETag'].startswith('W/')
+    second = client.get('/api/products', headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+
+
+def test_bodies_past_the_threshold_are_compressed_as_a_stream(client, monkeypatch):
+    seed(client, 500)
+    monkeypatch.setattr(responses, 'STREAM_THRESHOLD', 4096)
+    monkeypatch.setattr(responses, 'CHUNK_SIZE', 1024)
+    plain = client.get('/api/products').get_data()
+
+    response = client.get('/api/products', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(b''.join(response.iter_encoded())) == plain
+
+
+def test_streamed_responses_are_flushed_per_chunk(client):
+    seed(client, 1200)
+    numbers = '\n'.join(f'5{i:09d}' for i in range(1200))
+    response = client.post('/api/search_products', data=numbers, content_type='text/plain',
+                           headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+    decompressor = zlib.decompressobj(31)
+    chunks = [decompressor.decompress(chunk) for chunk in response.iter_encoded()]
+    assert chunks[0]  # each block is decodable on arrival
+    data = json.loads(b''.join(chunks) + decompressor.flush())
+    assert data['found'] == 1200
+
+
+def test_event_stream_is_never_compressed(client, app_db):
+    response = client.get('/api/events', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert 'Content-Encoding' not in response.headers
+    response.close()
+    app_db.reset_event_broker()
+
+
+@pytest.mark.parametrize('encoding, module', [('br', 'brotli'), ('zstd', 'zstandard')])
+def test_optional_encoders_round_trip(encoding, module):
+    if encoding not in responses.ENCODERS:
+        pytest.skip(f'{module} not installed')
+    data = b'{"batch_number":"5000000001"}' * 1000
+    body = responses.compress_body(data, encoding)
+    streamed = b''.join(responses.compress_chunks([data[:10000], data[10000:]], encoding, flush_each=True))
+    if encoding == 'br':
+        decompress = responses.brotli.decompress
+    else:
+        decompress = lambda b: responses.zstandard.ZstdDecompressor().decompressobj().decompress(b)
+    assert decompress(body) == data and decompress(streamed) == data
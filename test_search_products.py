@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+測試批次號批量查詢 API（POST /api/search_products）
+"""
+
+
+def add_batches(app_db, numbers):
+    with app_db.app.app_context():
+        product = app_db.add_product('Search Test')
+        for number in numbers:
+            app_db.add_batch_to_product(product['id'], number, 2)
+        return product
+
+
+def test_results_follow_input_order(client, app_db):
+    add_batches(app_db, ['5000000001', '5000000003'])
+
+    data = client.post('/api/search_products', json={
+        'batch_numbers': ['5000000003', '5999999999', '5000000001', '5000000003', 'bad', 42]
+    }).get_json()
+
+    assert [r['batch_number'] for r in data['results']] == [
+        '5000000003', '5999999999', '5000000001', '5000000003', 'bad', 42]
+    assert [r['found'] for r in data['results']] == [True, False, True, True, False, False]
+    assert data['results'][0]['product_code'] == 'A'
+    assert data['results'][0]['quantity'] == 2
+    assert (data['total'], data['found'], data['not_found'], data['truncated']) == (6, 3, 3, False)
+
+
+def test_one_query_per_chunk(client, app_db, monkeypatch):
+    add_batches(app_db, [f'50000000{i:02d}' for i in range(10)])
+    monkeypatch.setattr(app_db, 'LOOKUP_CHUNK_SIZE', 4)
+    calls = []
+    original = app_db.query_products_by_batches
+    monkeypatch.setattr(app_db, 'query_products_by_batches',
+                        lambda numbers: calls.append(len(numbers)) or original(numbers))
+
+    numbers = [f'50000000{i:02d}' for i in range(20)]
+    data = client.post('/api/search_products', json={'batch_numbers': numbers}).get_json()
+
+    assert calls == [4, 4, 4, 4, 4]
+    assert [r['batch_number'] for r in data['results']] == numbers
+    assert data['found'] == 10
+
+
+def test_plain_text_body_is_streamed(client, app_db):
+    add_batches(app_db, ['5000000001'])
+
+    data = client.post('/api/search_products', data='5000000001\n\n5000000002\r\n',
+                       content_type='text/plain').get_json()
+
+    assert [(r['batch_number'], r['found']) for r in data['results']] == [
+        ('5000000001', True), ('5000000002', False)]
+
+
+def test_limits(client, app_db, monkeypatch):
+    monkeypatch.setattr(app_db, 'SEARCH_MAX_BATCHES', 2)
+    assert client.post('/api/search_products', json={'batch_numbers': ['5000000001'] * 3}).status_code == 400
+    assert client.post('/api/search_products', json={'batch_numbers': '5000000001'}).status_code == 400
+
+    data = client.post('/api/search_products', data='5000000001\n5000000002\n5000000003\n',
+                       content_type='text/plain').get_json()
+    assert data['total'] == 2 and data['truncated'] is True
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+測試正式環境進入點（應用程式工廠、fork 後的 worker 初始化與一般請求併發上限）
+"""
+
+import os
+import threading
+
+import pytest
+
+
+def test_create_app_migrates_and_releases_connections(app_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_db, 'SQLITE_PATH', str(tmp_path / 'factory.db'))
+    app_db.reset_db_pool()
+
+    assert app_db.create_app() is app_db.app
+    assert app_db._db_pool is None  # nothing for forked workers to inherit
+    response = app_db.app.test_client().get('/api/products')
+    assert response.status_code == 200
+
+
+def test_init_worker_drops_inherited_state_without_closing_it(app_db, monkeypatch):
+    class InheritedPool:
+        disposed = False
+
+        def dispose(self):
+            self.disposed = True
+
+    inherited = InheritedPool()
+    monkeypatch.setattr(app_db, '_db_pool', inherited)
+    app_db.init_worker()
+
+    assert app_db._db_pool is None and not inherited.disposed
+    assert app_db.app.test_client().get('/api/search_product/5000000000').status_code == 200
+
+
+def test_requests_past_the_concurrency_limit_get_503(app_db, monkeypatch):
+    monkeypatch.setattr(app_db, '_request_slots', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(app_db, 'REQUEST_QUEUE_TIMEOUT', 0.05)
+    client = app_db.app.test_client()
+    assert client.get('/api/products').status_code == 200
+    assert client.get('/api/products').status_code == 200  # the slot is returned after each request
+
+    app_db._request_slots.acquire()  # another request still running
+    busy = client.get('/api/products')
+    assert busy.status_code == 503 and busy.headers['Retry-After'] == '1'
+    stream = client.get('/api/events', buffered=False)  # streams do not take a slot
+    assert stream.status_code == 200
+    stream.close()
+    app_db.reset_event_broker()
+
+    app_db._request_slots.release()
+    assert client.get('/api/products').status_code == 200
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_worker_gets_its_own_connections(app_db):
+    with app_db.app.app_context():
+        app_db.add_product('Fork Test')
+
+    pid = os.fork()
+    if pid == 0:  # child: behave like a gunicorn worker after post_fork
+        status = 1
+        try:
+            app_db.init_worker()
+            with app_db.app.app_context():
+                app_db.add_product('From Worker')
+            status = 0
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    names = {p['name'] for p in app_db.app.test_client().get('/api/products').get_json()}
+    assert names == {'Fork Test', 'From Worker'}
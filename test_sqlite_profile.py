@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+測試 SQLite 正式環境設定（PRAGMA、WAL checkpoint 與並行讀寫）
+"""
+
+import threading
+
+import pytest
+
+from db_pool import CheckpointPolicy, ConnectionPool, apply_sqlite_pragmas, sqlite_connector
+
+
+def pragma(conn, name):
+    return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+
+def test_profile_is_applied_on_connect(tmp_path):
+    conn = sqlite_connector(str(tmp_path / 'profile.db'))()
+
+    assert pragma(conn, 'journal_mode') == 'wal'
+    assert pragma(conn, 'synchronous') == 1  # NORMAL
+    assert pragma(conn, 'busy_timeout') == 5000
+    assert pragma(conn, 'foreign_keys') == 1
+    assert pragma(conn, 'cache_size') == -20000
+
+
+def test_custom_profile_and_bad_values(tmp_path):
+    conn = sqlite_connector(str(tmp_path / 'custom.db'),
+                            pragmas=(('journal_mode', 'DELETE'), ('busy_timeout', 250)))()
+    assert pragma(conn, 'journal_mode') == 'delete'
+    assert pragma(conn, 'busy_timeout') == 250
+
+    with pytest.raises(ValueError):
+        apply_sqlite_pragmas(conn, (('cache_size', '1; DROP TABLE x'),))
+
+
+def test_checkpoint_policy_runs_at_most_once_per_interval(tmp_path):
+    path = str(tmp_path / 'wal.db')
+    now = [0.0]
+    policy = CheckpointPolicy(path, interval=10, truncate_bytes=1 << 30, clock=lambda: now[0])
+    pool = ConnectionPool(sqlite_connector(path), max_size=1, on_checkin=policy)
+
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE t (x)')
+    conn.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(100)])
+    conn.commit()
+    pool.release(conn)
+    assert policy.status()['checkpoints'] == 0
+
+    now[0] = 11
+    pool.release(pool.acquire())
+    pool.release(pool.acquire())
+    assert policy.status()['checkpoints'] == 1
+
+    policy.truncate_bytes = 0
+    now[0] = 30
+    pool.release(pool.acquire())
+    assert policy.status()['truncates'] == 1
+    assert (tmp_path / 'wal.db-wal').stat().st_size == 0
+
+
+def test_readers_are_not_blocked_by_writers(tmp_path):
+    path = str(tmp_path / 'concurrent.db')
+    setup = sqlite_connector(path)()
+    setup.execute('CREATE TABLE stock (id INTEGER PRIMARY KEY, quantity INTEGER)')
+    setup.execute('INSERT INTO stock VALUES (1, 0)')
+    setup.commit()
+
+    # A writer holding its transaction open must not stop readers under WAL
+    writer = sqlite_connector(path)()
+    writer.execute('UPDATE stock SET quantity = quantity + 1')
+    assert setup.execute('SELECT quantity FROM stock').fetchone()[0] == 0
+    writer.commit()
+
+    errors = []
+
+    def scanner():
+        conn = sqlite_connector(path)()
+        try:
+            for _ in range(50):
+                conn.execute('UPDATE stock SET quantity = quantity + 1 WHERE id = 1')
+                conn.commit()
+                conn.execute('SELECT quantity FROM stock WHERE id = 1').fetchone()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=scanner) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert setup.execute('SELECT quantity FROM stock').fetchone()[0] == 201
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+測試原子入庫 API
+"""
+
+import threading
+
+
+def test_stock_in_returns_new_quantity(client, make_batch):
+    batch_id = make_batch()
+
+    response = client.post(f'/api/batches/{batch_id}/stock', json={'delta': 1})
+    assert response.status_code == 200
+    assert response.get_json()['quantity'] == 2
+
+    # delta defaults to +1
+    response = client.post(f'/api/batches/{batch_id}/stock')
+    assert response.get_json()['quantity'] == 3
+
+
+def test_stock_by_batch_number_with_signed_delta(client, make_batch):
+    make_batch(quantity=5)
+
+    response = client.post('/api/batches/by_number/5123456789/stock', json={'delta': -3})
+    assert response.status_code == 200
+    assert response.get_json() == {'batch_id': 1, 'batch_number': '5123456789', 'quantity': 2}
+
+
+def test_stock_cannot_go_negative(client, make_batch):
+    batch_id = make_batch()
+
+    response = client.post(f'/api/batches/{batch_id}/stock', json={'delta': -2})
+    assert response.status_code == 409
+
+    response = client.get('/api/search_product/5123456789')
+    assert response.get_json()['quantity'] == 1
+
+
+def test_stock_rejects_unknown_batch_and_bad_delta(client, make_batch):
+    batch_id = make_batch()
+
+    assert client.post('/api/batches/999/stock', json={'delta': 1}).status_code == 404
+    assert client.post('/api/batches/by_number/5000000000/stock').status_code == 404
+    assert client.post(f'/api/batches/{batch_id}/stock', json={'delta': '1'}).status_code == 400
+    assert client.post(f'/api/batches/{batch_id}/stock', json={'delta': True}).status_code == 400
+    assert client.post(f'/api/batches/{batch_id}/stock', json={'delta': 0}).status_code == 400
+    assert client.post(f'/api/batches/{batch_id}/stock', json=[1]).status_code == 400
+    assert client.get(f'/api/batches/{batch_id}/movements').get_json()['movements'][0]['delta'] == 1
+
+
+def test_concurrent_scanners_do_not_lose_updates(client, app_db, make_batch):
+    batch_id = make_batch(quantity=0)
+    scanners, scans_each = 8, 25
+    failures = []
+
+    def scanner():
+        scanner_client = app_db.app.test_client()
+        for _ in range(scans_each):
+            response = scanner_client.post(f'/api/batches/{batch_id}/stock', json={'delta': 1})
+            if response.status_code != 200:
+                failures.append(response.status_code)
+
+    threads = [threading.Thread(target=scanner) for _ in range(scanners)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert failures == []
+    response = client.get('/api/search_product/5123456789')
+    assert response.get_json()['quantity'] == scanners * scans_each
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+測試庫存異動帳（異動記錄、歷史查詢與分頁、壓縮成快照）
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import stock_ledger
+
+
+def history(client, batch_id, **params):
+    response = client.get(f'/api/batches/{batch_id}/movements', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_every_change_is_recorded_with_running_balance(client, make_batch):
+    batch_id = make_batch(quantity=2)
+    client.post(f'/api/batches/{batch_id}/stock', json={'delta': 3, 'source': 'scan'})
+    client.post(f'/api/batches/{batch_id}/stock', json={'delta': -1})
+    client.put(f'/api/batches/{batch_id}', json={'quantity': 10})
+    client.post(f'/api/batches/{batch_id}/stock', json={'delta': -20})  # refused: no movement
+
+    data = history(client, batch_id)
+    assert data['quantity'] == 10
+    assert [(m['delta'], m['source'], m['balance_after']) for m in data['movements']] == [
+        (6, 'edit', 10), (-1, 'api', 4), (3, 'scan', 5), (2, 'create', 2)]
+    assert data['next_before'] is None
+
+
+def test_paging_and_time_window(client, make_batch):
+    batch_id = make_batch(quantity=0)
+    for _ in range(5):
+        client.post(f'/api/batches/{batch_id}/stock', json={'delta': 1})
+
+    first = history(client, batch_id, limit=2)
+    second = history(client, batch_id, limit=2, before=first['next_before'])
+    third = history(client, batch_id, limit=2, before=second['next_before'])
+    balances = [m['balance_after'] for page in (first, second, third) for m in page['movements']]
+    assert balances == [5, 4, 3, 2, 1]
+    assert third['next_before'] is None
+
+    now = datetime.now(timezone.utc)
+    assert len(history(client, batch_id, since=(now - timedelta(minutes=1)).isoformat())['movements']) == 5
+    assert history(client, batch_id, until=(now - timedelta(minutes=1)).isoformat())['movements'] == []
+    assert client.get(f'/api/batches/{batch_id}/movements?since=yesterday').status_code == 400
+    assert client.get('/api/batches/999/movements').status_code == 404
+
+
+def test_source_is_validated(client, make_batch):
+    batch_id = make_batch(quantity=2)
+    assert client.post(f'/api/batches/{batch_id}/stock', json={'source': 5}).status_code == 400
+    assert client.post(f'/api/batches/{batch_id}/stock', json={'source': 'x' * 65}).status_code == 400
+
+
+def test_compaction_keeps_quantity_and_balances(client, app_db, make_batch):
+    batch_id = make_batch()
+    for delta in (2, -1, 4):
+        client.post(f'/api/batches/{batch_id}/stock', json={'delta': delta})
+
+    with app_db.app.app_context():
+        db = app_db.get_db()
+        cutoff = datetime.now(timezone.utc) + timedelta(seconds=1)
+        assert stock_ledger.compact_movements(db, 'sqlite', cutoff) == (1, 3)
+        assert stock_ledger.compact_movements(db, 'sqlite', cutoff) == (0, 0)
+    client.post(f'/api/batches/{batch_id}/stock', json={'delta': 1})
+
+    data = history(client, batch_id)
+    assert [(m['delta'], m['source'], m['events'], m['balance_after']) for m in data['movements']] == [
+        (1, 'api', 1, 7), (6, 'snapshot', 4, 6)]
+
+
+def test_movements_are_deleted_with_their_batch(client, app_db, make_batch):
+    batch_id = make_batch(quantity=2)
+    client.post(f'/api/batches/{batch_id}/stock', json={'delta': 1})
+    client.delete(f'/api/batches/{batch_id}')
+
+    with app_db.app.app_context():
+        assert app_db.get_db().execute('SELECT COUNT(*) FROM stock_movements').fetchone()[0] == 0
+
+
+def test_history_queries_page_by_the_batch_id_index(app_db):
+    def plan(query, params):
+        return ' | '.join(row[3] for row in app_db.get_db().execute('EXPLAIN QUERY PLAN ' + query, params))
+
+    with app_db.app.app_context():
+        page = plan('SELECT id, delta, source, events, created_at FROM stock_movements '
+                    'WHERE batch_id = ? AND created_at >= ? AND id < ? ORDER BY id DESC LIMIT ?',
+                    (1, '2026-01-01', 1000, 101))
+        balance = plan('SELECT COALESCE(SUM(delta), 0) FROM stock_movements WHERE batch_id = ? AND id > ?', (1, 900))
+    # Each page is a range read in index order, never a sort of the whole history
+    assert 'idx_stock_movements_batch_id' in page and 'TEMP B-TREE' not in page, page
+    assert 'COVERING INDEX idx_stock_movements_batch_id' in balance, balance
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+測試串流網址批次號提取
+"""
+
+import requests
+
+from conftest import send_body
+from url_extraction import StreamingBatchExtractor, fetch_batch_from_url
+
+
+def test_extractor_finds_batch_split_across_chunks():
+    extractor = StreamingBatchExtractor()
+    assert extractor.feed('<html><body><p>批次號: 51234') is None
+    assert extractor.feed('56789</p><p>5999999999</p>') == '5123456789'
+
+
+def test_extractor_strips_markup_and_entities():
+    extractor = StreamingBatchExtractor()
+    extractor.feed('<div class="5000000000x">LOT&nbsp;5-ABC-DEF-GHI</div>')
+    assert extractor.close() == '5ABCDEFGHI'
+
+
+def test_extractor_searches_very_long_lines_in_windows():
+    extractor = StreamingBatchExtractor()
+    filler = 'X' * 40000
+    assert extractor.feed(filler) is None
+    assert extractor.feed(filler + ' 5123456789 ' + filler) == '5123456789'
+
+
+def test_long_line_windows_keep_matches_that_straddle_the_cut():
+    filler = 'X ' * 40000
+    for split in range(len(filler) - 16, len(filler) + 96):
+        text = filler + '5123456789 ' + filler
+        extractor = StreamingBatchExtractor(strip_html=False)
+        extractor.feed(text[:split])
+        assert (extractor.feed(text[split:]) or extractor.close()) == '5123456789', split
+
+
+def test_long_line_windows_do_not_match_inside_a_longer_token():
+    filler = 'X ' * 40000
+    for split in range(len(filler) - 16, len(filler) + 96):
+        text = filler + '512345678901234 ' + filler
+        extractor = StreamingBatchExtractor(strip_html=False)
+        extractor.feed(text[:split])
+        assert extractor.feed(text[split:]) is None and extractor.close() is None, split
+
+
+def test_stops_reading_after_first_match(stub_server):
+    pieces = [b'<p>batch 5123456789</p>\n'] + [b'<p>' + b'x' * 4096 + b'</p>\n'] * 50
+    stub_server.routes['/early'] = lambda h: send_body(h, b'', chunks=pieces, delay=0.01)
+
+    result = fetch_batch_from_url(stub_server.url('/early'), requests.get, chunk_size=1024)
+
+    assert result['batch_number'] == '5123456789'
+    assert result['bytes_read'] < result['upstream_content_length'] / 10
+    assert result['time_to_first_match_ms'] is not None
+    assert not result['truncated']
+
+
+def test_byte_cap_truncates(stub_server):
+    stub_server.routes['/big'] = lambda h: send_body(h, '<p>' + 'x' * 100000 + '</p><p>5123456789</p>')
+
+    result = fetch_batch_from_url(stub_server.url('/big'), requests.get, max_bytes=10000, chunk_size=4096)
+
+    assert result['batch_number'] is None
+    assert result['bytes_read'] == 10000
+    assert result['truncated']
+    assert result['time_to_first_match_ms'] is None
+
+
+def test_endpoint_reports_stream_statistics(client, stub_server):
+    stub_server.routes['/page'] = lambda h: send_body(h, '<html><p>產品批次號 5ABC123DEF</p></html>')
+
+    data = client.get('/api/extract_batch_from_url', query_string={'url': stub_server.url('/page')}).get_json()
+
+    assert data['batch_found'] is True
+    assert data['batch_number'] == '5ABC123DEF'
+    assert data['product_info'] == {'found': False, 'batch_number': '5ABC123DEF'}
+    assert data['bytes_read'] == data['upstream_content_length']
+    assert 'time_to_first_match_ms' in data
+
+
+def test_endpoint_reports_upstream_errors(client, stub_server):
+    response = client.get('/api/extract_batch_from_url', query_string={'url': stub_server.url('/missing')})
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('HTTP 404')
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+測試庫存增量延後寫入（合併寫入、失敗重試、延遲上限、讀取合併未寫入增量）
+"""
+
+import threading
+
+import pytest
+
+from write_behind import IncrementBuffer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_increments_are_coalesced_per_key_and_source():
+    flushed = []
+    buffer = IncrementBuffer(flushed.append, max_events=100)
+    for _ in range(3):
+        buffer.add(1, 1, 'scan')
+    buffer.add(1, 2, 'api')
+    buffer.add(2, 1, 'scan')
+
+    assert buffer.pending(1) == 5
+    assert buffer.flush() == 3
+    assert sorted(flushed[0]) == [(1, 'api', 2, 1), (1, 'scan', 3, 3), (2, 'scan', 1, 1)]
+    assert buffer.pending(1) == 0
+    assert buffer.flush() == 0
+
+
+def test_failed_flush_is_retried_and_lag_bound_refuses_new_increments():
+    clock = FakeClock()
+    calls = []
+
+    def failing(items):
+        calls.append(items)
+        raise RuntimeError('database is locked')
+
+    buffer = IncrementBuffer(failing, max_lag=1.0, clock=clock)
+    assert buffer.add(1, 1, 'scan')
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    assert buffer.pending(1) == 1  # put back
+
+    clock.now = 2.0
+    assert buffer.add(1, 1, 'scan') is False
+    assert buffer.status()['refused'] == 1
+    assert buffer.status()['failures'] == 1
+
+
+def test_background_flush_on_event_count_and_close():
+    flushed = []
+    done = threading.Event()
+
+    def flush(items):
+        flushed.append(items)
+        done.set()
+
+    buffer = IncrementBuffer(flush, interval=60, max_events=3)
+    buffer.start()
+    for _ in range(3):
+        buffer.add(7, 1, 'scan')
+    assert done.wait(5)
+
+    buffer.add(7, 4, 'scan')
+    buffer.close()
+    assert [items[0][2] for items in flushed] == [3, 4]
+    assert buffer.add(7, 1, 'scan') is False
+
+
+def test_merged_read_never_double_counts_a_flush_in_progress():
+    stored = {'quantity': 10}
+    release = threading.Event()
+
+    def slow_flush(items):
+        for _, _, delta, _ in items:
+            stored['quantity'] += delta  # committed, but the buffer has not cleared it yet
+        release.wait(5)
+
+    buffer = IncrementBuffer(slow_flush)
+    buffer.add(1, 5, 'scan')
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    while buffer.pending(1) and stored['quantity'] == 10:
+        pass
+
+    result = []
+    reader = threading.Thread(target=lambda: result.append(buffer.merged(1, lambda: stored['quantity'])))
+    reader.start()
+    reader.join(0.2)
+    assert result == []  # waits for the flush to settle
+    release.set()
+    reader.join(5)
+    flusher.join(5)
+    assert result == [15]
+
+
+@pytest.fixture
+def write_behind(app_db, monkeypatch):
+    monkeypatch.setattr(app_db, 'STOCK_WRITE_BEHIND', True)
+    yield app_db
+    app_db.close_stock_buffer()
+
+
+def test_concurrent_scans_are_coalesced_and_reads_stay_exact(write_behind, client, make_batch):
+    batch_id = make_batch(quantity=0)
+    scanners, scans_each = 8, 25
+    seen = []
+
+    def scanner():
+        scanner_client = write_behind.app.test_client()
+        for _ in range(scans_each):
+            data = scanner_client.post(f'/api/batches/{batch_id}/stock',
+                                       json={'delta': 1, 'source': 'scan'}).get_json()
+            seen.append(data['quantity'])
+            seen.append(scanner_client.get('/api/search_product/5123456789').get_json()['quantity'])
+
+    threads = [threading.Thread(target=scanner) for _ in range(scanners)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    total = scanners * scans_each
+    assert max(seen) == total and min(seen) >= 1
+    assert client.get('/api/search_product/5123456789').get_json()['quantity'] == total
+
+    write_behind.close_stock_buffer()
+    with write_behind.app.app_context():
+        db = write_behind.get_db()
+        assert db.execute('SELECT quantity FROM batches WHERE id = ?', (batch_id,)).fetchone()[0] == total
+        rows, events = db.execute("SELECT COUNT(*), SUM(events) FROM stock_movements WHERE source = 'scan'").fetchone()
+    assert events == total and rows < total
+
+
+def test_stock_out_sees_queued_stock_ins(write_behind, client, make_batch):
+    batch_id = make_batch(quantity=0)
+    client.post(f'/api/batches/{batch_id}/stock', json={'delta': 3})
+
+    response = client.post(f'/api/batches/{batch_id}/stock', json={'delta': -2})
+    assert response.status_code == 200
+    assert response.get_json()['quantity'] == 1
+    assert client.post('/api/batches/999/stock', json={'delta': 1}).status_code == 404
+
+
+def test_absolute_quantity_edit_replaces_queued_stock_ins(write_behind, client, make_batch):
+    batch_id = make_batch(quantity=0)
+    for _ in range(3):
+        client.post(f'/api/batches/{batch_id}/stock', json={'delta': 1, 'source': 'scan'})
+
+    assert client.put(f'/api/batches/{batch_id}', json={'quantity': 10}).status_code == 200
+    assert client.get('/api/search_product/5123456789').get_json()['quantity'] == 10
+
+    write_behind.close_stock_buffer()
+    with write_behind.app.app_context():
+        db = write_behind.get_db()
+        assert db.execute('SELECT quantity FROM batches WHERE id = ?', (batch_id,)).fetchone()[0] == 10
+        assert db.execute('SELECT SUM(delta) FROM stock_movements WHERE batch_id = ?', (batch_id,)).fetchone()[0] == 10
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+網址批次號提取：串流下載頁面、逐步去除 HTML 標記，找到批次號即停止讀取
+"""
+
+import codecs
+import os
+import re
+import time
+from html.parser import HTMLParser
+
+from batch_scanner import find_batch_number
+
+MAX_BYTES = int(os.environ.get('URL_FETCH_MAX_BYTES', 2 * 1024 * 1024))
+CHUNK_SIZE = int(os.environ.get('URL_FETCH_CHUNK_SIZE', 16 * 1024))
+PREVIEW_CHARS = 500
+
+# A single "line" longer than this is searched in windows instead of being buffered
+MAX_PENDING_CHARS = 64 * 1024
+# Longest batch-number match (separators included) a window boundary must not split
+WINDOW_OVERLAP = 64
+
+USER_AGENT = 'VAS-Batch-Identifier/1.0'
+
+
+class UpstreamHTTPError(Exception):
+    """The page answered with a non-200 status"""
+
+    def __init__(self, status_code, reason):
+        super().__init__(f'HTTP {status_code}: {reason}')
+        self.status_code = status_code
+        self.reason = reason
+
+
+class _TextCollector(HTMLParser):
+    """Collect text nodes; every tag boundary becomes a line break"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        self.parts.append('\n')
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+    def take(self):
+        text = ''.join(self.parts)
+        self.parts.clear()
+        return text
+
+
+class StreamingBatchExtractor:
+    """Incremental extract_batch_from_text() over a page that arrives in pieces.
+
+    Only complete lines are searched, so a batch number split across two
+    chunks is still found and the first-line-wins rule of the full-text
+    extractor is preserved.
+    """
+
+    def __init__(self, strip_html=True):
+        self._parser = _TextCollector() if strip_html else None
+        self._pending = ''
+        self._skip = 0  # leading context characters of _pending that were already searched
+        self.batch_number = None
+
+    def feed(self, chunk):
+        """Add decoded page text; return the batch number once one is found"""
+        if self.batch_number is not None:
+            return self.batch_number
+        if self._parser is not None:
+            self._parser.feed(chunk)
+            chunk = self._parser.take()
+        self._pending += chunk
+
+        cut = self._pending.rfind('\n')
+        if cut != -1:
+            complete, self._pending = self._pending[:cut], self._pending[cut + 1:]
+            self.batch_number = find_batch_number(complete, start=self._skip)
+            self._skip = 0
+        elif len(self._pending) > MAX_PENDING_CHARS:
+            # Very long line (e.g. minified text): accept only matches followed by
+            # WINDOW_OVERLAP more characters, so a longer token cut at the edge
+            # cannot pass the word-boundary check. The kept text covers every
+            # match not yet decided plus one character of left context.
+            end = len(self._pending) - WINDOW_OVERLAP
+            self.batch_number = find_batch_number(self._pending, start=self._skip, end=end)
+            self._pending = self._pending[end - WINDOW_OVERLAP - 1:]
+            self._skip = 1
+        return self.batch_number
+
+    def close(self):
+        """Flush whatever is still buffered at end of page"""
+        if self.batch_number is None:
+            if self._parser is not None:
+                self._parser.close()
+                self._pending += self._parser.take()
+            self.batch_number = find_batch_number(self._pending, start=self._skip)
+        self._pending = ''
+        self._skip = 0
+        return self.batch_number
+
+
+def _response_encoding(response):
+    """Charset from Content-Type, defaulting to UTF-8 rather than requests' ISO-8859-1"""
+    content_type = response.headers.get('Content-Type', '')
+    match = re.search(r'charset=([\w\-]+)', content_type, re.IGNORECASE)
+    if match:
+        try:
+            codecs.lookup(match.group(1))
+            return match.group(1)
+        except LookupError:
+            pass
+    return 'utf-8'
+
+
+def fetch_batch_from_url(url, get, max_bytes=None, chunk_size=None, timeout=None):
+    """Stream url through the extractor, stopping at the first batch number or max_bytes.
+
+    get is a requests-compatible get(url, **kwargs) callable, normally
+    OutboundClient.get, which fills in its own timeouts when timeout is None.
+    Raises UpstreamHTTPError for non-200 responses and lets request errors
+    propagate.
+    """
+    max_bytes = max_bytes or MAX_BYTES
+    chunk_size = chunk_size or CHUNK_SIZE
+    started = time.perf_counter()
+
+    response = get(url, stream=True, timeout=timeout, headers={'User-Agent': USER_AGENT})
+    try:
+        if response.status_code != 200:
+            raise UpstreamHTTPError(response.status_code, response.reason)
+
+        decoder = codecs.getincrementaldecoder(_response_encoding(response))(errors='replace')
+        extractor = StreamingBatchExtractor()
+        bytes_read = 0
+        chars_read = 0
+        preview = ''
+        truncated = False
+        first_match_ms = None
+
+        for chunk in response.iter_content(chunk_size):
+            chunk = chunk[:max_bytes - bytes_read]
+            bytes_read += len(chunk)
+            text = decoder.decode(chunk)
+            chars_read += len(text)
+            if len(preview) < PREVIEW_CHARS:
+                preview += text[:PREVIEW_CHARS - len(preview)]
+
+            if extractor.feed(text):
+                first_match_ms = (time.perf_counter() - started) * 1000
+                break
+            if bytes_read >= max_bytes:
+                truncated = True
+                break
+        else:
+            extractor.feed(decoder.decode(b'', final=True))
+
+        if first_match_ms is None and extractor.close():
+            first_match_ms = (time.perf_counter() - started) * 1000
+
+        content_length = response.headers.get('Content-Length')
+        return {
+            'batch_number': extractor.batch_number,
+            'bytes_read': bytes_read,
+            'content_length': chars_read,
+            'upstream_content_length': int(content_length) if content_length and content_length.isdigit() else None,
+            'truncated': truncated,
+            'content_preview': preview + '...' if chars_read > len(preview) else preview,
+            'time_to_first_match_ms': round(first_match_ms, 2) if first_match_ms is not None else None,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+        }
+    finally:
+        # Stop reading: an unfinished body is dropped instead of downloaded
+        response.close()
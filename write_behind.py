@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+庫存增量的延後寫入：同一批次的多次入庫先在記憶體中累加，
+每隔一段時間或累積一定筆數後在一個交易中寫入資料庫
+
+讀取端以 merged() 把尚未寫入的增量加到資料庫數量上，且不會因為
+剛好碰上寫入而重複計算或漏算。
+"""
+
+import os
+import threading
+import time
+
+WRITE_BEHIND = os.environ.get('STOCK_WRITE_BEHIND', '0').lower() in ('1', 'true', 'yes', 'on')
+FLUSH_INTERVAL = float(os.environ.get('STOCK_WRITE_BEHIND_INTERVAL_MS', 50)) / 1000
+FLUSH_MAX_EVENTS = int(os.environ.get('STOCK_WRITE_BEHIND_MAX_EVENTS', 500))
+MAX_LAG = float(os.environ.get('STOCK_WRITE_BEHIND_MAX_LAG_MS', 1000)) / 1000
+
+
+class IncrementBuffer:
+    """Per-key increments accumulated in memory and flushed in batches.
+
+    flush(items) is called from a background thread with a list of
+    (key, source, delta, events) and must apply them in one transaction.
+    A failed flush puts its items back, so they are retried on the next
+    tick. Increments wait in memory at most about `interval`; if they have
+    waited longer than `max_lag` (the database keeps failing) add() refuses
+    new ones so callers fall back to writing directly.
+    """
+
+    def __init__(self, flush, interval=FLUSH_INTERVAL, max_events=FLUSH_MAX_EVENTS, max_lag=MAX_LAG,
+                 clock=time.monotonic):
+        self._flush = flush
+        self.interval = interval
+        self.max_events = max_events
+        self.max_lag = max_lag
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._pending = {}  # (key, source) -> [delta, events]
+        self._pending_by_key = {}  # key -> delta
+        self._inflight = {}  # key -> delta being committed
+        self._epochs = {}  # key -> number of completed flushes that touched it
+        self._events = 0
+        self._oldest = None
+        self._closed = False
+        self._thread = None
+        self.stats = {'events': 0, 'flushes': 0, 'rows': 0, 'failures': 0, 'refused': 0}
+
+    def start(self):
+        with self._cond:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    def add(self, key, delta, source):
+        """Queue an increment; returns False when the buffer is over its lag bound"""
+        with self._cond:
+            if self._closed or (self._oldest is not None and self._clock() - self._oldest > self.max_lag):
+                self.stats['refused'] += 1
+                return False
+            entry = self._pending.setdefault((key, source), [0, 0])
+            entry[0] += delta
+            entry[1] += 1
+            self._pending_by_key[key] = self._pending_by_key.get(key, 0) + delta
+            self._events += 1
+            self.stats['events'] += 1
+            if self._oldest is None:
+                self._oldest = self._clock()
+            if self._events >= self.max_events:
+                self._cond.notify_all()
+        return True
+
+    def pending(self, key):
+        with self._cond:
+            return self._pending_by_key.get(key, 0) + self._inflight.get(key, 0)
+
+    def merged(self, key, read):
+        """read() + the increments of key not yet in the database.
+
+        read() returns the stored value (from the database or a cache that
+        writers invalidate). If a flush of this key overlaps the read, the
+        stored value may or may not include it, so wait and read again.
+        """
+        while True:
+            with self._cond:
+                while key in self._inflight:
+                    self._cond.wait()
+                epoch = self._epochs.get(key, 0)
+            value = read()
+            with self._cond:
+                if key not in self._inflight and self._epochs.get(key, 0) == epoch:
+                    return value + self._pending_by_key.get(key, 0)
+
+    def flush(self):
+        """Write everything queued so far; returns the number of rows flushed"""
+        with self._flush_lock:
+            with self._cond:
+                if not self._pending:
+                    return 0
+                items = [(key, source, delta, events) for (key, source), (delta, events) in self._pending.items()]
+                self._inflight = self._pending_by_key
+                self._pending, self._pending_by_key = {}, {}
+                self._events = 0
+                oldest, self._oldest = self._oldest, None
+            try:
+                self._flush(items)
+            except Exception:
+                with self._cond:
+                    # Put the increments back in front of anything queued meanwhile
+                    for key, source, delta, events in items:
+                        entry = self._pending.setdefault((key, source), [0, 0])
+                        entry[0] += delta
+                        entry[1] += events
+                    for key, delta in self._inflight.items():
+                        self._pending_by_key[key] = self._pending_by_key.get(key, 0) + delta
+                    self._events += sum(events for *_, events in items)
+                    self._oldest = oldest
+                    self._inflight = {}
+                    self.stats['failures'] += 1
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                for key in self._inflight:
+                    self._epochs[key] = self._epochs.get(key, 0) + 1
+                self._inflight = {}
+                self.stats['flushes'] += 1
+                self.stats['rows'] += len(items)
+                self._cond.notify_all()
+            return len(items)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                deadline = self._clock() + self.interval
+                while not self._closed and self._events < self.max_events:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write-behind flush failed (will retry): {e}")
+
+    def close(self):
+        """Stop the flusher and write what is left"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def status(self):
+        with self._cond:
+            lag = self._clock() - self._oldest if self._oldest is not None else 0.0
+            return dict(self.stats, pending_events=self._events, lag_ms=round(lag * 1000, 1))